@@ -0,0 +1,164 @@
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from cli.aws_tools import COMMANDS
+
+SRC_DIRPATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+# packages a command should only import once its arguments are parsed
+HEAVY_PACKAGES = ['boto3', 'botocore', 's3transfer', 'dateutil', 'urllib3']
+# --help run the way the aws-tools script runs it
+_HELP_RUNNER = "import sys; from cli.aws_tools import main; sys.argv = ['aws-tools', *sys.argv[1:]]; main()"
+_COMPARED = ['import_ms', 'help_ms']
+
+
+def run_python(argv: List[str], env: Dict[str, str]) -> Tuple[float, str]:
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, *argv], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed_s = time.perf_counter() - started
+    if 0 != completed.returncode:
+        raise RuntimeError(f"{' '.join(argv)} exited {completed.returncode}: {completed.stderr[-2000:]}")
+    return elapsed_s, completed.stderr
+
+
+# -X importtime lines are "import time: <self us> | <cumulative us> | <indented name>"
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    imports = []
+    for line in stderr.splitlines():
+        if not(line.startswith('import time:')) or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def measure_command(command: str, module: str, env: Dict[str, str], repeat: int, top_count: int) -> dict:
+    import_ms: List[float] = []
+    help_ms: List[float] = []
+    imports: List[Tuple[str, int, int]] = []
+    for _ in range(repeat):
+        _, stderr = run_python(['-X', 'importtime', '-c', f"import {module}"], env)
+        imports = parse_importtime(stderr)
+        import_ms.append(next(cumulative_us for name, _, cumulative_us in imports if name == module) / 1000)
+        elapsed_s, _ = run_python(['-c', _HELP_RUNNER, command, '--help'], env)
+        help_ms.append(elapsed_s * 1000)
+    top_level = set([name.split('.')[0] for name, _, _ in imports])
+    return {
+        'module': module,
+        'import_ms': round(statistics.median(import_ms), 1),
+        'help_ms': round(statistics.median(help_ms), 1),
+        'module_count': len(imports),
+        'heavy_imports': [package for package in HEAVY_PACKAGES if package in top_level],
+        'slowest_imports': [[name, round(self_us / 1000, 1)] for name, self_us, _ in sorted(imports, key=lambda i: i[1], reverse=True)[:top_count]]
+    }
+
+
+def run_benchmarks(args: argparse.Namespace) -> dict:
+    env = {**os.environ, 'PYTHONPATH': SRC_DIRPATH, 'PYTHONDONTWRITEBYTECODE': '1'}
+    interpreter_ms = statistics.median([run_python(['-c', 'pass'], env)[0] * 1000 for _ in range(args.repeat)])
+    print(f"{'interpreter':28} {'':>10} {interpreter_ms:8.1f}ms --help floor", file=sys.stderr)
+    results = {}
+    for command in args.commands:
+        module, _ = COMMANDS[command]
+        result = measure_command(command, module, env, args.repeat, args.top_count)
+        results[command] = result
+        heavy = f"  imports {','.join(result['heavy_imports'])}" if 0 < len(result['heavy_imports']) else ''
+        print(f"{command:28} {result['import_ms']:8.1f}ms {result['help_ms']:8.1f}ms --help{heavy}", file=sys.stderr)
+    return {'interpreter_ms': round(interpreter_ms, 1), 'commands': results}
+
+
+def git_commit() -> str|None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SRC_DIRPATH, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# per command, the change of report against baseline; lower is better for every metric, and a rise
+# beyond threshold_pct is a regression, as is a command newly importing a heavy package
+def compare_reports(report: dict, baseline: dict, threshold_pct: float) -> dict:
+    comparison = {}
+    for command, result in report['results']['commands'].items():
+        baseline_result = baseline['results']['commands'].get(command)
+        if baseline_result is None:
+            continue
+        changes = {}
+        for metric in _COMPARED:
+            value, baseline_value = result.get(metric), baseline_result.get(metric)
+            if value is None or not(baseline_value):
+                continue
+            change_pct = round((value - baseline_value) * 100 / baseline_value, 1)
+            changes[metric] = {'baseline': baseline_value, 'value': value, 'change_pct': change_pct, 'regression': threshold_pct < change_pct}
+        added = [package for package in result['heavy_imports'] if package not in baseline_result['heavy_imports']]
+        if 0 < len(added):
+            changes['heavy_imports'] = {'baseline': baseline_result['heavy_imports'], 'value': result['heavy_imports'], 'regression': True}
+        comparison[command] = changes
+    return comparison
+
+
+def print_comparison(comparison: dict) -> None:
+    for command, changes in comparison.items():
+        for metric, change in changes.items():
+            flag = '  REGRESSION' if change['regression'] else ''
+            if 'change_pct' in change:
+                print(f"{command:28} {metric:10} {change['baseline']:>10} -> {change['value']:>10} {change['change_pct']:+7.1f}%{flag}", file=sys.stderr)
+            else:
+                print(f"{command:28} {metric:10} {','.join(change['baseline'])} -> {','.join(change['value'])}{flag}", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the startup cost of each cli command: the -X importtime cumulative import of its module, and the wall time of its --help")
+    parser.add_argument("--commands", nargs="+", choices=COMMANDS.keys(), default=list(COMMANDS.keys()), help="commands to measure")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each measurement; the median is reported")
+    parser.add_argument("--top-count", type=int, default=10, help="number of the slowest imports, by their own time, reported per command")
+    parser.add_argument("--output-filepath", type=str, default='import-time-report.json', help="where the json report is written")
+    parser.add_argument("--baseline-filepath", type=str, help="earlier report to compare against")
+    parser.add_argument("--compare-filepath", type=str, help="compare this existing report against --baseline-filepath instead of running")
+    parser.add_argument("--regression-threshold", type=float, default=20, help="percent rise reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", default=False, help="exit 1 when any regression is found")
+    args = parser.parse_args()
+    if args.compare_filepath is not None and args.baseline_filepath is None:
+        parser.error("--compare-filepath requires --baseline-filepath")
+
+    if args.compare_filepath is not None:
+        with open(args.compare_filepath, 'r') as inF:
+            report = json.load(inF)
+    else:
+        report = {
+            'datetime': datetime.now().isoformat(),
+            'args': {name: value for name, value in vars(args).items() if name not in ('baseline_filepath', 'compare_filepath', 'output_filepath', 'fail_on_regression')},
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'git_commit': git_commit()
+            },
+            'results': run_benchmarks(args)
+        }
+    regressions = 0
+    if args.baseline_filepath is not None:
+        with open(args.baseline_filepath, 'r') as inF:
+            baseline = json.load(inF)
+        report['comparison'] = compare_reports(report, baseline, args.regression_threshold)
+        print_comparison(report['comparison'])
+        regressions = sum([1 for changes in report['comparison'].values() for change in changes.values() if change['regression']])
+    if args.compare_filepath is None:
+        with open(args.output_filepath, 'w') as of:
+            json.dump(report, of, indent=4)
+        print(f"report written to {args.output_filepath}", file=sys.stderr)
+    else:
+        print(json.dumps(report['comparison'], indent=4))
+    if args.fail_on_regression and 0 < regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
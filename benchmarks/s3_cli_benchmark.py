@@ -0,0 +1,311 @@
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from cli.arg_functions import byte_count_from_string
+from s3.s3_client import S3Bucket, S3Object
+from s3.s3_object_reader import read_newest_s3_objects
+from s3_stub_server import StubS3, StubS3Server
+from util.json_helpers import JsonResultWriter
+
+SRC_DIRPATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+PROFILE = 'benchmark'
+LIST_BUCKET = 'bench-list'
+TRANSFER_BUCKET = 'bench-transfer'
+UPLOAD_BUCKET = 'bench-upload'
+# each cli command runs in its own interpreter, as its console script would
+_RUNNER = "import importlib, sys; module = sys.argv.pop(1); importlib.import_module(module).main()"
+SCENARIOS = ['list-objects', 'list-objects-sharded', 'json-write', 'json-read', 'bucket-download', 'download-objects', 'bucket-upload', 'upload-stream', 'grep']
+# higher is better for rates, lower for everything else
+_COMPARED = [('rate', True), ('elapsed_s', False), ('peak_rss_bytes', False)]
+
+
+class CliRun:
+    def __init__(self, elapsed_s: float, exit_code: int, peak_rss_bytes: int|None) -> None:
+        self.elapsed_s = elapsed_s
+        self.exit_code = exit_code
+        self.peak_rss_bytes = peak_rss_bytes
+
+
+def run_cli(module: str, argv: List[str], env: Dict[str, str], log_filepath: str) -> CliRun:
+    with open(log_filepath, 'ab') as log, open(os.devnull, 'wb') as devnull:
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-c', _RUNNER, module, *argv], env=env, stdout=devnull, stderr=log)
+        if hasattr(os, 'wait4'):
+            # the rusage of this one child, rather than the largest of every child so far
+            _, status, rusage = os.wait4(process.pid, 0)
+            elapsed_s = time.perf_counter() - started
+            process.returncode = os.waitstatus_to_exitcode(status)
+            peak_rss_bytes = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        else:
+            process.wait()
+            elapsed_s = time.perf_counter() - started
+            peak_rss_bytes = None
+    return CliRun(elapsed_s, process.returncode, peak_rss_bytes)
+
+
+def write_aws_config(dirpath: str) -> str:
+    config_filepath = os.path.join(dirpath, 'config')
+    with open(config_filepath, 'w') as of:
+        of.write(f"[profile {PROFILE}]\nregion = us-east-1\naws_access_key_id = benchmark\naws_secret_access_key = benchmark\ns3 =\n  addressing_style = path\n")
+    return config_filepath
+
+
+def iter_stub_objects(stub: StubS3, bucket: str):
+    stub_bucket = stub.buckets[bucket]
+    s3_bucket = S3Bucket(name=bucket, region=stub_bucket.region, created=datetime.fromtimestamp(stub_bucket.created))
+    for key in stub_bucket.keys:
+        stub_object = stub_bucket.objects[key]
+        yield S3Object(bucket=s3_bucket, full_path=key, modified=int(stub_object.modified), size=len(stub_object.data), etag=stub_object.etag)
+
+
+def write_listing(stub: StubS3, bucket: str, filepath: str, output_format: str) -> None:
+    with JsonResultWriter(filepath, output_format, 's3_objects', {'bucket_name': bucket}) as writer:
+        for s3_object in iter_stub_objects(stub, bucket):
+            writer.add(s3_object)
+        writer.finish()
+
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace, stub: StubS3, endpoint_url: str, workdir: str) -> None:
+        self.__args = args
+        self.__stub = stub
+        self.__workdir = workdir
+        self.__log_filepath = os.path.join(workdir, 'cli.log')
+        self.__env = dict(os.environ)
+        self.__env.update({
+            'AWS_CONFIG_FILE': write_aws_config(workdir),
+            'AWS_SHARED_CREDENTIALS_FILE': os.path.join(workdir, 'credentials'),
+            'AWS_ENDPOINT_URL': endpoint_url,
+            'AWS_EC2_METADATA_DISABLED': 'true',
+            'PYTHONPATH': os.pathsep.join([SRC_DIRPATH] + [path for path in [os.environ.get('PYTHONPATH')] if path]),
+        })
+        self.transfer_byte_count = args.object_count * args.object_size
+        self.__listing_filepath = os.path.join(workdir, 'listing', 'bench-list.json')
+        self.__download_dirpath = os.path.join(workdir, 'download')
+        self.__stream_filepath = os.path.join(workdir, 'stream.bin')
+
+    def __cli(self, module: str, argv: List[str]) -> CliRun:
+        cli_run = run_cli(module, ['--aws-profile-name', PROFILE, '--log-level', 'warning', *argv], self.__env, self.__log_filepath)
+        if cli_run.exit_code != 0:
+            with open(self.__log_filepath, 'r') as inF:
+                print(inF.read()[-4000:], file=sys.stderr)
+            raise RuntimeError(f"{module} exited with {cli_run.exit_code}")
+        return cli_run
+
+    def __in_process(self, work: Callable[[], None]) -> CliRun:
+        started = time.perf_counter()
+        work()
+        elapsed_s = time.perf_counter() - started
+        # tracemalloc slows the work it traces, so the peak python allocations (reported in place
+        # of the process rss) come from a second, untimed run
+        tracemalloc.start()
+        try:
+            work()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return CliRun(elapsed_s, 0, peak_bytes)
+
+    def prepare(self, scenario: str) -> None:
+        if scenario in ('json-read',) and not(os.path.isfile(self.__listing_filepath)):
+            os.makedirs(os.path.dirname(self.__listing_filepath), exist_ok=True)
+            write_listing(self.__stub, LIST_BUCKET, self.__listing_filepath, 'json')
+        if scenario in ('bucket-download', 'download-objects', 'bucket-upload'):
+            shutil.rmtree(self.__download_dirpath, ignore_errors=True)
+            os.makedirs(self.__download_dirpath)
+        if scenario == 'download-objects':
+            write_listing(self.__stub, TRANSFER_BUCKET, os.path.join(self.__download_dirpath, 'transfer.json'), 'json')
+        if scenario == 'bucket-upload':
+            self.__cli('cli.s3.bucket_download', ['--bucket', TRANSFER_BUCKET, '--key-prefix', '', '--output-directory', self.__download_dirpath])
+            self.__stub.create_bucket(UPLOAD_BUCKET)
+        if scenario == 'upload-stream' and not(os.path.isfile(self.__stream_filepath)):
+            with open(self.__stream_filepath, 'wb') as of:
+                block = os.urandom(1024 * 1024)
+                for offset in range(0, self.transfer_byte_count, len(block)):
+                    of.write(block[:min(len(block), self.transfer_byte_count - offset)])
+            self.__stub.create_bucket(UPLOAD_BUCKET)
+
+    def run(self, scenario: str) -> CliRun:
+        args = self.__args
+        if scenario in ('list-objects', 'list-objects-sharded'):
+            return self.__cli('cli.s3.list_objects_like', [
+                '--bucket-name', LIST_BUCKET, '--like-name', '', '--output-format', 'jsonl',
+                '--output-filepath', os.path.join(self.__workdir, f"{scenario}.jsonl"), '--checkpoint-interval', '0',
+                '--list-shards', str(args.list_shards if scenario == 'list-objects-sharded' else 1)
+            ])
+        if scenario == 'json-write':
+            s3_objects = list(iter_stub_objects(self.__stub, LIST_BUCKET))
+            return self.__in_process(lambda: write_listing_objects(s3_objects, os.path.join(self.__workdir, 'json-write.json')))
+        if scenario == 'json-read':
+            return self.__in_process(lambda: read_listing(self.__listing_filepath))
+        if scenario == 'bucket-download':
+            return self.__cli('cli.s3.bucket_download', ['--bucket', TRANSFER_BUCKET, '--key-prefix', '', '--output-directory', self.__download_dirpath, '--max-workers', str(args.max_workers)])
+        if scenario == 'download-objects':
+            return self.__cli('cli.s3.download_objects', ['--input-filepath', os.path.join(self.__download_dirpath, 'transfer.json'), '--max-workers', str(args.max_workers)])
+        if scenario == 'bucket-upload':
+            return self.__cli('cli.s3.bucket_upload', ['--bucket', UPLOAD_BUCKET, '--key-prefix', 'upload/', '--input-directory', self.__download_dirpath, '--max-workers', str(args.max_workers)])
+        if scenario == 'upload-stream':
+            return self.__cli('cli.s3.upload_stream', ['--bucket', UPLOAD_BUCKET, '--key', 'stream.bin', '--input-filepath', self.__stream_filepath, '--max-workers', str(args.max_workers)])
+        if scenario == 'grep':
+            return self.__cli('cli.s3.grep_objects', ['--bucket-name', TRANSFER_BUCKET, '--pattern', 'object', '--max-workers', str(args.max_workers)])
+        raise ValueError(f"unknown scenario {scenario}")
+
+    def rate(self, scenario: str, elapsed_s: float) -> Dict[str, object]:
+        if scenario.startswith('list-objects') or scenario.startswith('json-'):
+            return {'rate': round(self.__args.key_count / elapsed_s, 1), 'rate_unit': 'keys/s'}
+        return {'rate': round(self.transfer_byte_count / (1024 * 1024) / elapsed_s, 2), 'rate_unit': 'MB/s'}
+
+
+def write_listing_objects(s3_objects: List[S3Object], filepath: str) -> None:
+    with JsonResultWriter(filepath, 'json', 's3_objects', {}) as writer:
+        for s3_object in s3_objects:
+            writer.add(s3_object)
+        writer.finish()
+
+
+def read_listing(filepath: str) -> None:
+    with open(filepath, 'r') as inF:
+        read_newest_s3_objects(inF, None)
+
+
+def run_benchmarks(args: argparse.Namespace) -> dict:
+    stub = StubS3(args.latency_ms / 1000)
+    stub.seed(LIST_BUCKET, args.key_count, 64)
+    stub.seed(TRANSFER_BUCKET, args.object_count, args.object_size)
+    results = {}
+    with StubS3Server(stub) as server, tempfile.TemporaryDirectory(prefix='aws-tools-benchmark-') as workdir:
+        benchmark = Benchmark(args, stub, server.endpoint_url, workdir)
+        for scenario in args.scenarios:
+            elapsed = []
+            peak_rss_bytes = None
+            request_counts: Dict[str, int] = {}
+            for _ in range(args.repeat):
+                benchmark.prepare(scenario)
+                counts_before = dict(stub.request_counts)
+                cli_run = benchmark.run(scenario)
+                elapsed.append(cli_run.elapsed_s)
+                if cli_run.peak_rss_bytes is not None:
+                    peak_rss_bytes = max(peak_rss_bytes or 0, cli_run.peak_rss_bytes)
+                request_counts = {operation: count - counts_before.get(operation, 0) for operation, count in stub.request_counts.items() if count != counts_before.get(operation, 0)}
+            elapsed_s = statistics.median(elapsed)
+            results[scenario] = {
+                'elapsed_s': round(elapsed_s, 3),
+                'runs_s': [round(run_s, 3) for run_s in elapsed],
+                **benchmark.rate(scenario, elapsed_s),
+                'peak_rss_bytes': peak_rss_bytes,
+                'requests': request_counts
+            }
+            print(f"{scenario:22} {elapsed_s:8.3f}s {results[scenario]['rate']:>12} {results[scenario]['rate_unit']:6} peak {format_bytes(peak_rss_bytes)}", file=sys.stderr)
+    return results
+
+
+def format_bytes(byte_count: int|None) -> str:
+    if byte_count is None:
+        return '-'
+    return f"{byte_count / (1024 * 1024):.1f}MB"
+
+
+def git_commit() -> str|None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SRC_DIRPATH, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# per scenario and metric, the change of report against baseline. a change beyond threshold_pct in
+# the wrong direction is a regression
+def compare_reports(report: dict, baseline: dict, threshold_pct: float) -> dict:
+    comparison = {}
+    for scenario, result in report['results'].items():
+        baseline_result = baseline['results'].get(scenario)
+        if baseline_result is None:
+            continue
+        changes = {}
+        for metric, higher_is_better in _COMPARED:
+            value, baseline_value = result.get(metric), baseline_result.get(metric)
+            if value is None or not(baseline_value):
+                continue
+            change_pct = round((value - baseline_value) * 100 / baseline_value, 1)
+            changes[metric] = {
+                'baseline': baseline_value,
+                'value': value,
+                'change_pct': change_pct,
+                'regression': threshold_pct < (-change_pct if higher_is_better else change_pct)
+            }
+        comparison[scenario] = changes
+    return comparison
+
+
+def print_comparison(comparison: dict) -> None:
+    for scenario, changes in comparison.items():
+        for metric, change in changes.items():
+            flag = '  REGRESSION' if change['regression'] else ''
+            print(f"{scenario:22} {metric:15} {change['baseline']:>14} -> {change['value']:>14} {change['change_pct']:+7.1f}%{flag}", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time the cli commands against an in-process S3 stand-in and report listing, transfer and json throughput with peak memory")
+    parser.add_argument("--key-count", type=int, default=20000, help="number of keys listed, and written/read as json")
+    parser.add_argument("--object-count", type=int, default=50, help="number of objects downloaded, uploaded and searched")
+    parser.add_argument("--object-size", type=byte_count_from_string, default=byte_count_from_string('2MB'), help="size of each transferred object (ie. 2MB)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay the stand-in adds to every request, to mimic a network round trip")
+    parser.add_argument("--max-workers", type=int, default=10, help="--max-workers given to the transfer cli commands")
+    parser.add_argument("--list-shards", type=int, default=8, help="--list-shards given to the list-objects-sharded scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each scenario; the median is reported")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS, help="scenarios to run")
+    parser.add_argument("--output-filepath", type=str, default='benchmark-report.json', help="where the json report is written")
+    parser.add_argument("--baseline-filepath", type=str, help="earlier report to compare against")
+    parser.add_argument("--compare-filepath", type=str, help="compare this existing report against --baseline-filepath instead of running")
+    parser.add_argument("--regression-threshold", type=float, default=10, help="percent change in the wrong direction reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", default=False, help="exit 1 when any regression is found")
+    args = parser.parse_args()
+    if args.compare_filepath is not None and args.baseline_filepath is None:
+        parser.error("--compare-filepath requires --baseline-filepath")
+
+    if args.compare_filepath is not None:
+        with open(args.compare_filepath, 'r') as inF:
+            report = json.load(inF)
+    else:
+        report = {
+            'datetime': datetime.now().isoformat(),
+            'args': {name: value for name, value in vars(args).items() if name not in ('baseline_filepath', 'compare_filepath', 'output_filepath', 'fail_on_regression')},
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'git_commit': git_commit()
+            },
+            'results': run_benchmarks(args)
+        }
+    regressions = 0
+    if args.baseline_filepath is not None:
+        with open(args.baseline_filepath, 'r') as inF:
+            baseline = json.load(inF)
+        report['comparison'] = compare_reports(report, baseline, args.regression_threshold)
+        print_comparison(report['comparison'])
+        regressions = sum([1 for changes in report['comparison'].values() for change in changes.values() if change['regression']])
+    if args.compare_filepath is None:
+        with open(args.output_filepath, 'w') as of:
+            json.dump(report, of, indent=4)
+        print(f"report written to {args.output_filepath}", file=sys.stderr)
+    else:
+        print(json.dumps(report['comparison'], indent=4))
+    if args.fail_on_regression and 0 < regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
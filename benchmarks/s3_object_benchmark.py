@@ -0,0 +1,117 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Iterator, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+# the boto-free model, so the benchmark runs without boto3
+from s3.s3_model import S3Object
+
+
+# the S3Bucket/S3Object representation prior to slots/interning, kept for comparison
+class LegacyS3Bucket:
+    def __init__(self, name:str, region: str, created: datetime):
+        self.name = name
+        self.region = region
+        self.created = created
+
+    @staticmethod
+    def from_dict(dict_o: dict) -> "LegacyS3Bucket":
+        return LegacyS3Bucket(name=dict_o['name'], region=dict_o['region'], created=datetime.fromisoformat(dict_o['created']))
+
+
+class LegacyS3Object:
+    def __init__(self, bucket: LegacyS3Bucket, full_path: List[str], modified: datetime, size: int):
+        self.bucket = bucket
+        self.full_path = full_path
+        self.modified = modified
+        self.size = size
+    @property
+    def name(self) -> str:
+        return '/'.join(self.full_path)
+    @property
+    def fully_qualified_name(self) -> str:
+        return f"{self.bucket.name}/{self.name}"
+
+    def __lt__(self, other) -> bool:
+        if self.modified.__eq__(other.modified):
+            if self.fully_qualified_name.__eq__(other.fully_qualified_name):
+                return self.size.__lt__(other.size)
+            return self.fully_qualified_name.__lt__(other.fully_qualified_name)
+        return self.modified.__lt__(other.modified)
+
+    @staticmethod
+    def from_dict(dict_o: dict) -> "LegacyS3Object":
+        return LegacyS3Object(bucket=LegacyS3Bucket.from_dict(dict_o['bucket']), full_path=dict_o['full_path'], modified=datetime.fromisoformat(dict_o['modified']), size=dict_o['size'])
+
+
+def iter_object_dicts(count: int, bucket_count: int) -> Iterator[dict]:
+    created = datetime(2020, 1, 1, tzinfo=timezone.utc).isoformat()
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    buckets = [{'name': f"bucket-{i:03d}", 'region': 'us-east-1', 'created': created} for i in range(bucket_count)]
+    for i in range(count):
+        yield {
+            'bucket': buckets[i % bucket_count],
+            'full_path': ['logs', f"{i % 365:03d}", f"app-{i:09d}.log.gz"],
+            'modified': (start + timedelta(seconds=(i * 7919) % 31536000)).isoformat(),
+            'size': i % 100000
+        }
+
+
+def measure(name: str, from_dict: Callable[[dict], object], count: int, bucket_count: int) -> dict:
+    # memory is traced once the objects are built and again once sorted, as sorting may cache a
+    # sort key on each object; times are taken on a second, untraced build and sort
+    gc.collect()
+    tracemalloc.start()
+    objects = [from_dict(dict_o) for dict_o in iter_object_dicts(count, bucket_count)]
+    retained_bytes, _ = tracemalloc.get_traced_memory()
+    objects.sort(reverse=True)
+    sorted_retained_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    gc.collect()
+    started = time.perf_counter()
+    objects = [from_dict(dict_o) for dict_o in iter_object_dicts(count, bucket_count)]
+    build_s = time.perf_counter() - started
+    started = time.perf_counter()
+    objects.sort(reverse=True)
+    sort_s = time.perf_counter() - started
+    del objects
+    gc.collect()
+    return {
+        'representation': name,
+        'count': count,
+        'retained_bytes': retained_bytes,
+        'bytes_per_object': retained_bytes / count,
+        'sorted_retained_bytes': sorted_retained_bytes,
+        'sorted_bytes_per_object': sorted_retained_bytes / count,
+        'build_s': round(build_s, 3),
+        'sort_s': round(sort_s, 3)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare memory and sort time of S3Object representations")
+    parser.add_argument("--count", type=int, default=1000000, help="number of objects to build (ie. 10000000)")
+    parser.add_argument("--bucket-count", type=int, default=10, help="number of distinct buckets the objects belong to")
+    args = parser.parse_args()
+
+    results = [
+        measure('legacy', LegacyS3Object.from_dict, args.count, args.bucket_count),
+        measure('slotted', S3Object.from_dict, args.count, args.bucket_count),
+    ]
+    print(json.dumps({
+        'results': results,
+        'memory_ratio': round(results[0]['retained_bytes'] / results[1]['retained_bytes'], 2),
+        'sorted_memory_ratio': round(results[0]['sorted_retained_bytes'] / results[1]['sorted_retained_bytes'], 2),
+        'sort_speedup': round(results[0]['sort_s'] / results[1]['sort_s'], 2) if 0 < results[1]['sort_s'] else None
+    }, indent=4))
+
+
+if __name__ == '__main__':
+    main()
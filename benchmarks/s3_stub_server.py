@@ -0,0 +1,344 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, quote_plus, unquote, urlsplit
+from xml.sax.saxutils import escape, unescape
+
+ACCOUNT_ID = '123456789012'
+_S3_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _http_date(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+
+class StubObject:
+    __slots__ = ('data', 'etag', 'modified')
+
+    def __init__(self, data: bytes, etag: str|None = None, modified: float|None = None) -> None:
+        self.data = data
+        self.etag = etag if etag is not None else hashlib.md5(data).hexdigest()
+        self.modified = modified if modified is not None else time.time()
+
+
+class StubBucket:
+    def __init__(self, name: str, region: str) -> None:
+        self.name = name
+        self.region = region
+        self.created = time.time()
+        self.keys: List[str] = []
+        self.objects: Dict[str, StubObject] = {}
+
+    def put(self, key: str, stub_object: StubObject) -> None:
+        if key not in self.objects:
+            insort(self.keys, key)
+        self.objects[key] = stub_object
+
+    def delete(self, key: str) -> None:
+        if self.objects.pop(key, None) is not None:
+            del self.keys[bisect_left(self.keys, key)]
+
+
+class StubS3:
+    # the in-memory state behind the server. seeded directly, without going through http
+    def __init__(self, latency_s: float = 0.0) -> None:
+        self.latency_s = latency_s
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, StubBucket] = {}
+        self.uploads: Dict[str, Tuple[str, str, Dict[int, StubObject]]] = {}
+        self.request_counts: Dict[str, int] = {}
+
+    def create_bucket(self, name: str, region: str = 'us-east-1') -> StubBucket:
+        with self.lock:
+            return self.buckets.setdefault(name, StubBucket(name, region))
+
+    def seed(self, bucket: str, key_count: int, object_size: int, key_prefix: str = '', region: str = 'us-east-1') -> None:
+        stub_bucket = self.create_bucket(bucket, region)
+        # every object shares one payload; only listing and transfer costs are of interest
+        data = (b'benchmark line of an object\n' * (object_size // 28 + 1))[:object_size]
+        etag = hashlib.md5(data).hexdigest()
+        modified = time.time()
+        keys = [f"{key_prefix}{i // 1000:05d}/object-{i:09d}.log" for i in range(key_count)]
+        with self.lock:
+            for key in keys:
+                stub_bucket.objects[key] = StubObject(data, etag, modified)
+            stub_bucket.keys = sorted(stub_bucket.objects.keys())
+
+    def count(self, operation: str) -> None:
+        with self.lock:
+            self.request_counts[operation] = self.request_counts.get(operation, 0) + 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # path-style S3 and the sts GetCallerIdentity call, enough for the cli commands to run against
+    protocol_version = 'HTTP/1.1'
+    server_version = 'S3Stub'
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    @property
+    def stub(self) -> StubS3:
+        return self.server.stub
+
+    def __reply(self, status: int, body: bytes = b'', headers: Dict[str, str]|None = None, content_type: str = 'application/xml') -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('x-amz-request-id', 'stub')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def __xml(self, root: str, inner: str, status: int = 200, headers: Dict[str, str]|None = None) -> None:
+        self.__reply(status, f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{_S3_XMLNS}">{inner}</{root}>'.encode('utf-8'), headers)
+
+    def __error(self, status: int, code: str, message: str) -> None:
+        self.__reply(status, f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>'.encode('utf-8'))
+
+    def __read_body(self) -> bytes:
+        if 'chunked' in self.headers.get('Transfer-Encoding', ''):
+            data = self.__read_chunks()
+        else:
+            data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if 'aws-chunked' in self.headers.get('Content-Encoding', ''):
+            data = self.__decode_aws_chunked(data)
+        return data
+
+    def __read_chunks(self) -> bytes:
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+            if 0 == size:
+                while self.rfile.readline().strip():
+                    pass
+                return b''.join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    @staticmethod
+    def __decode_aws_chunked(data: bytes) -> bytes:
+        chunks = []
+        position = 0
+        while position < len(data):
+            line_end = data.index(b'\r\n', position)
+            size = int(data[position:line_end].split(b';')[0], 16)
+            if 0 == size:
+                break
+            chunks.append(data[line_end + 2:line_end + 2 + size])
+            position = line_end + 2 + size + 2
+        return b''.join(chunks)
+
+    def __route(self) -> Tuple[str, str, Dict[str, str]]:
+        url = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        parts = url.path.lstrip('/').split('/', 1)
+        return unquote(parts[0]), unquote(parts[1]) if 1 < len(parts) else '', query
+
+    def __handle(self) -> None:
+        if 0 < self.stub.latency_s:
+            time.sleep(self.stub.latency_s)
+        bucket, key, query = self.__route()
+        body = self.__read_body() if self.command in ('PUT', 'POST') else b''
+        if self.command == 'POST' and bucket == '' and b'Action=GetCallerIdentity' in body:
+            return self.__get_caller_identity()
+        if bucket == '':
+            return self.__list_buckets(query)
+        with self.stub.lock:
+            stub_bucket = self.stub.buckets.get(bucket)
+        if stub_bucket is None and not(self.command == 'PUT' and key == ''):
+            return self.__error(404, 'NoSuchBucket', f"The specified bucket {bucket} does not exist")
+        if key == '':
+            if self.command == 'PUT':
+                self.stub.count('CreateBucket')
+                self.stub.create_bucket(bucket)
+                return self.__reply(200, headers={'Location': f"/{bucket}"})
+            if self.command == 'HEAD':
+                self.stub.count('HeadBucket')
+                return self.__reply(200, headers={'x-amz-bucket-region': stub_bucket.region})
+            if self.command == 'POST' and 'delete' in query:
+                return self.__delete_objects(stub_bucket, body)
+            if 'location' in query:
+                return self.__xml('LocationConstraint', '' if stub_bucket.region == 'us-east-1' else stub_bucket.region)
+            return self.__list_objects(stub_bucket, query)
+        if self.command == 'POST' and 'uploads' in query:
+            return self.__create_multipart_upload(bucket, key)
+        if 'uploadId' in query:
+            return self.__multipart(stub_bucket, key, query, body)
+        if self.command == 'PUT':
+            self.stub.count('PutObject')
+            stub_object = StubObject(body)
+            with self.stub.lock:
+                stub_bucket.put(key, stub_object)
+            return self.__reply(200, headers={'ETag': f'"{stub_object.etag}"'})
+        if self.command == 'DELETE':
+            self.stub.count('DeleteObject')
+            with self.stub.lock:
+                stub_bucket.delete(key)
+            return self.__reply(204)
+        return self.__get_object(stub_bucket, key)
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = lambda self: self.__handle()
+
+    def __get_caller_identity(self) -> None:
+        self.stub.count('GetCallerIdentity')
+        body = (
+            '<GetCallerIdentityResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/"><GetCallerIdentityResult>'
+            f'<Arn>arn:aws:iam::{ACCOUNT_ID}:user/benchmark</Arn><UserId>AIDABENCHMARK</UserId><Account>{ACCOUNT_ID}</Account>'
+            '</GetCallerIdentityResult><ResponseMetadata><RequestId>stub</RequestId></ResponseMetadata></GetCallerIdentityResponse>'
+        )
+        self.__reply(200, body.encode('utf-8'), content_type='text/xml')
+
+    def __list_buckets(self, query: Dict[str, str]) -> None:
+        self.stub.count('ListBuckets')
+        prefix = query.get('prefix', '')
+        region = query.get('bucket-region')
+        max_buckets = int(query.get('max-buckets', 10000))
+        with self.stub.lock:
+            names = sorted([name for name, stub_bucket in self.stub.buckets.items() if name.startswith(prefix) and (region is None or stub_bucket.region == region)])
+            start = bisect_right(names, query['continuation-token']) if 'continuation-token' in query else 0
+            stub_buckets = [self.stub.buckets[name] for name in names[start:start + max_buckets]]
+        inner = '<Buckets>' + ''.join([
+            f"<Bucket><Name>{escape(b.name)}</Name><CreationDate>{_iso(b.created)}</CreationDate><BucketRegion>{b.region}</BucketRegion></Bucket>"
+            for b in stub_buckets
+        ]) + '</Buckets><Owner><ID>benchmark</ID></Owner>'
+        if start + max_buckets < len(names):
+            inner += f"<ContinuationToken>{escape(stub_buckets[-1].name)}</ContinuationToken>"
+        self.__xml('ListAllMyBucketsResult', inner)
+
+    def __list_objects(self, stub_bucket: StubBucket, query: Dict[str, str]) -> None:
+        self.stub.count('ListObjectsV2')
+        prefix = query.get('prefix', '')
+        delimiter = query.get('delimiter', '')
+        max_keys = int(query.get('max-keys', 1000))
+        after = query.get('continuation-token', query.get('start-after', ''))
+        contents = []
+        common_prefixes = []
+        last = None
+        with self.stub.lock:
+            keys = stub_bucket.keys
+            index = max(bisect_right(keys, after), bisect_left(keys, prefix))
+            while index < len(keys) and len(contents) + len(common_prefixes) < max_keys:
+                key = keys[index]
+                if not(key.startswith(prefix)):
+                    break
+                delimited = key.find(delimiter, len(prefix)) if 0 < len(delimiter) else -1
+                if 0 <= delimited:
+                    common_prefix = key[:delimited + len(delimiter)]
+                    common_prefixes.append(common_prefix)
+                    # continue past every key under this common prefix
+                    index = bisect_left(keys, common_prefix + '\U0010ffff')
+                    last = keys[index - 1]
+                    continue
+                contents.append((key, stub_bucket.objects[key]))
+                last = key
+                index += 1
+            truncated = index < len(keys) and keys[index].startswith(prefix)
+        # botocore asks for url-encoded keys and decodes them again
+        encode = (lambda value: quote_plus(value, safe='/')) if query.get('encoding-type') == 'url' else (lambda value: value)
+        inner = f"<Name>{escape(stub_bucket.name)}</Name><Prefix>{escape(encode(prefix))}</Prefix><MaxKeys>{max_keys}</MaxKeys><KeyCount>{len(contents) + len(common_prefixes)}</KeyCount>"
+        inner += f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+        if truncated:
+            inner += f"<NextContinuationToken>{escape(encode(last))}</NextContinuationToken>"
+        if 0 < len(delimiter):
+            inner += f"<Delimiter>{escape(encode(delimiter))}</Delimiter>"
+        inner += ''.join([
+            f'<Contents><Key>{escape(encode(key))}</Key><LastModified>{_iso(o.modified)}</LastModified><ETag>"{o.etag}"</ETag><Size>{len(o.data)}</Size><StorageClass>STANDARD</StorageClass></Contents>'
+            for key, o in contents
+        ])
+        inner += ''.join([f"<CommonPrefixes><Prefix>{escape(encode(p))}</Prefix></CommonPrefixes>" for p in common_prefixes])
+        self.__xml('ListBucketResult', inner)
+
+    def __get_object(self, stub_bucket: StubBucket, key: str) -> None:
+        self.stub.count('HeadObject' if self.command == 'HEAD' else 'GetObject')
+        with self.stub.lock:
+            stub_object = stub_bucket.objects.get(key)
+        if stub_object is None:
+            return self.__error(404, 'NoSuchKey', f"The specified key {key} does not exist")
+        if_match = self.headers.get('If-Match')
+        if if_match is not None and if_match.strip('"') != stub_object.etag:
+            return self.__error(412, 'PreconditionFailed', 'At least one of the pre-conditions you specified did not hold')
+        headers = {'ETag': f'"{stub_object.etag}"', 'Last-Modified': _http_date(stub_object.modified), 'Accept-Ranges': 'bytes'}
+        data = stub_object.data
+        byte_range = self.headers.get('Range')
+        if byte_range is not None:
+            first, last = byte_range.split('=', 1)[1].split('-')
+            first, last = int(first), min(int(last) if last else len(data) - 1, len(data) - 1)
+            headers['Content-Range'] = f"bytes {first}-{last}/{len(data)}"
+            return self.__reply(206, data[first:last + 1], headers, 'binary/octet-stream')
+        self.__reply(200, data, headers, 'binary/octet-stream')
+
+    def __delete_objects(self, stub_bucket: StubBucket, body: bytes) -> None:
+        self.stub.count('DeleteObjects')
+        text = body.decode('utf-8')
+        keys = [unescape(part.split('</Key>', 1)[0]) for part in text.split('<Key>')[1:]]
+        with self.stub.lock:
+            for key in keys:
+                stub_bucket.delete(key)
+        self.__xml('DeleteResult', '')
+
+    def __create_multipart_upload(self, bucket: str, key: str) -> None:
+        self.stub.count('CreateMultipartUpload')
+        upload_id = hashlib.md5(f"{bucket}/{key}/{time.time_ns()}".encode('utf-8')).hexdigest()
+        with self.stub.lock:
+            self.stub.uploads[upload_id] = (bucket, key, {})
+        self.__xml('InitiateMultipartUploadResult', f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>")
+
+    def __multipart(self, stub_bucket: StubBucket, key: str, query: Dict[str, str], body: bytes) -> None:
+        upload_id = query['uploadId']
+        with self.stub.lock:
+            upload = self.stub.uploads.get(upload_id)
+        if upload is None:
+            return self.__error(404, 'NoSuchUpload', f"The specified upload {upload_id} does not exist")
+        if self.command == 'PUT':
+            self.stub.count('UploadPart')
+            part = StubObject(body)
+            with self.stub.lock:
+                upload[2][int(query['partNumber'])] = part
+            return self.__reply(200, headers={'ETag': f'"{part.etag}"'})
+        if self.command == 'DELETE':
+            self.stub.count('AbortMultipartUpload')
+            with self.stub.lock:
+                self.stub.uploads.pop(upload_id, None)
+            return self.__reply(204)
+        self.stub.count('CompleteMultipartUpload')
+        with self.stub.lock:
+            self.stub.uploads.pop(upload_id, None)
+        parts = [upload[2][number] for number in sorted(upload[2].keys())]
+        etag = f"{hashlib.md5(b''.join([bytes.fromhex(part.etag) for part in parts])).hexdigest()}-{len(parts)}"
+        stub_object = StubObject(b''.join([part.data for part in parts]), etag)
+        with self.stub.lock:
+            stub_bucket.put(key, stub_object)
+        self.__xml('CompleteMultipartUploadResult', f"<Bucket>{escape(stub_bucket.name)}</Bucket><Key>{escape(key)}</Key><ETag>\"{etag}\"</ETag>")
+
+
+class StubS3Server:
+    # serves a StubS3 on 127.0.0.1 from a background thread for the life of the context
+    def __init__(self, stub: StubS3, port: int = 0) -> None:
+        self.stub = stub
+        self.__server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.__server.daemon_threads = True
+        self.__server.stub = stub
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='s3-stub', daemon=True)
+
+    @property
+    def endpoint_url(self) -> str:
+        return f"http://127.0.0.1:{self.__server.server_address[1]}"
+
+    def __enter__(self) -> "StubS3Server":
+        self.__thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
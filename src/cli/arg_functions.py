@@ -1,4 +1,4 @@
-from dateutil.parser import parse
+import argparse
 from datetime import datetime, timezone
 from typing import List
 
@@ -9,4 +9,37 @@ def split_flatten_array_arg(array_arg: List[str], delim = ',') -> List[str]:
     return result
 
 def datetime_from_string(value: str) -> datetime:
+    # dateutil is only imported once a date is given
+    from dateutil.parser import parse
     return parse(value).replace(tzinfo=timezone.utc)
+
+def byte_count_from_string(value: str) -> int:
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+    text = value.strip().lower().removesuffix('ib').removesuffix('b')
+    if 0 < len(text) and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def positive_float(value: str) -> float:
+    result = float(value)
+    if not(0 < result):
+        raise argparse.ArgumentTypeError(f"must be greater than 0. Got: {value}")
+    return result
+
+def positive_byte_count_from_string(value: str) -> int:
+    result = byte_count_from_string(value)
+    if not(0 < result):
+        raise argparse.ArgumentTypeError(f"must be greater than 0. Got: {value}")
+    return result
+
+def percentile_float(value: str) -> float:
+    result = float(value)
+    if not(0 < result < 100):
+        raise argparse.ArgumentTypeError(f"must be greater than 0 and less than 100. Got: {value}")
+    return result
+
+def fraction_float(value: str) -> float:
+    result = float(value)
+    if not(0 <= result <= 1):
+        raise argparse.ArgumentTypeError(f"must be from 0 to 1. Got: {value}")
+    return result
@@ -0,0 +1,49 @@
+import argparse
+import importlib
+import sys
+
+# command -> module whose main() runs it, and what it does. every command is also installed as a script
+# of the same name. a command's module, and with it boto3, is only imported once that command is chosen
+COMMANDS = {
+    's3-bucket-download': ('cli.s3.bucket_download', 'download the objects under a key prefix of a bucket'),
+    's3-bucket-upload': ('cli.s3.bucket_upload', 'upload a directory to a key prefix of a bucket'),
+    's3-list-buckets-like': ('cli.s3.list_buckets_like', 'list buckets with names like a skeleton'),
+    's3-list-objects-like': ('cli.s3.list_objects_like', 'list objects of a bucket with names like a skeleton'),
+    's3-list-bucket-objects-like': ('cli.s3.list_bucket_objects_like', 'list objects like a skeleton of buckets like a skeleton'),
+    's3-objects-json-to-url': ('cli.s3.objects_json_to_url', 'convert the newest listed objects to s3 urls'),
+    's3-download-objects': ('cli.s3.download_objects', 'download the newest listed objects'),
+    's3-upload-stream': ('cli.s3.upload_stream', 'upload a file or stdin to one object as concurrent parts'),
+    's3-cat': ('cli.s3.cat_objects', 'print the lines of listed objects'),
+    's3-grep': ('cli.s3.grep_objects', 'print the lines of listed objects matching a pattern'),
+    'aws-sso-login': ('cli.aws_sso_login', 'aws sso login --profile'),
+}
+
+
+def parse_args(argv: list) -> argparse.Namespace:
+    width = max(len(command) for command in COMMANDS.keys())
+    parser = argparse.ArgumentParser(
+        prog='aws-tools',
+        description="Run one of the aws-tools commands",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog="commands:\n" + '\n'.join(f"  {command.ljust(width)}  {summary}" for command, (_, summary) in COMMANDS.items())
+    )
+    parser.add_argument(
+        "command",
+        choices=COMMANDS.keys(),
+        metavar="command",
+        help="command to run, listed below",
+    )
+    parser.add_argument(
+        "args",
+        nargs=argparse.REMAINDER,
+        help="arguments of the command; aws-tools <command> --help describes them",
+    )
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    module_name, _ = COMMANDS[args.command]
+    # the command parses the rest of the line itself, and names itself in its usage as invoked
+    sys.argv = [f"aws-tools {args.command}"] + args.args
+    importlib.import_module(module_name).main()
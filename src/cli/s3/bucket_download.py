@@ -2,9 +2,11 @@ import argparse
 import os
 import sys
 
+from cli.arg_functions import byte_count_from_string, fraction_float, percentile_float, positive_byte_count_from_string, positive_float, split_flatten_array_arg
 from util.logging import get_default_logger, initialize_logging
-from s3.s3_client import S3Client
-from util.aws_account_api import get_boto_session_aws_account
+from s3.hedging import enable_hedging
+from s3.rate_control import set_rate_limits
+from util.metrics import enable_metrics
 
 logger = get_default_logger()
 def parse_args() -> argparse.Namespace:
@@ -44,19 +46,101 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="directory in which all objects will be downloaded",
     )
+    parser.add_argument(
+        "--list-shards",
+        type=int,
+        default=1,
+        help="number of key-space partitions of the bucket listed concurrently",
+    )
+    parser.add_argument(
+        "--split-points",
+        nargs="+",
+        default=None,
+        help="keys at which to partition the listing, instead of discovering partitions from '/' common prefixes",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=10,
+        help="maximum number of objects downloaded concurrently",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="maximum number of attempts to download each object",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        default=False,
+        help="only download objects that are new or changed, comparing size, LastModified and ETag\nwith the local file and a .s3-sync-manifest.jsonl kept in the output directory",
+    )
+    parser.add_argument(
+        "--ranged-threshold",
+        type=byte_count_from_string,
+        default=byte_count_from_string('64MB'),
+        help="objects this size or larger are fetched as concurrent byte ranges written in place (ie. 64MB), 0 disables",
+    )
+    parser.add_argument(
+        "--part-size",
+        type=byte_count_from_string,
+        default=byte_count_from_string('16MB'),
+        help="size of each byte range of a ranged download (ie. 16MB)",
+    )
+    parser.add_argument(
+        "--part-workers",
+        type=int,
+        default=10,
+        help="maximum number of byte ranges fetched concurrently, across all objects",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=percentile_float,
+        help="send a second GET for an object or part not answered within this percentile of recent GETs'\ntime to first byte, using whichever answers first (ie. 95); off when not given",
+    )
+    parser.add_argument(
+        "--hedge-budget",
+        type=fraction_float,
+        default=0.05,
+        help="with --hedge-percentile, most GETs hedged, as a fraction of all GETs",
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=positive_float,
+        help="maximum requests per second sent to each bucket prefix (the key up to its first /); concurrency\nadapts to S3 throttling whether or not this is given",
+    )
+    parser.add_argument(
+        "--max-bandwidth",
+        type=positive_byte_count_from_string,
+        help="maximum bytes per second sent and received by this program (ie. 50MB)",
+    )
     parser.add_argument(
         "--no-verify-ssl",
         action="store_true",
         default=False,
         help="use no-verify-ssl with aws call",
     )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="write per operation and region request counts, latency percentiles, retries, throttles\nand bytes, with phase timings, as json to this file at exit",
+    )
 
     args = parser.parse_args()
     return args
 
 def main() -> None:
     args = parse_args()
+    from s3.s3_client_router import S3ClientRouter
+    from s3.s3_transfer import RangedDownloader, S3Downloader, SyncManifest, format_byte_rate
+    from util.aws_account_api import get_boto_session_aws_account
     initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
+    set_rate_limits(args.max_rps, args.max_bandwidth)
+    if args.hedge_percentile is not None:
+        enable_hedging(args.hedge_percentile, args.hedge_budget)
 
     try:
         boto_session_account = get_boto_session_aws_account(args.aws_profile_name)
@@ -65,28 +149,39 @@ def main() -> None:
         sys.exit(1)
     
     try:
-        s3_client = S3Client(boto_session_account, args.no_verify_ssl)
+        router = S3ClientRouter(boto_session_account, args.no_verify_ssl, max_pool_connections=max(10, args.max_workers + args.part_workers, args.list_shards), list_shards=args.list_shards)
+        s3_client = router.client()
     except Exception:
         logger.exception("Unable to instantiate s3 client. %s", args.aws_profile_name)
         sys.exit(1)
     try:
         s3_bucket = s3_client.get_bucket(args.bucket)
+        # list and download through the bucket's own region rather than redirecting from the profile's
+        s3_client = router.for_bucket(s3_bucket)
     except Exception:
         logger.exception("fetching bucket %s", args.bucket)
         sys.exit(1)
+    split_points = split_flatten_array_arg(args.split_points) if args.split_points is not None else None
+    listed_count = 0
+
+    def iter_downloads():
+        nonlocal listed_count
+        for s3_object in s3_client.iter_objects(s3_bucket, args.key_prefix, split_points):
+            listed_count += 1
+            yield (s3_object, os.path.join(args.output_directory, s3_object.name))
+
+    sync_manifest = SyncManifest(args.output_directory) if args.sync else None
+    ranged_downloader = RangedDownloader(args.part_size, args.part_workers, args.max_attempts) if 0 < args.ranged_threshold else None
+    downloader = S3Downloader(s3_client, args.max_workers, args.max_attempts, sync_manifest=sync_manifest, ranged_downloader=ranged_downloader, ranged_threshold=args.ranged_threshold)
     try:
-        s3_objects = s3_client.list_objects(s3_bucket, args.key_prefix)
+        stats = downloader.download(iter_downloads())
     except Exception:
         logger.exception("list objects from bucket %s with key prefix %s", args.bucket, args.key_prefix)
         sys.exit(1)
-    download_count = 0
-    for s3_object in s3_objects:
-        output_filepath = os.path.join(args.output_directory, s3_object.name)
-        try:
-            s3_client.get_object_to_file(args.bucket,  s3_object.name, output_filepath)
-            download_count += 1
-        except Exception:
-            logger.exception("Failed downloading %s/%s to %s", args.bucket, key, output_filepath)
-        
-    logger.info("downloaded %d/%d objects to %s", download_count, len(s3_objects), args.output_directory)
+    finally:
+        if sync_manifest is not None:
+            sync_manifest.close()
+        if ranged_downloader is not None:
+            ranged_downloader.close()
 
+    logger.info("downloaded %d/%d objects to %s (%s), %d unchanged", stats.file_count, listed_count, args.output_directory, format_byte_rate(stats.bytes_per_second), stats.skipped_count)
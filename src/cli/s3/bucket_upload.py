@@ -2,9 +2,10 @@ import argparse
 import os
 import sys
 
+from cli.arg_functions import byte_count_from_string, positive_byte_count_from_string, positive_float
 from util.logging import get_default_logger, initialize_logging
-from s3.s3_client import S3Client
-from util.aws_account_api import get_boto_session_aws_account
+from s3.rate_control import set_rate_limits
+from util.metrics import enable_metrics
 
 logger = get_default_logger()
 def parse_args() -> argparse.Namespace:
@@ -39,19 +40,98 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="directory from which all files will uploaded into bucket",
     )
+    parser.add_argument(
+        "--key-prefix",
+        type=str,
+        default='',
+        help="key-prefix prepended to each file's path relative to input-directory",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=10,
+        help="maximum number of files uploaded concurrently",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="maximum number of attempts to upload each file",
+    )
+    parser.add_argument(
+        "--multipart-threshold",
+        type=byte_count_from_string,
+        default=8 * 1024 * 1024,
+        help="files this size or larger are uploaded in parts (ie. 8MB, 1GB)",
+    )
+    parser.add_argument(
+        "--multipart-chunksize",
+        type=byte_count_from_string,
+        default=8 * 1024 * 1024,
+        help="size of each part of a multipart upload (ie. 8MB, 64MB)",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=10,
+        help="maximum number of parts of one file uploaded concurrently",
+    )
+    parser.add_argument(
+        "--only-changed",
+        action="store_true",
+        default=False,
+        help="list key-prefix once and only upload files whose size or ETag (md5, or multipart ETag\nfor files at or above multipart-threshold) differs from the object already there",
+    )
+    parser.add_argument(
+        "--delete-removed",
+        action="store_true",
+        default=False,
+        help="with --only-changed, delete objects under key-prefix that no longer exist in input-directory",
+    )
+    parser.add_argument(
+        "--hash-workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of files hashed concurrently by --only-changed",
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=positive_float,
+        help="maximum requests per second sent to each bucket prefix (the key up to its first /); concurrency\nadapts to S3 throttling whether or not this is given",
+    )
+    parser.add_argument(
+        "--max-bandwidth",
+        type=positive_byte_count_from_string,
+        help="maximum bytes per second sent and received by this program (ie. 50MB)",
+    )
     parser.add_argument(
         "--no-verify-ssl",
         action="store_true",
         default=False,
         help="use no-verify-ssl with aws call",
     )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="write per operation and region request counts, latency percentiles, retries, throttles\nand bytes, with phase timings, as json to this file at exit",
+    )
 
     args = parser.parse_args()
+    if args.delete_removed and not(args.only_changed):
+        parser.error("--delete-removed requires --only-changed")
     return args
 
 def main() -> None:
     args = parse_args()
+    from boto3.s3.transfer import TransferConfig
+    from s3.s3_client import S3Client
+    from s3.s3_etag import iter_changed_files
+    from s3.s3_transfer import S3Uploader, format_byte_rate, iter_directory_files
+    from util.aws_account_api import get_boto_session_aws_account
     initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
+    set_rate_limits(args.max_rps, args.max_bandwidth)
 
     try:
         boto_session_account = get_boto_session_aws_account(args.aws_profile_name)
@@ -60,28 +140,46 @@ def main() -> None:
         sys.exit(1)
     
     try:
-        s3_client = S3Client(boto_session_account, args.no_verify_ssl)
+        s3_client = S3Client(boto_session_account, args.no_verify_ssl, max_pool_connections=max(10, args.max_workers * args.max_concurrency))
     except Exception:
         logger.exception("Unable to instantiate s3 client. %s", args.aws_profile_name)
         sys.exit(1)
 
-    try:
-        s3_keys = os.listdir(args.input_directory)
-    except Exception:
-        logger.exception("list contents of directory %s", args.input_directory)
+    if not(os.path.isdir(args.input_directory)):
+        logger.error("input directory %s is not a directory", args.input_directory)
         sys.exit(1)
-    file_count = 0
-    upload_count = 0
-    for key in s3_keys:
-        input_filepath = os.path.join(args.input_directory, key)
-        if not(os.path.isfile(input_filepath)):
-            continue
-        file_count += 1
+    transfer_config = TransferConfig(
+        multipart_threshold=args.multipart_threshold,
+        multipart_chunksize=args.multipart_chunksize,
+        max_concurrency=args.max_concurrency
+    )
+    uploads = iter_directory_files(args.input_directory, args.key_prefix)
+    local_keys = set()
+    unchanged_count = 0
+    if args.only_changed:
         try:
-            s3_client.put_object_from_file(args.bucket, key, input_filepath)
-            upload_count += 1
+            s3_bucket = s3_client.get_bucket(args.bucket)
+            remote_objects = {s3_object.key: s3_object for s3_object in s3_client.iter_objects(s3_bucket, args.key_prefix)}
         except Exception:
-            logger.exception("Failed uploading %s to %s/%s to %s", input_filepath, args.bucket, key)
-        
-    logger.info("uploaded %d/%d objects from %s to bucket %s", upload_count, file_count, args.input_directory, args.bucket)
+            logger.exception("list objects from bucket %s with key prefix %s", args.bucket, args.key_prefix)
+            sys.exit(1)
+        logger.info("comparing %s against %d objects under %s/%s", args.input_directory, len(remote_objects), args.bucket, args.key_prefix)
+
+        def on_unchanged(input_filepath: str, key: str) -> None:
+            nonlocal unchanged_count
+            unchanged_count += 1
+
+        def iter_local(uploads):
+            for upload in uploads:
+                local_keys.add(upload[1])
+                yield upload
+        uploads = iter_changed_files(iter_local(uploads), remote_objects, transfer_config, args.hash_workers, on_unchanged)
+
+    uploader = S3Uploader(s3_client, transfer_config, args.max_workers, args.max_attempts)
+    stats = uploader.upload(args.bucket, uploads)
 
+    logger.info("uploaded %d/%d objects from %s to bucket %s (%s), %d unchanged", stats.file_count, stats.file_count + stats.failed_count, args.input_directory, args.bucket, format_byte_rate(stats.bytes_per_second), unchanged_count)
+    if args.delete_removed:
+        removed_keys = sorted([key for key in remote_objects.keys() if key not in local_keys])
+        failed_keys = s3_client.delete_objects(args.bucket, removed_keys)
+        logger.info("deleted %d/%d objects under %s/%s no longer in %s", len(removed_keys) - len(failed_keys), len(removed_keys), args.bucket, args.key_prefix, args.input_directory)
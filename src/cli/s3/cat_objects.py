@@ -0,0 +1,16 @@
+from cli.s3.grep_objects import parse_args, stream_lines
+from util.logging import initialize_logging
+from s3.hedging import enable_hedging
+from s3.rate_control import set_rate_limits
+from util.metrics import enable_metrics
+
+
+def main() -> None:
+    args = parse_args(with_pattern=False)
+    initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
+    set_rate_limits(args.max_rps, args.max_bandwidth)
+    if args.hedge_percentile is not None:
+        enable_hedging(args.hedge_percentile, args.hedge_budget)
+    stream_lines(args, None, 0)
@@ -1,10 +1,13 @@
 import argparse
 import os
-from s3.s3_client import S3Client
-from util.aws_account_api import get_boto_session_aws_account
-from util.json_helpers import json_load, json_dump
+from cli.arg_functions import byte_count_from_string, fraction_float, percentile_float, positive_byte_count_from_string, positive_float
+from s3.s3_object_reader import read_newest_s3_objects
+from util.json_helpers import json_dump
 from util.logging import get_default_logger, initialize_logging
-from s3.s3_client import  S3Object
+from s3.hedging import enable_hedging
+from s3.rate_control import set_rate_limits
+from util.metrics import enable_metrics
+from s3.s3_model import S3Object
 
 logger = get_default_logger()
 
@@ -37,7 +40,64 @@ def parse_args() -> argparse.Namespace:
         "--input-filepath",
         type=str,
         required=True,
-        help="full path of file containing bucket/object JSON",
+        help="full path of file containing bucket/object JSON or JSONL",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=10,
+        help="maximum number of objects downloaded concurrently",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="maximum number of attempts to download each object",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        default=False,
+        help="only download objects that are new or changed, comparing size, LastModified and ETag\nwith the local file and a .s3-sync-manifest.jsonl kept in the output directory",
+    )
+    parser.add_argument(
+        "--ranged-threshold",
+        type=byte_count_from_string,
+        default=byte_count_from_string('64MB'),
+        help="objects this size or larger are fetched as concurrent byte ranges written in place (ie. 64MB), 0 disables",
+    )
+    parser.add_argument(
+        "--part-size",
+        type=byte_count_from_string,
+        default=byte_count_from_string('16MB'),
+        help="size of each byte range of a ranged download (ie. 16MB)",
+    )
+    parser.add_argument(
+        "--part-workers",
+        type=int,
+        default=10,
+        help="maximum number of byte ranges fetched concurrently, across all objects",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=percentile_float,
+        help="send a second GET for an object or part not answered within this percentile of recent GETs'\ntime to first byte, using whichever answers first (ie. 95); off when not given",
+    )
+    parser.add_argument(
+        "--hedge-budget",
+        type=fraction_float,
+        default=0.05,
+        help="with --hedge-percentile, most GETs hedged, as a fraction of all GETs",
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=positive_float,
+        help="maximum requests per second sent to each bucket prefix (the key up to its first /); concurrency\nadapts to S3 throttling whether or not this is given",
+    )
+    parser.add_argument(
+        "--max-bandwidth",
+        type=positive_byte_count_from_string,
+        help="maximum bytes per second sent and received by this program (ie. 50MB)",
     )
     parser.add_argument(
         "--no-verify-ssl",
@@ -45,6 +105,11 @@ def parse_args() -> argparse.Namespace:
         default=False,
         help="use no-verify-ssl with aws call",
     )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="write per operation and region request counts, latency percentiles, retries, throttles\nand bytes, with phase timings, as json to this file at exit",
+    )
 
     args = parser.parse_args()
     return args
@@ -52,28 +117,26 @@ def parse_args() -> argparse.Namespace:
 
 def main() -> None:
     args = parse_args()
+    from s3.s3_client_router import S3ClientRouter
+    from util.aws_account_api import get_boto_session_aws_account
+    from s3.s3_transfer import RangedDownloader, S3Downloader, SyncManifest, format_byte_rate
     initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
+    set_rate_limits(args.max_rps, args.max_bandwidth)
+    if args.hedge_percentile is not None:
+        enable_hedging(args.hedge_percentile, args.hedge_budget)
     
     s3_objects = []
+    input_count = 0
     s3_download_datetime = None
     output_dirpath = os.path.dirname(args.input_filepath)
     logger.info(f"Loading S3 Object definitions from {args.input_filepath}")
     try:
         with open(args.input_filepath, 'r') as inF:
-            data = json_load(inF)
-            if 'datetime' in data:
-                s3_download_datetime = data['datetime']
-            if 'result' in data:
-                data = data['result']
-                logger.info(f"1) result")
-            if 's3_objects' in data:
-                data = data['s3_objects']
-            if isinstance(data, list):
-                s3_objects = [S3Object.from_dict(o) for o in data]
-                s3_objects.sort(reverse=True)
-                logger.debug(f"Loaded {len(s3_objects)} S3 Objects")
-            else:
-                raise TypeError(f"Data not type list. {args.input_filepath}")
+            s3_objects, input_count, metadata = read_newest_s3_objects(inF, args.top_count)
+            s3_download_datetime = metadata.get('datetime')
+            logger.debug(f"Loaded newest {len(s3_objects)} of {input_count} S3 Objects")
         
     except Exception:
         logger.exception(f"Failed loading S3 objects from {args.input_filepath}")
@@ -81,31 +144,39 @@ def main() -> None:
         
     download_count = min(len(s3_objects), args.top_count) if args.top_count is not None else len(s3_objects)
 
-    logger.info(f"downloading top {download_count}/{len(s3_objects)} S3 Objects to {output_dirpath}")
-    s3_downloads = []
+    logger.info(f"downloading top {download_count}/{input_count} S3 Objects to {output_dirpath}")
+    downloaded = []
+
+    sync_manifest = None
+    ranged_downloader = None
     try:
         session = get_boto_session_aws_account(args.aws_profile_name)
-        s3_client = S3Client(session, args.no_verify_ssl)
-        for i in range(download_count):
-            s3_object = s3_objects[i]
-            output_filename = s3_object.fully_qualified_name.replace('/','.')
-            output_filepath = os.path.join(output_dirpath, output_filename)
-            try:
-                s3_client.get_object_to_file(s3_object.bucket.name,  s3_object.name, output_filepath)
-                logger.debug(f"{s3_object} downloaded to {output_filepath}")
-                s3_downloads.append({
-                    'filename': output_filename,
-                    'metadata': s3_object.__str__()
-                })
-            except Exception:
-                logger.exception(f"Failed downloading {s3_object.fully_qualified_name} to {output_filepath}")
-            
-        logger.info(f"downloaded {download_count}/{len(s3_objects)} objects to {output_dirpath}")
+        router = S3ClientRouter(session, args.no_verify_ssl, max_pool_connections=max(10, args.max_workers + args.part_workers))
+        sync_manifest = SyncManifest(output_dirpath) if args.sync else None
+        ranged_downloader = RangedDownloader(args.part_size, args.part_workers, args.max_attempts) if 0 < args.ranged_threshold else None
+        downloader = S3Downloader(router, args.max_workers, args.max_attempts, sync_manifest=sync_manifest, ranged_downloader=ranged_downloader, ranged_threshold=args.ranged_threshold)
+        # unchanged files already in place are listed in the downloads metadata as well
+        stats = downloader.download(
+            ((s3_object, os.path.join(output_dirpath, s3_object.fully_qualified_name.replace('/','.'))) for s3_object in s3_objects[:download_count]),
+            lambda s3_object, output_filepath: downloaded.append((s3_object, output_filepath)),
+            lambda s3_object, output_filepath: downloaded.append((s3_object, output_filepath))
+        )
+        logger.info(f"downloaded {stats.file_count}/{download_count} objects to {output_dirpath} ({format_byte_rate(stats.bytes_per_second)}), {stats.skipped_count} unchanged")
     except Exception:
         logger.exception(f"Failed downloading S3 objects in {args.input_filepath} to  {output_dirpath}")
+    finally:
+        if sync_manifest is not None:
+            sync_manifest.close()
+        if ranged_downloader is not None:
+            ranged_downloader.close()
+    downloaded.sort(key=lambda download: download[0], reverse=True)
+    s3_downloads = [{
+        'filename': os.path.basename(output_filepath),
+        'metadata': s3_object.__str__()
+    } for s3_object, output_filepath in downloaded]
     if 0 < len(s3_downloads):
         output_filename = os.path.splitext(os.path.basename(args.input_filepath))
-        output_filename = f"{output_filename[0]}-downloads{output_filename[1]}"
+        output_filename = f"{output_filename[0]}-downloads{output_filename[1] if output_filename[1] != '.jsonl' else '.json'}"
         output_filepath = os.path.join(output_dirpath, output_filename)
         logger.debug(f"Writing {len(s3_downloads)} metadata for downloads to {output_filepath}")
         with open(output_filepath, 'w') as of:
@@ -116,7 +187,7 @@ def main() -> None:
                     'input_filepath': args.input_filepath
                 },
                 'result': {
-                    'input_count': len(s3_objects),
+                    'input_count': input_count,
                     'output_count': len(s3_downloads),
                     's3_downloads': s3_downloads
                 }
@@ -0,0 +1,207 @@
+import argparse
+import os
+import sys
+from typing import TYPE_CHECKING
+
+from cli.arg_functions import byte_count_from_string, datetime_from_string, fraction_float, percentile_float, positive_byte_count_from_string, positive_float
+from util.logging import get_default_logger, initialize_logging
+from s3.hedging import enable_hedging
+from s3.rate_control import set_rate_limits
+from util.metrics import enable_metrics
+from s3.s3_model import DateRange, S3Object
+from util.json_helpers import JsonResultReader
+
+if TYPE_CHECKING:
+    # named by annotations only; s3_object_lines, and boto3 with it, is imported once arguments are parsed
+    from s3.s3_object_lines import LineFilter
+
+logger = get_default_logger()
+
+def parse_args(with_pattern: bool = True) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=f"Print the lines of listed S3 objects{' matching a pattern' if with_pattern else ''}, streamed without touching disk",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+
+    parser.add_argument(
+        "--log-level",
+        type=str.lower,
+        choices=["debug", "info", "warning", "error", "critical"],
+        default="info",
+        help="The level of logging output by this program",
+    )
+    parser.add_argument(
+        "--aws-profile-name",
+        type=str.lower,
+        required=True,
+        help="AWS profile name"
+    )
+    objects = parser.add_mutually_exclusive_group(required=True)
+    objects.add_argument(
+        "--input-filepath",
+        type=str,
+        help="full path of file containing bucket/object JSON or JSONL",
+    )
+    objects.add_argument(
+        "--bucket-name",
+        type=str,
+        help="bucket whose objects matching key-glob and the date range are listed and read",
+    )
+    parser.add_argument(
+        "--key-glob",
+        type=str,
+        default='*',
+        help="with --bucket-name, glob the full key must match (ie. logs/2025-10-01/*); its literal prefix is listed server-side",
+    )
+    parser.add_argument(
+        "--after-date",
+        type=datetime_from_string,
+        help="with --bucket-name, include objects modified on or after this date",
+    )
+    parser.add_argument(
+        "--before-date",
+        type=datetime_from_string,
+        help="with --bucket-name, include objects modified on or before this date",
+    )
+    if with_pattern:
+        parser.add_argument(
+            "--pattern",
+            type=str,
+            required=True,
+            help="regular expression searched for in each line",
+        )
+        parser.add_argument(
+            "--fixed-strings",
+            action="store_true",
+            default=False,
+            help="treat pattern as a literal string",
+        )
+        parser.add_argument(
+            "--ignore-case",
+            action="store_true",
+            default=False,
+            help="match pattern case-insensitively",
+        )
+        parser.add_argument(
+            "--invert-match",
+            action="store_true",
+            default=False,
+            help="print the lines that do not match pattern",
+        )
+        parser.add_argument(
+            "--filter-workers",
+            type=int,
+            default=os.cpu_count(),
+            help="number of processes matching lines, 0 matches in the threads reading the objects",
+        )
+    parser.add_argument(
+        "--no-provenance",
+        action="store_true",
+        default=False,
+        help="print lines alone rather than prefixed with bucket/key:line-number:",
+    )
+    parser.add_argument(
+        "--decompress",
+        type=str.lower,
+        choices=["auto", "none"],
+        default="auto",
+        help="auto decompresses gzip, bz2 and xz objects, recognized by their leading bytes",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=10,
+        help="maximum number of objects read concurrently; lines of different objects interleave\nin whole batches, 1 prints each object in full and in listing order",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=byte_count_from_string,
+        default=byte_count_from_string('1MB'),
+        help="size of the batches of whole lines each object is cut into (ie. 1MB)",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=percentile_float,
+        help="send a second GET for an object or part not answered within this percentile of recent GETs'\ntime to first byte, using whichever answers first (ie. 95); off when not given",
+    )
+    parser.add_argument(
+        "--hedge-budget",
+        type=fraction_float,
+        default=0.05,
+        help="with --hedge-percentile, most GETs hedged, as a fraction of all GETs",
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=positive_float,
+        help="maximum requests per second sent to each bucket prefix (the key up to its first /); concurrency\nadapts to S3 throttling whether or not this is given",
+    )
+    parser.add_argument(
+        "--max-bandwidth",
+        type=positive_byte_count_from_string,
+        help="maximum bytes per second sent and received by this program (ie. 50MB)",
+    )
+    parser.add_argument(
+        "--no-verify-ssl",
+        action="store_true",
+        default=False,
+        help="use no-verify-ssl with aws call",
+    )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="write per operation and region request counts, latency percentiles, retries, throttles\nand bytes, with phase timings, as json to this file at exit",
+    )
+
+    args = parser.parse_args()
+    if args.input_filepath is not None and (args.after_date is not None or args.before_date is not None):
+        parser.error("--after-date/--before-date require --bucket-name")
+    return args
+
+def stream_lines(args: argparse.Namespace, line_filter: "LineFilter|None", filter_workers: int) -> None:
+    from s3.s3_client_router import S3ClientRouter
+    from s3.s3_object_lines import ObjectLineStreamer, ObjectLineWriter
+    from util.aws_account_api import get_boto_session_aws_account
+    try:
+        session = get_boto_session_aws_account(args.aws_profile_name)
+        router = S3ClientRouter(session, args.no_verify_ssl, max_pool_connections=max(10, args.max_workers))
+    except Exception:
+        logger.exception("Unable to obtain boto session account. %s", args.aws_profile_name)
+        sys.exit(1)
+
+    def iter_s3_objects():
+        if args.input_filepath is not None:
+            with open(args.input_filepath, 'r') as inF:
+                for dict_o in JsonResultReader(inF, 's3_objects'):
+                    yield S3Object.from_dict(dict_o)
+        else:
+            s3_bucket = router.client().get_bucket(args.bucket_name)
+            yield from router.for_bucket(s3_bucket).iter_objects_like(s3_bucket, '', DateRange(start=args.after_date, end=args.before_date), key_glob=args.key_glob)
+
+    writer = ObjectLineWriter(sys.stdout.buffer)
+    streamer = ObjectLineStreamer(router, args.max_workers, filter_workers, args.batch_size, decompress=args.decompress)
+    try:
+        stats = streamer.stream(iter_s3_objects(), writer, line_filter, not(args.no_provenance))
+    except Exception:
+        logger.exception("Failed streaming objects of %s", args.input_filepath if args.input_filepath is not None else args.bucket_name)
+        sys.exit(1)
+    if writer.broken:
+        # stdout was closed early (| head); keep the interpreter from failing to flush it on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    elif 0 < stats.failed_count:
+        sys.exit(2)
+
+def main() -> None:
+    args = parse_args()
+    from s3.s3_object_lines import LineFilter
+    initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
+    set_rate_limits(args.max_rps, args.max_bandwidth)
+    if args.hedge_percentile is not None:
+        enable_hedging(args.hedge_percentile, args.hedge_budget)
+    try:
+        line_filter = LineFilter(args.pattern, args.fixed_strings, args.ignore_case, args.invert_match)
+    except Exception:
+        logger.exception("Invalid pattern %s", args.pattern)
+        sys.exit(1)
+    stream_lines(args, line_filter, args.filter_workers)
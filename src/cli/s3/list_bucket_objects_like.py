@@ -1,11 +1,16 @@
 import argparse
+import sys
 from datetime import datetime, timedelta
-from util.json_helpers import json_dump
+from util.json_helpers import JsonResultWriter
 
-from cli.arg_functions import split_flatten_array_arg, datetime_from_string
+from cli.arg_functions import datetime_from_string, positive_byte_count_from_string, positive_float, split_flatten_array_arg
 from util.logging import get_default_logger, initialize_logging
-from s3.s3_client import S3Client, DateRange
-from util.aws_account_api import BotoSessionAwsAccount, call_for_each_region, get_profile_region
+from s3.rate_control import set_rate_limits
+from util.metrics import enable_metrics
+from s3.listing_cache import ListingCache
+from s3.listing_checkpoint import ListingCheckpoint
+from s3.s3_model import S3Bucket, S3Object, DateRange
+from util.work_scheduler import WorkScheduler
 
 logger = get_default_logger()
 
@@ -29,11 +34,21 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="AWS profile name"
     )
+    parser.add_argument(
+        "--role-arn",
+        type=str,
+        help="role assumed with the profile's credentials, once for every region",
+    )
+    parser.add_argument(
+        "--credential-cache-dir",
+        type=str,
+        help="directory the assumed role's credentials are kept in until they expire, reused by later runs",
+    )
     parser.add_argument(
         "--regions",
         nargs="+",
         default=[],
-        help="list of regions to search"
+        help="list of regions to search.\nwhen omitted buckets in every region are listed"
     )
     parser.add_argument(
         "--bucket-like-name",
@@ -67,7 +82,18 @@ def parse_args() -> argparse.Namespace:
         "--object-like-name",
         type=str,
         required=True,
-        help="skeletal name of objects to list",
+        help="skeletal name of objects to list.\nmatched against the full key when it contains '/', letting its literal prefix be listed server-side",
+    )
+    parser.add_argument(
+        "--object-key-glob",
+        type=str,
+        help="glob the full object key must also match (ie. logs/2025-10/app-*); its literal prefix is listed server-side",
+    )
+    parser.add_argument(
+        "--object-case-sensitive",
+        action="store_true",
+        default=False,
+        help="match object-like-name case-sensitively, so prefixes containing letters can be listed server-side",
     )
     parser.add_argument(
         "--object-min-age-days",
@@ -98,20 +124,94 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="full path of file where bucket/object JSON will be written",
     )
+    parser.add_argument(
+        "--output-format",
+        type=str.lower,
+        choices=["json", "jsonl"],
+        default="json",
+        help="json: one sorted document written once listing completes.\njsonl: a header record, one compact record per result as it is listed, then a footer record",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=10,
+        help="maximum number of buckets listed concurrently",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="directory of an on-disk cache of listing pages, keyed by account/region/bucket/prefix",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=900,
+        help="seconds a cached listing is answered locally instead of re-listed",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        default=False,
+        help="ignore cached listings, re-list and re-cache them",
+    )
+    parser.add_argument(
+        "--checkpoint-file",
+        type=str,
+        default=None,
+        help="file the listing position and records emitted so far are checkpointed to.\ndefaults to OUTPUT_FILEPATH.checkpoint, and is removed once the listing completes",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=100,
+        help="number of listed pages between checkpoints, 0 disables checkpointing",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="continue from the last checkpoint of an interrupted run with the same arguments",
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=positive_float,
+        help="maximum requests per second sent to each bucket prefix (the key up to its first /); concurrency\nadapts to S3 throttling whether or not this is given",
+    )
+    parser.add_argument(
+        "--max-bandwidth",
+        type=positive_byte_count_from_string,
+        help="maximum bytes per second sent and received by this program (ie. 50MB)",
+    )
     parser.add_argument(
         "--no-verify-ssl",
         action="store_true",
         default=False,
         help="use no-verify-ssl with aws call",
     )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="write per operation and region request counts, latency percentiles, retries, throttles\nand bytes, with phase timings, as json to this file at exit",
+    )
 
     args = parser.parse_args()
+    if args.resume and args.checkpoint_interval < 1:
+        parser.error("--resume requires a --checkpoint-interval of at least 1")
     return args
 
 
 def main() -> None:
     args = parse_args()
+    from s3.s3_client import S3Client
+    from s3.s3_client_router import S3ClientRouter
+    from util.aws_account_api import enable_assumed_role_cache, get_boto_session_aws_account, get_profile_region
     initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
+    set_rate_limits(args.max_rps, args.max_bandwidth)
+    if args.credential_cache_dir is not None:
+        enable_assumed_role_cache(args.credential_cache_dir)
     regions = split_flatten_array_arg(args.regions) if args.regions is not None and 0 < len(args.regions) else [get_profile_region(args.aws_profile_name)]
     bucket_date_range = DateRange()
     if 0 < args.bucket_min_age_days:
@@ -141,53 +241,80 @@ def main() -> None:
         if object_date_range.end is None or args.object_before_date < object_date_range.end:
             object_date_range.end = args.object_before_date
 
-    logger.info(f"Listing {args.aws_profile_name} sourced objects where Bucket like {args.bucket_like_name} in {bucket_date_range} and object like {args.object_like_name} in {object_date_range} across regions [{','.join(regions)}]")
-    s3_objects = []
-
-    def collect_objects(session: BotoSessionAwsAccount):
-        try:
-            s3_client = S3Client(session, args.no_verify_ssl)
-        except Exception:
-            logger.exception(f"Unable to instantiate s3 client. {session.boto_session.profile_name}")
-            return
-        try:
-            s3_buckets = s3_client.list_buckets_like(args.bucket_like_name, bucket_date_range)
-        except Exception:
-            logger.exception(f"list buckets like {args.bucket_like_name} region {session.boto_session.region_name}")
-            return
-        s3_region_objects = []
-        for s3_bucket in s3_buckets:
-            try:
-                s3_region_objects.extend(s3_client.list_objects_like(s3_bucket, args.object_like_name, object_date_range))
-            except Exception:
-                logger.exception(f"list objects in {s3_bucket.name} ({session.aws_account.region}) like {args.object_like_name}")
-                return
-        s3_objects.extend(s3_region_objects)
-        logger.info(f"Collected {len(s3_region_objects)} objects across {len(s3_buckets)} buckets in {session.aws_account.region}")
-
-    call_for_each_region(lambda session: collect_objects(session), regions, args.aws_profile_name)
-    
-    s3_objects.sort(reverse=True)
-
-    with open(args.output_filepath, 'w') as of:
-        json_dump({
-            'datetime': datetime.now().isoformat(),
-            'args': {
-                'profile': args.aws_profile_name,
-                'regions': regions,
-                'bucket_args': {
-                    'like_name': args.bucket_like_name,
-                    'date_range': bucket_date_range.__str__(),
-                },
-                'object_args': {
-                    'like_name': args.object_like_name,
-                    'date_range': object_date_range.__str__(),
-                }
-            },
-            'result': {
-                'output_count': len(s3_objects),
-                's3_objects': s3_objects
-            }
-        }, of)
-
-    logger.info(f"{len(s3_objects)} bucket/object names written as JSON to {args.output_filepath}")
+    bucket_regions = regions if args.regions is not None and 0 < len(args.regions) else None
+    # a checkpoint is identified by the arguments as given: the windows they resolve to move with today
+    checkpoint_args = {
+        'profile': args.aws_profile_name,
+        'regions': regions if bucket_regions is not None else None,
+        'bucket_args': {
+            'like_name': args.bucket_like_name,
+            'min_age_days': args.bucket_min_age_days,
+            'max_age_days': args.bucket_max_age_days,
+            'after_date': args.bucket_after_date,
+            'before_date': args.bucket_before_date,
+        },
+        'object_args': {
+            'like_name': args.object_like_name,
+            'key_glob': args.object_key_glob,
+            'case_sensitive': args.object_case_sensitive,
+            'min_age_days': args.object_min_age_days,
+            'max_age_days': args.object_max_age_days,
+            'after_date': args.object_after_date,
+            'before_date': args.object_before_date,
+        }
+    }
+    try:
+        checkpoint = ListingCheckpoint(args.checkpoint_file if args.checkpoint_file is not None else f"{args.output_filepath}.checkpoint", args.checkpoint_interval, checkpoint_args, args.resume, {'bucket_date_range': bucket_date_range, 'object_date_range': object_date_range}) if 0 < args.checkpoint_interval else None
+    except ValueError as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+    if checkpoint is not None:
+        # resumed, the windows are the ones the interrupted run listed
+        bucket_date_range = DateRange.from_dict(checkpoint.resolved['bucket_date_range'])
+        object_date_range = DateRange.from_dict(checkpoint.resolved['object_date_range'])
+    logger.info(f"Listing {args.aws_profile_name} sourced objects where Bucket like {args.bucket_like_name} in {bucket_date_range} and object like {args.object_like_name} in {object_date_range} across regions [{','.join(regions) if bucket_regions is not None else 'all'}]")
+    def collect_bucket_objects(s3_client: S3Client, s3_bucket: S3Bucket, writer: JsonResultWriter, checkpoint: ListingCheckpoint|None):
+        count = 0
+        for s3_object in s3_client.iter_objects_like(s3_bucket, args.object_like_name, object_date_range, key_glob=args.object_key_glob, case_sensitive=args.object_case_sensitive, checkpoint=checkpoint):
+            writer.add(s3_object)
+            count += 1
+        logger.info(f"Collected {count} objects from {s3_bucket.name} in {s3_bucket.region}")
+
+    # ListBuckets is account-wide: enumerate once, then list each bucket with a client in its own region
+    listing_cache = ListingCache(args.cache_dir, args.cache_ttl, args.refresh) if args.cache_dir is not None else None
+    router = S3ClientRouter(get_boto_session_aws_account(args.aws_profile_name, regions[0], args.role_arn), args.no_verify_ssl, max_pool_connections=max(10, args.max_workers), listing_cache=listing_cache)
+    buckets_by_region = router.buckets_like_by_region(args.bucket_like_name, bucket_date_range, bucket_regions)
+
+    # the header of the output names the windows actually listed
+    writer_args = {
+        **checkpoint_args,
+        'bucket_args': {**checkpoint_args['bucket_args'], 'date_range': bucket_date_range.__str__()},
+        'object_args': {**checkpoint_args['object_args'], 'date_range': object_date_range.__str__()}
+    }
+    failures = None
+    try:
+        with JsonResultWriter(args.output_filepath, args.output_format, 's3_objects', writer_args) as writer:
+            if checkpoint is not None:
+                for record in checkpoint.restored_records:
+                    writer.add(S3Object.from_dict(record))
+            with WorkScheduler(args.max_workers) as scheduler:
+                for region, s3_buckets in sorted(buckets_by_region.items()):
+                    s3_client = router.client(region)
+                    for s3_bucket in s3_buckets:
+                        scheduler.submit(
+                            f"list objects in {s3_bucket.name} ({region}) like {args.object_like_name}",
+                            lambda s3_client=s3_client, s3_bucket=s3_bucket: collect_bucket_objects(s3_client, s3_bucket, writer, checkpoint)
+                        )
+                failures = scheduler.wait()
+            if 0 < len(failures):
+                logger.warning(f"{len(failures)} buckets failed listing; their objects are not included")
+            writer.finish({'failures': [failure.__str__() for failure in failures]})
+    finally:
+        if checkpoint is not None:
+            # keep the checkpoint while anything failed, so --resume can pick up where it stopped
+            checkpoint.close(remove=failures is not None and 0 == len(failures))
+    if listing_cache is not None:
+        logger.info(f"{listing_cache}")
+        listing_cache.close()
+
+    logger.info(f"{writer.output_count} bucket/object names written as {args.output_format.upper()} to {args.output_filepath}")
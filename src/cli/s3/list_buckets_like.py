@@ -1,11 +1,13 @@
 import argparse
 from datetime import datetime, timedelta
-from util.json_helpers import json_dump
+from util.json_helpers import JsonResultWriter
 
-from cli.arg_functions import split_flatten_array_arg, datetime_from_string
+from cli.arg_functions import datetime_from_string, positive_byte_count_from_string, positive_float, split_flatten_array_arg
 from util.logging import get_default_logger, initialize_logging
-from s3.s3_client import S3Client, DateRange
-from util.aws_account_api import BotoSessionAwsAccount, call_for_each_region, get_profile_region
+from s3.rate_control import set_rate_limits
+from util.metrics import enable_metrics
+from s3.listing_cache import ListingCache
+from s3.s3_model import DateRange
 
 logger = get_default_logger()
 
@@ -29,11 +31,21 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="AWS profile name"
     )
+    parser.add_argument(
+        "--role-arn",
+        type=str,
+        help="role assumed with the profile's credentials, once for every region",
+    )
+    parser.add_argument(
+        "--credential-cache-dir",
+        type=str,
+        help="directory the assumed role's credentials are kept in until they expire, reused by later runs",
+    )
     parser.add_argument(
         "--regions",
         nargs="+",
         default=None,
-        help="list of regions to search"
+        help="list of regions to search.\nwhen omitted buckets in every region are listed"
     )
 
     parser.add_argument(
@@ -70,12 +82,52 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="full path of file where names will be written",
     )
+    parser.add_argument(
+        "--output-format",
+        type=str.lower,
+        choices=["json", "jsonl"],
+        default="json",
+        help="json: one sorted document written once listing completes.\njsonl: a header record, one compact record per result as it is listed, then a footer record",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="directory of an on-disk cache of listing pages, keyed by account/region/bucket/prefix",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=900,
+        help="seconds a cached listing is answered locally instead of re-listed",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        default=False,
+        help="ignore cached listings, re-list and re-cache them",
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=positive_float,
+        help="maximum requests per second sent to each bucket prefix (the key up to its first /); concurrency\nadapts to S3 throttling whether or not this is given",
+    )
+    parser.add_argument(
+        "--max-bandwidth",
+        type=positive_byte_count_from_string,
+        help="maximum bytes per second sent and received by this program (ie. 50MB)",
+    )
     parser.add_argument(
         "--no-verify-ssl",
         action="store_true",
         default=False,
         help="use no-verify-ssl with aws call",
     )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="write per operation and region request counts, latency percentiles, retries, throttles\nand bytes, with phase timings, as json to this file at exit",
+    )
 
     args = parser.parse_args()
     return args
@@ -83,7 +135,14 @@ def parse_args() -> argparse.Namespace:
 
 def main() -> None:
     args = parse_args()
+    from s3.s3_client_router import S3ClientRouter
+    from util.aws_account_api import enable_assumed_role_cache, get_boto_session_aws_account, get_profile_region
     initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
+    set_rate_limits(args.max_rps, args.max_bandwidth)
+    if args.credential_cache_dir is not None:
+        enable_assumed_role_cache(args.credential_cache_dir)
     regions = split_flatten_array_arg(args.regions) if args.regions is not None and 0 < len(args.regions) else [get_profile_region(args.aws_profile_name)]
     date_range = DateRange()
     if 0 < args.min_age_days:
@@ -99,43 +158,29 @@ def main() -> None:
         if date_range.end is None or args.before_date < date_range.end:
             date_range.end = args.before_date
 
-    logger.info(f"Listing {args.aws_profile_name} sourced buckets where Bucket like {args.like_name} in {date_range} across regions [{','.join(regions)}]")
-
-    s3_buckets = []
-
-    def collect_buckets(session: BotoSessionAwsAccount):
-        try:
-            s3_client = S3Client(session, args.no_verify_ssl)
-        except Exception:
-            logger.exception(f"Unable to instantiate s3 client. {args.aws_profile_name}")
-            return
-        try:
-            s3_region_buckets = s3_client.list_buckets_like(args.like_name, date_range)
-        except Exception:
-            logger.exception(f"list buckets like {args.like_name} region {session.boto_session.region_name}")
-            return
-        s3_buckets.extend(s3_region_buckets)
-        logger.info(f"Collected {len(s3_region_buckets)} buckets in {session.aws_account.region}")
-
-
-
-    call_for_each_region(lambda session: collect_buckets(session), regions, args.aws_profile_name)
-    s3_buckets.sort(reverse=True)
-    with open(args.output_filepath, 'w') as of:
-        json_dump({
-            'datetime': datetime.now().isoformat(),
-            'args': {
-                'profile': args.aws_profile_name,
-                'regions': regions,
-                'bucket_args': {
-                    'like_name': args.like_name,
-                    'date_range': date_range.__str__(),
-                },
-            },
-            'result': {
-                'output_count': len(s3_buckets),
-                's3_buckets': s3_buckets
-            }
-        }, of)
-        
-    logger.info(f"{len(s3_buckets)} bucket names written as JSON to {args.output_filepath}")
+    bucket_regions = regions if args.regions is not None and 0 < len(args.regions) else None
+    logger.info(f"Listing {args.aws_profile_name} sourced buckets where Bucket like {args.like_name} in {date_range} across regions [{','.join(regions) if bucket_regions is not None else 'all'}]")
+
+    # ListBuckets is account-wide: enumerate once and partition by each bucket's own region
+    listing_cache = ListingCache(args.cache_dir, args.cache_ttl, args.refresh) if args.cache_dir is not None else None
+    router = S3ClientRouter(get_boto_session_aws_account(args.aws_profile_name, regions[0], args.role_arn), args.no_verify_ssl, listing_cache=listing_cache)
+    buckets_by_region = router.buckets_like_by_region(args.like_name, date_range, bucket_regions)
+    if listing_cache is not None:
+        logger.info(f"{listing_cache}")
+        listing_cache.close()
+
+    with JsonResultWriter(args.output_filepath, args.output_format, 's3_buckets', {
+        'profile': args.aws_profile_name,
+        'regions': regions if bucket_regions is not None else None,
+        'bucket_args': {
+            'like_name': args.like_name,
+            'date_range': date_range.__str__(),
+        },
+    }) as writer:
+        for region, s3_buckets in sorted(buckets_by_region.items()):
+            for s3_bucket in s3_buckets:
+                writer.add(s3_bucket)
+            logger.info(f"Collected {len(s3_buckets)} buckets in {region}")
+        writer.finish()
+
+    logger.info(f"{writer.output_count} bucket names written as {args.output_format.upper()} to {args.output_filepath}")
@@ -1,11 +1,16 @@
 import argparse
+import sys
 from datetime import datetime, timedelta
-from util.json_helpers import json_dump
+from util.json_helpers import JsonResultWriter
 
-from cli.arg_functions import split_flatten_array_arg, datetime_from_string
+from cli.arg_functions import datetime_from_string, positive_byte_count_from_string, positive_float, split_flatten_array_arg
 from util.logging import get_default_logger, initialize_logging
-from s3.s3_client import S3Client, DateRange
-from util.aws_account_api import BotoSessionAwsAccount, call_for_each_region, get_profile_region
+from s3.rate_control import set_rate_limits
+from util.metrics import enable_metrics
+from s3.listing_cache import ListingCache
+from s3.listing_checkpoint import ListingCheckpoint
+from s3.s3_model import S3Object, DateRange
+from util.work_scheduler import WorkScheduler
 
 logger = get_default_logger()
 
@@ -29,11 +34,21 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="AWS profile name"
     )
+    parser.add_argument(
+        "--role-arn",
+        type=str,
+        help="role assumed with the profile's credentials, once for every region",
+    )
+    parser.add_argument(
+        "--credential-cache-dir",
+        type=str,
+        help="directory the assumed role's credentials are kept in until they expire, reused by later runs",
+    )
     parser.add_argument(
         "--regions",
         nargs="+",
         default=None,
-        help="list of regions to search"
+        help="list of regions to search; the bucket is only listed if its own region is one of them.\nwhen omitted the bucket is listed in whichever region it is in"
     )
     parser.add_argument(
         "--bucket-name",
@@ -45,7 +60,18 @@ def parse_args() -> argparse.Namespace:
         "--like-name",
         type=str,
         required=True,
-        help="skeletal name of objects to list",
+        help="skeletal name of objects to list.\nmatched against the full key when it contains '/', letting its literal prefix be listed server-side",
+    )
+    parser.add_argument(
+        "--key-glob",
+        type=str,
+        help="glob the full key must also match (ie. logs/2025-10/app-*); its literal prefix is listed server-side",
+    )
+    parser.add_argument(
+        "--case-sensitive",
+        action="store_true",
+        default=False,
+        help="match like-name case-sensitively, so prefixes containing letters can be listed server-side",
     )
     parser.add_argument(
         "--min-age-days",
@@ -75,20 +101,105 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="full path of file where bucket/object JSON will be written",
     )
+    parser.add_argument(
+        "--list-shards",
+        type=int,
+        default=1,
+        help="number of key-space partitions of the bucket listed concurrently",
+    )
+    parser.add_argument(
+        "--split-points",
+        nargs="+",
+        default=None,
+        help="keys at which to partition the listing, instead of discovering partitions from '/' common prefixes",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str.lower,
+        choices=["json", "jsonl"],
+        default="json",
+        help="json: one sorted document written once listing completes.\njsonl: a header record, one compact record per result as it is listed, then a footer record",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=10,
+        help="maximum number of regions listed concurrently",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="directory of an on-disk cache of listing pages, keyed by account/region/bucket/prefix",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=900,
+        help="seconds a cached listing is answered locally instead of re-listed",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        default=False,
+        help="ignore cached listings, re-list and re-cache them",
+    )
+    parser.add_argument(
+        "--checkpoint-file",
+        type=str,
+        default=None,
+        help="file the listing position and records emitted so far are checkpointed to.\ndefaults to OUTPUT_FILEPATH.checkpoint, and is removed once the listing completes",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=100,
+        help="number of listed pages between checkpoints, 0 disables checkpointing",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="continue from the last checkpoint of an interrupted run with the same arguments",
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=positive_float,
+        help="maximum requests per second sent to each bucket prefix (the key up to its first /); concurrency\nadapts to S3 throttling whether or not this is given",
+    )
+    parser.add_argument(
+        "--max-bandwidth",
+        type=positive_byte_count_from_string,
+        help="maximum bytes per second sent and received by this program (ie. 50MB)",
+    )
     parser.add_argument(
         "--no-verify-ssl",
         action="store_true",
         default=False,
         help="use no-verify-ssl with aws call",
     )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="write per operation and region request counts, latency percentiles, retries, throttles\nand bytes, with phase timings, as json to this file at exit",
+    )
 
     args = parser.parse_args()
+    if args.resume and args.checkpoint_interval < 1:
+        parser.error("--resume requires a --checkpoint-interval of at least 1")
     return args
 
 
 def main() -> None:
     args = parse_args()
+    from s3.s3_client import S3Client
+    from util.aws_account_api import BotoSessionAwsAccount, call_for_each_region_concurrently, enable_assumed_role_cache, get_boto_session_aws_account, get_profile_region
     initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
+    set_rate_limits(args.max_rps, args.max_bandwidth)
+    if args.credential_cache_dir is not None:
+        enable_assumed_role_cache(args.credential_cache_dir)
     regions = split_flatten_array_arg(args.regions) if args.regions is not None and 0 < len(args.regions) else [get_profile_region(args.aws_profile_name)]
     date_range = DateRange()
     if 0 < args.min_age_days:
@@ -104,53 +215,77 @@ def main() -> None:
         if date_range.end is None or args.before_date < date_range.end:
             date_range.end = args.before_date
     
-    logger.info(f"Listing {args.aws_profile_name} sourced objects where Bucket is {args.bucket_name}  and object like {args.like_name} in {date_range} across regions [{','.join(regions)}]")
-    
-    s3_objects = []
-
-    def collect_objects(session: BotoSessionAwsAccount):
-        try:
-            s3_client = S3Client(session, args.no_verify_ssl)
-        except Exception:
-            logger.exception(f"Unable to instantiate s3 client. {session.boto_session.profile_name}")
-            return
-        try:
-            s3_bucket =  s3_client.get_bucket(args.bucket_name)
-        except Exception:
-            logger.exception(f"get bucket {args.bucket_name} in {session.aws_account.region}")
-            return
-
-        try:
-            s3_region_objects = s3_client.list_objects_like(s3_bucket, args.like_name, date_range)
-        except Exception:
-            logger.exception(f"list objects in {args.bucket_name} ({session.aws_account.region}) like {args.like_name}")
-            return
-        s3_objects.extend(s3_region_objects)
-        logger.info(f"Collected {len(s3_region_objects)} objects from {s3_bucket} in {session.aws_account.region}")
- 
+    # a checkpoint is identified by the arguments as given: the window they resolve to moves with today
+    checkpoint_args = {
+        'profile': args.aws_profile_name,
+        'regions': regions,
+        'bucket_args': {
+            'name': args.bucket_name
+        },
+        'object_args': {
+            'like_name':  args.like_name,
+            'key_glob': args.key_glob,
+            'case_sensitive': args.case_sensitive,
+            'min_age_days': args.min_age_days,
+            'max_age_days': args.max_age_days,
+            'after_date': args.after_date,
+            'before_date': args.before_date,
+        }
+    }
+    try:
+        checkpoint = ListingCheckpoint(args.checkpoint_file if args.checkpoint_file is not None else f"{args.output_filepath}.checkpoint", args.checkpoint_interval, checkpoint_args, args.resume, {'date_range': date_range}) if 0 < args.checkpoint_interval else None
+    except ValueError as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+    if checkpoint is not None:
+        # resumed, the window is the one the interrupted run listed
+        date_range = DateRange.from_dict(checkpoint.resolved['date_range'])
 
-    call_for_each_region(lambda session: collect_objects(session), regions, args.aws_profile_name)
-
-
-    with open(args.output_filepath, 'w') as of:
-        json_dump({
-            'datetime': datetime.now().isoformat(),
-            'args': {
-                'profile': args.aws_profile_name,
-                'regions': regions,
-                'bucket_args': {
-                    'name': args.bucket_name
-                },
-                'object_args': {
-                    'like_name':  args.like_name,
-                    'date_range': date_range.__str__(),
-                }
+    split_points = split_flatten_array_arg(args.split_points) if args.split_points is not None else None
+    listing_cache = ListingCache(args.cache_dir, args.cache_ttl, args.refresh) if args.cache_dir is not None else None
+    try:
+        session = get_boto_session_aws_account(args.aws_profile_name, regions[0], args.role_arn)
+    except Exception:
+        logger.exception("Unable to obtain boto session account. %s", args.aws_profile_name)
+        sys.exit(1)
+    try:
+        s3_bucket = S3Client(session, args.no_verify_ssl).get_bucket(args.bucket_name)
+    except Exception:
+        logger.exception(f"get bucket {args.bucket_name} in {regions[0]}")
+        sys.exit(1)
+    # the bucket lives in exactly one region; list it there, once
+    bucket_regions = [s3_bucket.region] if args.regions is None or 0 == len(args.regions) or s3_bucket.region in regions else []
+    if 0 == len(bucket_regions):
+        logger.warning(f"{s3_bucket} is not in regions [{','.join(regions)}], no objects listed")
+    logger.info(f"Listing {args.aws_profile_name} sourced objects where Bucket is {args.bucket_name}  and object like {args.like_name} in {date_range} across regions [{','.join(bucket_regions)}]")
+    
+    def collect_objects(session: BotoSessionAwsAccount, writer: JsonResultWriter, checkpoint: ListingCheckpoint|None):
+        s3_client = S3Client(session, args.no_verify_ssl, max_pool_connections=max(10, args.list_shards), list_shards=args.list_shards, listing_cache=listing_cache)
+        count = 0
+        for s3_object in s3_client.iter_objects_like(s3_bucket, args.like_name, date_range, key_glob=args.key_glob, case_sensitive=args.case_sensitive, split_points=split_points, checkpoint=checkpoint):
+            writer.add(s3_object)
+            count += 1
+        logger.info(f"Collected {count} objects from {s3_bucket} in {session.aws_account.region}")
 
-            },
-            'result': {
-                'output_count': len(s3_objects),
-                's3_objects': s3_objects
-            }
-        }, of)        
+    # the header of the output names the window actually listed
+    writer_args = {**checkpoint_args, 'object_args': {**checkpoint_args['object_args'], 'date_range': date_range.__str__()}}
+    failures = None
+    try:
+        with JsonResultWriter(args.output_filepath, args.output_format, 's3_objects', writer_args) as writer:
+            if checkpoint is not None:
+                for record in checkpoint.restored_records:
+                    writer.add(S3Object.from_dict(record))
+            with WorkScheduler(args.max_workers) as scheduler:
+                failures = call_for_each_region_concurrently(lambda session: collect_objects(session, writer, checkpoint), bucket_regions, args.aws_profile_name, scheduler, args.role_arn)
+            if 0 < len(failures):
+                logger.warning(f"{len(failures)} regions failed listing; their objects are not included")
+            writer.finish({'failures': [failure.__str__() for failure in failures]})
+    finally:
+        if checkpoint is not None:
+            # keep the checkpoint while anything failed, so --resume can pick up where it stopped
+            checkpoint.close(remove=failures is not None and 0 == len(failures))
+    if listing_cache is not None:
+        logger.info(f"{listing_cache}")
+        listing_cache.close()
 
-    logger.info(f"{len(s3_objects)} bucket/object names written as JSON to {args.output_filepath}")
+    logger.info(f"{writer.output_count} bucket/object names written as {args.output_format.upper()} to {args.output_filepath}")
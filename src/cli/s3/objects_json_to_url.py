@@ -1,8 +1,10 @@
 import argparse
 import os
-from util.json_helpers import json_load, json_dump
+from s3.s3_object_reader import read_newest_s3_objects
+from util.json_helpers import json_dump
 from util.logging import get_default_logger, initialize_logging
-from s3.s3_client import  S3Object, S3URL
+from util.metrics import enable_metrics
+from s3.s3_model import S3Object, S3URL
 
 logger = get_default_logger()
 
@@ -35,7 +37,7 @@ def parse_args() -> argparse.Namespace:
         "--input-filepath",
         type=str,
         required=True,
-        help="full path of file containing bucket/object JSON",
+        help="full path of file containing bucket/object JSON or JSONL",
     )
     parser.add_argument(
         "--s3-url-template",
@@ -43,6 +45,11 @@ def parse_args() -> argparse.Namespace:
         default=S3URL.default_template(),
         help=S3URL.template_help()
     )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="write per operation and region request counts, latency percentiles, retries, throttles\nand bytes, with phase timings, as json to this file at exit",
+    )
 
     args = parser.parse_args()
     return args
@@ -51,31 +58,23 @@ def parse_args() -> argparse.Namespace:
 def main() -> None:
     args = parse_args()
     initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
     
     url_formatter = S3URL(args.s3_url_template)
     s3_objects = []
+    input_count = 0
     s3_url_datetime = None
     output_dirpath = os.path.dirname(args.input_filepath)
     logger.info(f"Loading S3 Object definitions from {args.input_filepath}")
     try:
         with open(args.input_filepath, 'r') as inF:
-            data = json_load(inF)
-            if 'datetime' in data:
-                s3_url_datetime = data['datetime']
-            if 'result' in data:
-                data = data['result']
-                logger.info(f"1) result")
-            if 's3_objects' in data:
-                data = data['s3_objects']
-            if isinstance(data, list):
-                s3_objects = [S3Object.from_dict(o) for o in data]
-                s3_objects.sort(reverse=True)
-                logger.debug(f"Loaded {len(s3_objects)} S3 Objects")
-            else:
-                raise TypeError(f"Data not type list. {args.input_filepath}")
+            s3_objects, input_count, metadata = read_newest_s3_objects(inF, args.top_count)
+            s3_url_datetime = metadata.get('datetime')
+            logger.debug(f"Loaded newest {len(s3_objects)} of {input_count} S3 Objects")
 
         url_count = min(len(s3_objects), args.top_count) if args.top_count is not None else len(s3_objects)            
-        logger.info(f"converting top {url_count}/{len(s3_objects)} S3 Objects to url-form: {args.s3_url_template}")
+        logger.info(f"converting top {url_count}/{input_count} S3 Objects to url-form: {args.s3_url_template}")
         s3_urls = []
         for i in range(url_count):
             s3_object = s3_objects[i]
@@ -84,7 +83,7 @@ def main() -> None:
                 'metadata': s3_object.__str__()
             })
         output_filename = os.path.splitext(os.path.basename(args.input_filepath))
-        output_filename = f"{output_filename[0]}-urls{output_filename[1]}"
+        output_filename = f"{output_filename[0]}-urls{output_filename[1] if output_filename[1] != '.jsonl' else '.json'}"
         output_filepath = os.path.join(output_dirpath, output_filename)
 
         logger.debug(f"Writing {len(s3_urls)} urls to {output_filepath}")
@@ -97,7 +96,7 @@ def main() -> None:
                     's3_url_template': args.s3_url_template
                 },
                 'result': {
-                    'input_count': len(s3_objects),
+                    'input_count': input_count,
                     'output_count': len(s3_urls),
                     's3_urls': s3_urls
                 }
@@ -0,0 +1,131 @@
+import argparse
+import os
+import sys
+import time
+
+from cli.arg_functions import byte_count_from_string, positive_byte_count_from_string, positive_float
+from util.logging import get_default_logger, initialize_logging
+from s3.rate_control import set_rate_limits
+from util.metrics import enable_metrics, get_metrics
+
+logger = get_default_logger()
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=f"Upload a file or stdin to one object as concurrent parts.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+
+    parser.add_argument(
+        "--log-level",
+        type=str.lower,
+        choices=["debug", "info", "warning", "error", "critical"],
+        default="info",
+        help="The level of logging output by this program",
+    )
+    parser.add_argument(
+        "--aws-profile-name",
+        type=str.lower,
+        required=True,
+        help="AWS profile name"
+    )
+    parser.add_argument(
+        "--bucket",
+        type=str,
+        required=True,
+        help="bucket to upload into",
+    )
+    parser.add_argument(
+        "--key",
+        type=str,
+        required=True,
+        help="key of the object to upload",
+    )
+    parser.add_argument(
+        "--input-filepath",
+        type=str,
+        default='-',
+        help="file to upload, read through a memory map; - (default) streams stdin of unknown length",
+    )
+    parser.add_argument(
+        "--part-size",
+        type=byte_count_from_string,
+        default='16MB',
+        help="size of each part (ie. 16MB, at least 5MB); grows for files that would need over 10000 parts\nand doubles every 1000 parts of stdin",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=10,
+        help="maximum number of parts uploaded concurrently; stdin holds at most this many plus one parts in memory",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="maximum number of attempts to upload each part",
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=positive_float,
+        help="maximum requests per second sent to each bucket prefix (the key up to its first /); concurrency\nadapts to S3 throttling whether or not this is given",
+    )
+    parser.add_argument(
+        "--max-bandwidth",
+        type=positive_byte_count_from_string,
+        help="maximum bytes per second sent and received by this program (ie. 50MB)",
+    )
+    parser.add_argument(
+        "--no-verify-ssl",
+        action="store_true",
+        default=False,
+        help="use no-verify-ssl with aws call",
+    )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="write per operation and region request counts, latency percentiles, retries, throttles\nand bytes, with phase timings, as json to this file at exit",
+    )
+
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    from s3.multipart_upload import MultipartUploader
+    from s3.s3_client import S3Client
+    from s3.s3_transfer import format_byte_rate
+    from util.aws_account_api import get_boto_session_aws_account
+    initialize_logging(args.log_level)
+    if args.metrics_out is not None:
+        enable_metrics(args.metrics_out)
+    set_rate_limits(args.max_rps, args.max_bandwidth)
+
+    try:
+        boto_session_account = get_boto_session_aws_account(args.aws_profile_name)
+    except Exception:
+        logger.exception("Unable to obtain boto session account. %s", args.aws_profile_name)
+        sys.exit(1)
+
+    try:
+        s3_client = S3Client(boto_session_account, args.no_verify_ssl, max_pool_connections=max(10, args.max_workers))
+    except Exception:
+        logger.exception("Unable to instantiate s3 client. %s", args.aws_profile_name)
+        sys.exit(1)
+
+    if args.input_filepath != '-' and not(os.path.isfile(args.input_filepath)):
+        logger.error("input filepath %s is not a file", args.input_filepath)
+        sys.exit(1)
+
+    uploader = MultipartUploader(s3_client, args.part_size, args.max_workers, args.max_attempts)
+    source = 'stdin' if args.input_filepath == '-' else args.input_filepath
+    started = time.monotonic()
+    try:
+        with get_metrics().phase('transfer'):
+            if args.input_filepath == '-':
+                byte_count = uploader.upload_stream(args.bucket, args.key, sys.stdin.buffer)
+            else:
+                byte_count = uploader.upload_file(args.bucket, args.key, args.input_filepath)
+    except Exception:
+        logger.exception("upload %s to s3://%s/%s", source, args.bucket, args.key)
+        sys.exit(1)
+    elapsed_s = max(time.monotonic() - started, 1e-9)
+    logger.info("uploaded %d bytes from %s to s3://%s/%s (%s)", byte_count, source, args.bucket, args.key, format_byte_rate(byte_count / elapsed_s))
@@ -0,0 +1,124 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+import math
+import threading
+import time
+from typing import Callable, Deque
+from util.logging import get_default_logger
+from util.metrics import get_metrics
+
+
+def _submit(call: Callable[[], dict]) -> Future:
+    # a daemon thread each, so a request left behind by the one that won never holds up exit
+    future = Future()
+    def run() -> None:
+        if not(future.set_running_or_notify_cancel()):
+            return
+        try:
+            future.set_result(call())
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _discard(future: Future) -> None:
+    if future.exception() is None and 'Body' in future.result():
+        future.result()['Body'].close()
+
+
+# shared by every S3Client in the process: once enabled, a GET whose response has not started within
+# the given percentile of the last WINDOW GETs' time to first byte is sent a second time, and whichever
+# answers first is used. hedges are held to budget (a fraction) of all GETs, and none are sent until
+# MIN_SAMPLES GETs have been timed. every GET is timed to completion, hedges and losers included, so
+# hedging does not pull the percentile down
+class Hedger:
+    WINDOW = 1000
+    MIN_SAMPLES = 20
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.percentile = 95.0
+        self.budget = 0.05
+        self.__lock = threading.Lock()
+        self.__latencies: Deque[float] = deque(maxlen=self.WINDOW)
+        self.__threshold_s: float|None = None
+        self.__sample_count = 0
+        self.__get_count = 0
+        self.__hedge_count = 0
+
+    def enable(self, percentile: float, budget: float) -> None:
+        if not(0 < percentile < 100) or not(0 <= budget <= 1):
+            raise ValueError(f"hedging needs a percentile between 0 and 100 and a budget from 0 to 1. Got: {percentile}, {budget}")
+        self.percentile = percentile
+        self.budget = budget
+        self.enabled = True
+
+    @property
+    def threshold_s(self) -> float|None:
+        return self.__threshold_s
+
+    def __timed(self, call: Callable[[], dict]) -> Callable[[], dict]:
+        def timed_call() -> dict:
+            started = time.perf_counter()
+            response = call()
+            elapsed_s = time.perf_counter() - started
+            with self.__lock:
+                self.__latencies.append(elapsed_s)
+                self.__sample_count += 1
+                # re-sorting the window every 10th sample keeps the threshold current enough
+                if self.MIN_SAMPLES <= self.__sample_count and (self.__threshold_s is None or 0 == self.__sample_count % 10):
+                    window_count = len(self.__latencies)
+                    self.__threshold_s = sorted(self.__latencies)[max(0, math.ceil(window_count * self.percentile / 100) - 1)]
+            return response
+        return timed_call
+
+    def __take_hedge(self) -> bool:
+        with self.__lock:
+            if self.budget * self.__get_count < self.__hedge_count + 1:
+                return False
+            self.__hedge_count += 1
+            return True
+
+    # call makes the GET and returns its response; a response that loses has its Body closed
+    def get(self, call: Callable[[], dict]) -> dict:
+        timed_call = self.__timed(call)
+        with self.__lock:
+            self.__get_count += 1
+            threshold_s = self.__threshold_s
+        primary = _submit(timed_call)
+        if threshold_s is None or 0 < len(wait([primary], timeout=threshold_s).done):
+            return primary.result()
+        metrics = get_metrics()
+        if not(self.__take_hedge()):
+            metrics.count('hedge_over_budget')
+            return primary.result()
+        metrics.count('hedge_sent')
+        get_default_logger().debug(f"GET not answered within p{self.percentile:g} {threshold_s * 1000:.1f}ms, hedging")
+        hedge = _submit(timed_call)
+        done, pending = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        winner = next((future for future in [primary, hedge] if future in done and future.exception() is None), None)
+        if winner is None and 0 < len(pending):
+            # the first to finish failed; the other is the only one left to answer
+            winner = pending.pop()
+            wait([winner])
+        if winner is None or winner.exception() is not None:
+            metrics.count('hedge_failed')
+            return primary.result()
+        loser = hedge if winner is primary else primary
+        loser.add_done_callback(_discard)
+        metrics.count('hedge_won' if winner is hedge else 'hedge_lost')
+        return winner.result()
+
+
+_hedger = Hedger()
+
+
+def get_hedger() -> Hedger:
+    return _hedger
+
+
+# hedges every S3Client GET from here on
+def enable_hedging(percentile: float, budget: float) -> Hedger:
+    _hedger.enable(percentile, budget)
+    return _hedger
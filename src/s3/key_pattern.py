@@ -0,0 +1,217 @@
+import fnmatch
+import re
+from typing import List, Tuple
+
+_REGEX_META = set('.^$*+?{}[]\\|()')
+_GLOB_META = set('*?[')
+_MAX_PREFIXES = 64
+_REPEAT = re.compile(r'\{(\d*)(,\d*)?\}')
+
+
+def _skip_class(pattern: str, i: int) -> int:
+    # i indexes '['; returns index just past the closing ']'
+    j = i + 1
+    if j < len(pattern) and pattern[j] == '^':
+        j += 1
+    if j < len(pattern) and pattern[j] == ']':
+        j += 1
+    while j < len(pattern) and pattern[j] != ']':
+        j += 2 if pattern[j] == '\\' else 1
+    return j + 1
+
+
+def _group_end(pattern: str, i: int) -> int | None:
+    # i indexes '('; returns index of the matching ')'
+    depth = 0
+    j = i
+    while j < len(pattern):
+        c = pattern[j]
+        if c == '\\':
+            j += 2
+            continue
+        if c == '[':
+            j = _skip_class(pattern, j)
+            continue
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                return j
+        j += 1
+    return None
+
+
+def _split_alternation(pattern: str) -> List[str]:
+    branches: List[str] = []
+    depth = 0
+    start = 0
+    j = 0
+    while j < len(pattern):
+        c = pattern[j]
+        if c == '\\':
+            j += 2
+            continue
+        if c == '[':
+            j = _skip_class(pattern, j)
+            continue
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            branches.append(pattern[start:j])
+            start = j + 1
+        j += 1
+    branches.append(pattern[start:])
+    return branches
+
+
+def _quantifier(pattern: str, i: int) -> Tuple[str | None, int]:
+    # returns ('optional'|'required'|None, index past the quantifier)
+    if len(pattern) <= i:
+        return None, i
+    c = pattern[i]
+    if c in '*?':
+        return 'optional', i + 1
+    if c == '+':
+        return 'required', i + 1
+    if c == '{':
+        repeat = _REPEAT.match(pattern, i)
+        if repeat is not None:
+            minimum = int(repeat.group(1)) if 0 < len(repeat.group(1)) else 0
+            return ('optional' if minimum == 0 else 'required'), repeat.end()
+    return None, i
+
+
+def _branch_prefixes(branch: str) -> Tuple[List[str], bool]:
+    # returns the literal prefixes every match of branch starts with and whether
+    # those prefixes are the whole of what branch can match
+    prefixes = ['']
+    i = 0
+    while i < len(branch):
+        c = branch[i]
+        if c == '^' and i == 0:
+            i += 1
+            continue
+        if c == '(':
+            end = _group_end(branch, i)
+            if end is None:
+                return prefixes, False
+            inner = branch[i + 1:end]
+            if inner.startswith('?:'):
+                inner = inner[2:]
+            elif inner.startswith('?'):
+                return prefixes, False
+            quantifier, i = _quantifier(branch, end + 1)
+            if quantifier == 'optional':
+                return prefixes, False
+            inner_prefixes, inner_complete = _pattern_prefixes(inner)
+            if _MAX_PREFIXES < len(prefixes) * len(inner_prefixes):
+                return prefixes, False
+            prefixes = [prefix + inner_prefix for prefix in prefixes for inner_prefix in inner_prefixes]
+            if quantifier == 'required' or not(inner_complete):
+                return prefixes, False
+            continue
+        if c == '\\':
+            if len(branch) <= i + 1 or branch[i + 1].isalnum():
+                return prefixes, False
+            literal = branch[i + 1]
+            i += 2
+        elif c in _REGEX_META:
+            return prefixes, False
+        else:
+            literal = c
+            i += 1
+        quantifier, i = _quantifier(branch, i)
+        if quantifier == 'optional':
+            return prefixes, False
+        prefixes = [prefix + literal for prefix in prefixes]
+        if quantifier == 'required':
+            return prefixes, False
+    return prefixes, True
+
+
+def _pattern_prefixes(pattern: str) -> Tuple[List[str], bool]:
+    result: List[str] = []
+    complete = True
+    for branch in _split_alternation(pattern):
+        prefixes, branch_complete = _branch_prefixes(branch)
+        result.extend(prefixes)
+        complete = complete and branch_complete
+    return result, complete
+
+
+def _case_insensitive_prefix(prefix: str) -> str:
+    for i, c in enumerate(prefix):
+        if c.lower() != c.upper():
+            return prefix[:i]
+    return prefix
+
+
+def minimal_prefixes(prefixes: List[str]) -> List[str]:
+    result: List[str] = []
+    for prefix in sorted(set(prefixes)):
+        if 0 < len(result) and prefix.startswith(result[-1]):
+            continue
+        result.append(prefix)
+    return result if 0 < len(result) else ['']
+
+
+def intersect_prefixes(left: List[str], right: List[str]) -> List[str]:
+    result: List[str] = []
+    for left_prefix in left:
+        for right_prefix in right:
+            if left_prefix.startswith(right_prefix):
+                result.append(left_prefix)
+            elif right_prefix.startswith(left_prefix):
+                result.append(right_prefix)
+    return minimal_prefixes(result) if 0 < len(result) else []
+
+
+def regex_literal_prefixes(pattern: str, ignore_case: bool = True) -> List[str]:
+    prefixes, _ = _pattern_prefixes(pattern)
+    if ignore_case:
+        prefixes = [_case_insensitive_prefix(prefix) for prefix in prefixes]
+    return minimal_prefixes(prefixes)
+
+
+def glob_literal_prefix(key_glob: str) -> str:
+    for i, c in enumerate(key_glob):
+        if c in _GLOB_META:
+            return key_glob[:i]
+    return key_glob
+
+
+class KeyPattern:
+    def __init__(self, description: str, prefixes: List[str], regex: re.Pattern | None, match_full_key: bool, exact_name: str | None = None):
+        self.description = description
+        self.prefixes = prefixes
+        self.__regex = regex
+        self.__match_full_key = match_full_key
+        self.__exact_name = exact_name
+
+    def __str__(self) -> str:
+        return f"KeyPattern[{self.description},prefixes={self.prefixes}]"
+
+    def matches(self, key: str) -> bool:
+        name = key if self.__match_full_key else key[key.rfind('/') + 1:]
+        if self.__exact_name is not None:
+            return name == self.__exact_name
+        return self.__regex.match(name) is not None
+
+    # like_name is matched against the object name (last key segment), or, when it contains
+    # a '/', against the full key, in which case its literal prefixes are listed server-side
+    @staticmethod
+    def from_like_name(like_name: str, exact_name_match: bool = False, case_sensitive: bool = False) -> "KeyPattern":
+        match_full_key = '/' in like_name
+        description = f"{'exactly' if exact_name_match else 'like'} {like_name}"
+        if exact_name_match:
+            return KeyPattern(description, [like_name] if match_full_key else [''], None, match_full_key, like_name)
+        regex = re.compile(like_name, 0 if case_sensitive else re.IGNORECASE)
+        prefixes = regex_literal_prefixes(like_name, not(case_sensitive)) if match_full_key else ['']
+        return KeyPattern(description, prefixes, regex, match_full_key)
+
+    @staticmethod
+    def from_glob(key_glob: str) -> "KeyPattern":
+        return KeyPattern(f"glob {key_glob}", [glob_literal_prefix(key_glob)], re.compile(fnmatch.translate(key_glob)), True)
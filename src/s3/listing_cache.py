@@ -0,0 +1,116 @@
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Iterable, Iterator
+from util.json_helpers import to_dict_value
+from util.logging import get_default_logger
+
+_DATETIME_FIELDS = ('LastModified', 'CreationDate')
+
+
+def _restore_datetimes(dict_o: dict) -> dict:
+    for field in _DATETIME_FIELDS:
+        if isinstance(dict_o.get(field), str):
+            dict_o[field] = datetime.fromisoformat(dict_o[field])
+    return dict_o
+
+
+# on-disk cache of raw list_buckets/list_objects_v2 pages. a listing is only stored once
+# it has been paged through to the end, and is answered locally until it is ttl_s old
+class ListingCache:
+    HIT_BATCH_PAGES = 16
+
+    def __init__(self, cache_dirpath: str, ttl_s: int, refresh: bool = False) -> None:
+        os.makedirs(cache_dirpath, exist_ok=True)
+        self.filepath = os.path.join(cache_dirpath, 'listing-cache.sqlite3')
+        self.ttl_s = ttl_s
+        self.refresh = refresh
+        self.hit_count = 0
+        self.miss_count = 0
+        self.stored_page_count = 0
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(self.filepath, timeout=30, check_same_thread=False)
+        with self.__lock:
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.execute('CREATE TABLE IF NOT EXISTS listings (cache_key TEXT PRIMARY KEY, created REAL NOT NULL)')
+            self.__connection.execute('CREATE TABLE IF NOT EXISTS pages (cache_key TEXT NOT NULL, page_index INTEGER NOT NULL, page TEXT NOT NULL, PRIMARY KEY (cache_key, page_index))')
+            self.__connection.execute('DELETE FROM listings WHERE created < ?', (time.time() - ttl_s,))
+            self.__connection.execute('DELETE FROM pages WHERE cache_key NOT IN (SELECT cache_key FROM listings)')
+            self.__connection.commit()
+        get_default_logger().debug(f"Opened listing cache {self.filepath} ttl={ttl_s}s refresh={refresh}")
+
+    def __str__(self) -> str:
+        return f"ListingCache[hits={self.hit_count},misses={self.miss_count},stored-pages={self.stored_page_count},ttl={self.ttl_s}s,file={self.filepath}]"
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__connection.close()
+
+    @staticmethod
+    def key(account_id: str, region: str, bucket: str, prefix: str, **params) -> str:
+        key = f"{account_id}/{region}/{bucket}/{prefix}"
+        extras = '&'.join([f"{name}={value}" for name, value in sorted(params.items()) if value is not None])
+        return f"{key}?{extras}" if 0 < len(extras) else key
+
+    # a hit is read HIT_BATCH_PAGES pages at a time, letting go of the lock between batches, so
+    # memory stays bounded by the batch rather than the listing
+    def __cached_pages(self, cache_key: str, created: float) -> Iterator[dict]:
+        page_index = 0
+        while True:
+            with self.__lock:
+                # a listing replaced or purged since the hit can't be read on from where it was
+                row = self.__connection.execute('SELECT created FROM listings WHERE cache_key = ?', (cache_key,)).fetchone()
+                if row is None or row[0] != created:
+                    raise RuntimeError(f"listing cache entry {cache_key} was replaced while being read")
+                batch = self.__connection.execute('SELECT page_index, page FROM pages WHERE cache_key = ? AND ? <= page_index ORDER BY page_index LIMIT ?', (cache_key, page_index, self.HIT_BATCH_PAGES)).fetchall()
+            for page_index, page in batch:
+                yield json.loads(page, object_hook=_restore_datetimes)
+            if len(batch) < self.HIT_BATCH_PAGES:
+                return
+            page_index += 1
+
+    def pages(self, cache_key: str, list_pages: Callable[[], Iterable[dict]]) -> Iterator[dict]:
+        logger = get_default_logger()
+        if not(self.refresh):
+            with self.__lock:
+                row = self.__connection.execute('SELECT created FROM listings WHERE cache_key = ?', (cache_key,)).fetchone()
+                is_hit = row is not None and time.time() - row[0] <= self.ttl_s
+                if is_hit:
+                    self.hit_count += 1
+            if is_hit:
+                logger.debug(f"listing cache hit {cache_key}")
+                yield from self.__cached_pages(cache_key, row[0])
+                return
+
+        with self.__lock:
+            self.miss_count += 1
+        logger.debug(f"listing cache miss {cache_key}")
+        # pages are staged under a private key and swapped in once the listing completes
+        pending_key = f"{cache_key}#{uuid.uuid4().hex}"
+        page_count = 0
+        completed = False
+        try:
+            for page in list_pages():
+                page = {name: value for name, value in page.items() if name != 'ResponseMetadata'}
+                with self.__lock:
+                    self.__connection.execute('INSERT INTO pages (cache_key, page_index, page) VALUES (?, ?, ?)', (pending_key, page_count, json.dumps(page, default=to_dict_value)))
+                    self.__connection.commit()
+                page_count += 1
+                yield page
+            completed = True
+        finally:
+            with self.__lock:
+                self.__connection.execute('DELETE FROM listings WHERE cache_key = ?', (cache_key,))
+                if completed:
+                    self.__connection.execute('DELETE FROM pages WHERE cache_key = ?', (cache_key,))
+                    # another process opening the cache may have purged the staged pages
+                    if self.__connection.execute('UPDATE pages SET cache_key = ? WHERE cache_key = ?', (cache_key, pending_key)).rowcount == page_count:
+                        self.__connection.execute('INSERT INTO listings (cache_key, created) VALUES (?, ?)', (cache_key, time.time()))
+                        self.stored_page_count += page_count
+                else:
+                    self.__connection.execute('DELETE FROM pages WHERE cache_key = ?', (pending_key,))
+                self.__connection.commit()
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from typing import Dict, List
+from util.json_helpers import json_dumps_line
+from util.logging import get_default_logger
+
+
+# append-only jsonl state of an in-progress listing: an {'args'} line, then {'record'} lines for
+# everything emitted, with a {'checkpoint'} line recording, per listing, the last key whose page
+# was fully emitted. records after the last checkpoint line are re-listed on resume.
+# resolved holds what the first run derived from args at its start (a date window relative to
+# today); a resumed run is handed back the first run's values rather than deriving them again
+class ListingCheckpoint:
+    def __init__(self, filepath: str, interval_pages: int, args: dict, resume: bool = False, resolved: dict|None = None) -> None:
+        logger = get_default_logger()
+        self.filepath = filepath
+        self.resolved: dict = json.loads(json_dumps_line(resolved if resolved is not None else {}))
+        self.restored_records: List[dict] = []
+        self.__interval_pages = max(1, interval_pages)
+        self.__lock = threading.Lock()
+        self.__positions: Dict[str, str] = {}
+        self.__completed: set = set()
+        self.__pending_records: List[str] = []
+        self.__pending_page_count = 0
+        self.__record_count = 0
+        if resume and os.path.isfile(filepath):
+            self.__load(args)
+            logger.info(f"Resuming from {filepath}: {len(self.restored_records)} records, {len(self.__completed)} completed and {len(self.__positions)} partial listings")
+        elif resume:
+            logger.warning(f"No checkpoint {filepath} to resume from, listing from the start")
+        # rewrite rather than append, dropping any records written after the last checkpoint line
+        temp_filepath = f"{filepath}.tmp"
+        with open(temp_filepath, 'w') as of:
+            of.write(json_dumps_line({'args': args, 'resolved': self.resolved}) + '\n')
+            for record in self.restored_records:
+                of.write(json_dumps_line({'record': record}) + '\n')
+            self.__record_count = len(self.restored_records)
+            of.write(self.__checkpoint_line() + '\n')
+        os.replace(temp_filepath, filepath)
+        self.__fp = open(filepath, 'a')
+
+    def __enter__(self) -> "ListingCheckpoint":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    # a checkpoint of another query would mix its records into this one's output, so it is refused
+    def __load(self, args: dict) -> None:
+        records: List[dict] = []
+        with open(self.filepath, 'r') as inF:
+            for line in inF:
+                try:
+                    state = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by the interruption
+                    break
+                if 'args' in state and state['args'] != json.loads(json_dumps_line(args)):
+                    raise ValueError(f"{self.filepath} was written for {state['args']}, not {args}. Resume with the same arguments, or remove it or choose another --checkpoint-file to list from the start")
+                elif 'args' in state:
+                    self.resolved = state.get('resolved', self.resolved)
+                elif 'record' in state:
+                    records.append(state['record'])
+                elif 'checkpoint' in state:
+                    self.restored_records.extend(records)
+                    records = []
+                    self.__positions = dict(state['checkpoint']['positions'])
+                    self.__completed = set(state['checkpoint']['completed'])
+
+    def __checkpoint_line(self) -> str:
+        return json_dumps_line({'checkpoint': {
+            'record_count': self.__record_count,
+            'positions': self.__positions,
+            'completed': sorted(self.__completed)
+        }})
+
+    @staticmethod
+    def key(bucket: str, key_prefix: str) -> str:
+        return f"{bucket}/{key_prefix}"
+
+    def is_completed(self, listing_key: str) -> bool:
+        with self.__lock:
+            return listing_key in self.__completed
+
+    def start_after(self, listing_key: str) -> str|None:
+        with self.__lock:
+            return self.__positions.get(listing_key)
+
+    # called once every record of a page up to last_key has been emitted
+    def page_done(self, listing_key: str, last_key: str, records: List) -> None:
+        lines = [json_dumps_line({'record': record}) for record in records]
+        with self.__lock:
+            self.__pending_records.extend(lines)
+            self.__positions[listing_key] = last_key
+            self.__pending_page_count += 1
+            if self.__interval_pages <= self.__pending_page_count:
+                self.__checkpoint()
+
+    def listing_done(self, listing_key: str) -> None:
+        with self.__lock:
+            self.__positions.pop(listing_key, None)
+            self.__completed.add(listing_key)
+            self.__checkpoint()
+
+    def checkpoint(self) -> None:
+        with self.__lock:
+            self.__checkpoint()
+
+    def __checkpoint(self) -> None:
+        if self.__fp is None:
+            return
+        for line in self.__pending_records:
+            self.__fp.write(line + '\n')
+        self.__record_count += len(self.__pending_records)
+        self.__pending_records = []
+        self.__pending_page_count = 0
+        self.__fp.write(self.__checkpoint_line() + '\n')
+        self.__fp.flush()
+        os.fsync(self.__fp.fileno())
+
+    # remove once the listing it protects has been written out in full
+    def close(self, remove: bool = False) -> None:
+        with self.__lock:
+            if self.__fp is None:
+                return
+            self.__checkpoint()
+            self.__fp.close()
+            self.__fp = None
+        if remove:
+            os.remove(self.filepath)
+            get_default_logger().debug(f"Removed checkpoint {self.filepath}")
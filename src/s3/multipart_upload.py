@@ -0,0 +1,194 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_EXCEPTION
+import mmap
+import os
+import threading
+import time
+from typing import BinaryIO, Callable, List
+from s3.s3_client import S3Client
+from util.logging import get_default_logger
+
+# S3 rejects parts (other than the last) below 5MB, and uploads of more than 10000 parts
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_COUNT = 10000
+# streams of unknown length double their part size every this many parts
+_PART_SIZE_DOUBLING_INTERVAL = 1000
+
+
+class _BufferReader:
+    # read-only file object over a buffer, handing out slices rather than copies. botocore
+    # seeks it back to compute checksums and to resend the part on a retried request
+    def __init__(self, buffer) -> None:
+        self.__view = memoryview(buffer)
+        self.__position = 0
+
+    def __len__(self) -> int:
+        return len(self.__view)
+
+    def read(self, size: int = -1) -> memoryview:
+        end = len(self.__view) if size is None or size < 0 else min(len(self.__view), self.__position + size)
+        data = self.__view[self.__position:end]
+        self.__position = end
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.__position, os.SEEK_END: len(self.__view)}[whence]
+        self.__position = max(0, min(len(self.__view), base + offset))
+        return self.__position
+
+    def tell(self) -> int:
+        return self.__position
+
+    def seekable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+
+class MultipartUploader:
+    # uploads a file as concurrent parts read straight out of a memory map, or a stream of unknown
+    # length (stdin, a pipe) through at most max_workers + 1 part buffers. each part is retried on
+    # its own; when one fails for good the upload is aborted so no orphaned parts are billed
+    def __init__(self, s3_client: S3Client, part_size: int = 16 * 1024 * 1024, max_workers: int = 10, max_attempts: int = 3, retry_delay_s: float = 0.5) -> None:
+        logger = get_default_logger()
+        if part_size < MIN_PART_SIZE:
+            logger.warning(f"part size {part_size} is below the S3 minimum, using {MIN_PART_SIZE}")
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.__s3_client = s3_client
+        self.__max_workers = max(1, max_workers)
+        self.__max_attempts = max(1, max_attempts)
+        self.__retry_delay_s = retry_delay_s
+
+    def __with_retries(self, description: str, call: Callable[[], str]) -> str:
+        logger = get_default_logger()
+        for attempt in range(1, self.__max_attempts + 1):
+            try:
+                return call()
+            except Exception:
+                if attempt == self.__max_attempts:
+                    raise
+                logger.warning(f"Failed {description} (attempt {attempt}/{self.__max_attempts}), retrying")
+                time.sleep(self.__retry_delay_s * (2 ** (attempt - 1)))
+
+    def __upload_part(self, bucket: str, key: str, upload_id: str, part_number: int, buffer) -> str:
+        return self.__with_retries(
+            f"part {part_number} of s3://{bucket}/{key}",
+            lambda: self.__s3_client.upload_part(bucket, key, upload_id, part_number, _BufferReader(buffer))
+        )
+
+    def __put(self, bucket: str, key: str, buffer) -> int:
+        self.__with_retries(f"put of s3://{bucket}/{key}", lambda: self.__s3_client.put_object(bucket, key, _BufferReader(buffer)))
+        get_default_logger().debug(f"Uploaded {len(buffer)} bytes to s3://{bucket}/{key} in a single put")
+        return len(buffer)
+
+    def __complete(self, bucket: str, key: str, upload_id: str, futures: List[Future]) -> None:
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                raise future.exception()
+        etag = self.__s3_client.complete_multipart_upload(bucket, key, upload_id, [future.result() for future in futures])
+        get_default_logger().debug(f"Completed s3://{bucket}/{key} as {len(futures)} parts, ETag {etag}")
+
+    def __abort(self, bucket: str, key: str, upload_id: str) -> None:
+        logger = get_default_logger()
+        try:
+            self.__s3_client.abort_multipart_upload(bucket, key, upload_id)
+            logger.warning(f"Aborted multipart upload of s3://{bucket}/{key}")
+        except Exception as e:
+            logger.error(f"Unable to abort multipart upload {upload_id} of s3://{bucket}/{key}, its parts remain until a lifecycle rule removes them: {e}")
+
+    def upload_file(self, bucket: str, key: str, input_filepath: str) -> int:
+        size = os.path.getsize(input_filepath)
+        if size == 0:
+            return self.__put(bucket, key, b'')
+        part_size = max(self.part_size, -(-size // MAX_PART_COUNT))
+        with open(input_filepath, 'rb') as fp:
+            file_map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(file_map)
+            try:
+                if size <= part_size:
+                    return self.__put(bucket, key, view)
+                upload_id = self.__s3_client.create_multipart_upload(bucket, key)
+                futures: List[Future] = []
+                try:
+                    with ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix='aws-tools-part') as executor:
+                        try:
+                            for part_number, offset in enumerate(range(0, size, part_size), start=1):
+                                futures.append(executor.submit(self.__upload_part, bucket, key, upload_id, part_number, view[offset:offset + part_size]))
+                            self.__complete(bucket, key, upload_id, futures)
+                        except BaseException:
+                            for future in futures:
+                                future.cancel()
+                            raise
+                except BaseException:
+                    self.__abort(bucket, key, upload_id)
+                    raise
+            finally:
+                view.release()
+                try:
+                    file_map.close()
+                except BufferError:
+                    # a failed part's traceback still holds its slice, the map goes with it
+                    get_default_logger().debug(f"{input_filepath} stays mapped until its part slices are released")
+        get_default_logger().debug(f"Uploaded {input_filepath} ({size} bytes) to s3://{bucket}/{key} as parts of {part_size} bytes")
+        return size
+
+    @staticmethod
+    def __read_part(readable: BinaryIO, part_size: int) -> bytearray:
+        # pipes hand back short reads, so keep reading until the part is full or the stream ends
+        buffer = bytearray(part_size)
+        view = memoryview(buffer)
+        filled = 0
+        while filled < part_size:
+            count = readable.readinto(view[filled:])
+            if not(count):
+                break
+            filled += count
+        view.release()
+        if filled < part_size:
+            del buffer[filled:]
+        return buffer
+
+    def upload_stream(self, bucket: str, key: str, readable: BinaryIO) -> int:
+        logger = get_default_logger()
+        part_size = self.part_size
+        buffer = self.__read_part(readable, part_size)
+        if len(buffer) < part_size:
+            return self.__put(bucket, key, buffer)
+
+        upload_id = self.__s3_client.create_multipart_upload(bucket, key)
+        futures: List[Future] = []
+        byte_count = 0
+        # a buffer is only read into once the upload of an earlier one has finished with it
+        buffer_slots = threading.BoundedSemaphore(self.__max_workers + 1)
+        buffer_slots.acquire()
+        try:
+            with ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix='aws-tools-part') as executor:
+                try:
+                    while 0 < len(buffer):
+                        part_number = len(futures) + 1
+                        if MAX_PART_COUNT < part_number:
+                            raise IOError(f"s3://{bucket}/{key} needs more than {MAX_PART_COUNT} parts")
+                        byte_count += len(buffer)
+                        future = executor.submit(self.__upload_part, bucket, key, upload_id, part_number, buffer)
+                        future.add_done_callback(lambda _: buffer_slots.release())
+                        futures.append(future)
+                        if 0 == part_number % _PART_SIZE_DOUBLING_INTERVAL:
+                            part_size *= 2
+                            logger.debug(f"Part size of s3://{bucket}/{key} grows to {part_size} bytes after {part_number} parts")
+                        buffer = None
+                        buffer_slots.acquire()
+                        # stop reading once a part has failed for good, the upload is lost anyway
+                        if any(future.done() and future.exception() is not None for future in futures):
+                            break
+                        buffer = self.__read_part(readable, part_size)
+                    self.__complete(bucket, key, upload_id, futures)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        except BaseException:
+            self.__abort(bucket, key, upload_id)
+            raise
+        logger.debug(f"Uploaded stream ({byte_count} bytes) to s3://{bucket}/{key} as {len(futures)} parts")
+        return byte_count
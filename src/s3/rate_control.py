@@ -0,0 +1,186 @@
+import threading
+import time
+from typing import Dict, Tuple
+from util.logging import get_default_logger
+from util.metrics import THROTTLE_ERROR_CODES
+
+
+# requests per second or bytes per second, taken up front: a take larger than what is available
+# runs the bucket into debt, which the following takes wait out. burst is one second's worth
+class TokenBucket:
+    def __init__(self, rate: float) -> None:
+        if not(0 < rate):
+            raise ValueError(f"rate must be greater than 0. Got: {rate}")
+        self.__rate = rate
+        self.__burst = max(1.0, rate)
+        self.__tokens = self.__burst
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def take(self, count: float = 1) -> None:
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+            self.__updated = now
+            self.__tokens -= count
+            wait_s = -self.__tokens / self.__rate if self.__tokens < 0 else 0
+        if 0 < wait_s:
+            time.sleep(wait_s)
+
+
+# additive-increase/multiplicative-decrease limit on requests in flight: it doubles every round trip
+# until the first throttle, then grows by one a round trip and halves on each throttle. a throttle
+# only cuts the limit once for all the requests sent before the last cut, and the limit only grows
+# while it is what holds requests back
+class AimdLimiter:
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 256, decrease_factor: float = 0.5) -> None:
+        self.__limit = float(initial_limit)
+        self.__min_limit = min_limit
+        self.__max_limit = max_limit
+        self.__decrease_factor = decrease_factor
+        self.__slow_start = True
+        self.__in_flight = 0
+        self.__sent = 0
+        self.__cut_at = 0
+        self.__condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self.__limit)
+
+    # returns the ticket release is given back
+    def acquire(self) -> int:
+        with self.__condition:
+            while int(self.__limit) <= self.__in_flight:
+                self.__condition.wait()
+            self.__in_flight += 1
+            self.__sent += 1
+            return self.__sent
+
+    def release(self, ticket: int, throttled: bool = False, succeeded: bool = True) -> bool:
+        with self.__condition:
+            saturated = int(self.__limit) <= self.__in_flight
+            self.__in_flight -= 1
+            cut = False
+            if throttled:
+                if self.__cut_at < ticket:
+                    self.__limit = max(float(self.__min_limit), self.__limit * self.__decrease_factor)
+                    self.__slow_start = False
+                    self.__cut_at = self.__sent
+                    cut = True
+            elif succeeded and saturated:
+                self.__limit = min(float(self.__max_limit), self.__limit + (1.0 if self.__slow_start else 1.0 / self.__limit))
+            self.__condition.notify_all()
+            return cut
+
+
+# shared by every instrumented client in the process: each S3 request attempt waits for the optional
+# request rate cap of its bucket and leading key segment (the prefix S3 partitions and throttles on),
+# then for a slot from that prefix's AimdLimiter, and its bytes for the optional bandwidth cap. botocore's own
+# retries still back off each throttled attempt; the limiter keeps the next ones from being sent
+class S3RateController:
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__limiters: Dict[Tuple[str, str], AimdLimiter] = {}
+        self.__request_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.max_rps: float|None = None
+        self.__bandwidth: TokenBucket|None = None
+
+    def set_limits(self, max_rps: float|None = None, max_bandwidth: int|None = None) -> None:
+        # checked here rather than when a prefix's first request makes its bucket, inside a botocore hook
+        if max_rps is not None and not(0 < max_rps):
+            raise ValueError(f"max_rps must be greater than 0. Got: {max_rps}")
+        self.max_rps = max_rps
+        self.__bandwidth = TokenBucket(max_bandwidth) if max_bandwidth is not None else None
+
+    @staticmethod
+    def prefix_key(params: dict) -> Tuple[str, str]:
+        key = params.get('Key', params.get('Prefix', '')) or ''
+        return (params.get('Bucket', ''), key.split('/', 1)[0] if '/' in key else '')
+
+    def limiter(self, prefix_key: Tuple[str, str]) -> AimdLimiter:
+        limiter = self.__limiters.get(prefix_key)
+        if limiter is None:
+            with self.__lock:
+                limiter = self.__limiters.setdefault(prefix_key, AimdLimiter())
+        return limiter
+
+    def __request_bucket(self, prefix_key: Tuple[str, str]) -> TokenBucket:
+        request_bucket = self.__request_buckets.get(prefix_key)
+        if request_bucket is None:
+            with self.__lock:
+                request_bucket = self.__request_buckets.setdefault(prefix_key, TokenBucket(self.max_rps))
+        return request_bucket
+
+    def instrument(self, client) -> None:
+        service = client.meta.service_model.service_id.hyphenize()
+        events = client.meta.events
+        events.register(f"before-parameter-build.{service}", self.__before_parameter_build)
+        # ahead of the signer, so a request that waited is signed when it is sent
+        events.register_first(f"request-created.{service}", self.__request_created)
+        events.register(f"before-send.{service}", self.__before_send)
+        # needs-retry stops at the first handler with an answer, so this one must come first and never answer
+        events.register_first(f"needs-retry.{service}", self.__needs_retry)
+        events.register(f"after-call-error.{service}", self.__after_call_error)
+
+    @staticmethod
+    def __before_parameter_build(params: dict, context: dict, **kwargs) -> None:
+        context['rate_control_key'] = S3RateController.prefix_key(params)
+
+    # once per attempt, retries included
+    def __request_created(self, request, **kwargs) -> None:
+        context = request.context
+        prefix_key = context.get('rate_control_key')
+        if prefix_key is None:
+            return
+        if self.max_rps is not None:
+            self.__request_bucket(prefix_key).take()
+        limiter = self.limiter(prefix_key)
+        context['rate_control_slot'] = (limiter, limiter.acquire())
+
+    def __before_send(self, request, **kwargs) -> None:
+        byte_count = request.headers.get('Content-Length')
+        if self.__bandwidth is not None and byte_count is not None:
+            self.__bandwidth.take(int(byte_count))
+
+    # after every attempt, whether or not it is to be retried
+    def __needs_retry(self, request_dict: dict, response=None, operation=None, **kwargs) -> None:
+        slot = request_dict['context'].pop('rate_control_slot', None)
+        if slot is None:
+            return None
+        limiter, ticket = slot
+        if response is None:
+            limiter.release(ticket, succeeded=False)
+            return None
+        http_response, parsed = response
+        code = parsed.get('Error', {}).get('Code') if isinstance(parsed, dict) else None
+        throttled = code in THROTTLE_ERROR_CODES or http_response.status_code == 429
+        if limiter.release(ticket, throttled=throttled, succeeded=http_response.status_code < 500):
+            get_default_logger().debug(f"{code} from {request_dict['context'].get('rate_control_key')}, concurrency limit cut to {limiter.limit}")
+        # a HEAD answers with the size of the object, not of a body
+        byte_count = http_response.headers.get('Content-Length')
+        if self.__bandwidth is not None and byte_count is not None and operation is not None and operation.http.get('method') != 'HEAD':
+            self.__bandwidth.take(int(byte_count))
+        return None
+
+    @staticmethod
+    def __after_call_error(context: dict, **kwargs) -> None:
+        # an attempt that failed before it was sent never reaches needs-retry
+        slot = context.pop('rate_control_slot', None)
+        if slot is not None:
+            limiter, ticket = slot
+            limiter.release(ticket, succeeded=False)
+
+
+_rate_controller = S3RateController()
+
+
+def get_rate_controller() -> S3RateController:
+    return _rate_controller
+
+
+# caps every instrumented client from here on; max_rps applies to each bucket prefix, max_bandwidth
+# (bytes per second, sent and received) to the process as a whole
+def set_rate_limits(max_rps: float|None = None, max_bandwidth: int|None = None) -> S3RateController:
+    _rate_controller.set_limits(max_rps, max_bandwidth)
+    return _rate_controller
@@ -1,260 +1,258 @@
-from datetime import datetime, timezone
+from datetime import datetime
 from io import BytesIO
+import os
 import re
+import shutil
+import threading
+from boto3.s3.transfer import TransferConfig
 from botocore.response import StreamingBody
 from botocore.config import Config
+from s3.key_pattern import KeyPattern, intersect_prefixes
+# the models live, free of boto, in s3_model; they are still importable from here
+from s3.s3_model import DateRange, S3Bucket, S3Object, S3URL, to_epoch
+from s3.listing_cache import ListingCache
+from s3.listing_checkpoint import ListingCheckpoint
+from s3.hedging import get_hedger
+from s3.rate_control import get_rate_controller
+from s3.sharded_lister import iter_object_pages_sharded
 from util.aws_account_api import BotoSessionAwsAccount
-from typing import List
-import urllib
+from typing import Iterator, List
 from util.logging import get_default_logger
-
-class DateRange:
-    def __init__(self, start: datetime|None = None, end: datetime|None = None):
-        self.start = start
-        self.end = end
-
-    @property
-    def start(self) -> datetime|None:
-        return self._start
-
-    @start.setter
-    def start(self, value: datetime|None) -> None:
-        self._start = value.replace(tzinfo=timezone.utc) if value is not None else None
-
-    @property
-    def end(self) -> datetime|None:
-        return self._end
-
-    @end.setter
-    def end(self, value: datetime|None) -> None:
-        self._end = value.replace(tzinfo=timezone.utc) if value is not None else None
-
-
-    def __str__(self) -> str:
-        if self.start is None and self.end is None:
-            return f"DateRange[any-date]"
-        elif self.start is None:
-            return f"DateRange[before({self.end.isoformat()})]"
-        elif self.end is None:
-            return f"DateRange[after({self.start.isoformat()})]"
-        return f"DateRange[between({self.start.isoformat()},{self.end.isoformat()})]"
-    
-    def in_range(self, dt: datetime) -> bool:
-        if self.start is None and self.end is None:
-            return True
-        utc_dt = dt
-        if dt.tzinfo is None:
-            utc_dt = dt.replace(tzinfo=timezone.utc)
-        if self.start is None:
-            return utc_dt <= self.end
-        if self.end is None:
-            return self.start <= utc_dt
-        return self.start <= utc_dt and utc_dt <= self.end
-
-class S3Bucket:
-    def __init__(self, name:str, region: str, created: datetime):
-        self.name = name
-        self.region = region
-        self.created = created
-
-    def __str__(self) -> str:
-        return f"S3Bucket[name={self.name},region={self.region},created={self.created.isoformat()}]"
-    
-    def __lt__(self, other) -> bool:
-        if self.created.__eq__(other.created):
-            return self.name.__lt__(other.name)
-        return self.created.__lt__(other.created)
-    
-    def to_url(self, bucket_url_template: str) -> str:
-        return bucket_url_template.replace('{region}', self.region).replace('{name}', self.name)
-   
-    @staticmethod
-    def from_dict(dict_o: dict) -> "S3Bucket":
-        return S3Bucket(name=dict_o['name'], region=dict_o['region'], created=datetime.fromisoformat(dict_o['created']))
- 
-class S3Object:
-    def __init__(self, bucket: S3Bucket, full_path: List[str], modified: datetime, size: int):
-        self.bucket = bucket
-        self.full_path = full_path
-        self.modified = modified
-        self.size = size
-    @property
-    def name(self) -> str:
-        return '/'.join(self.full_path)
-    @property
-    def fully_qualified_name(self) -> str:
-        return f"{self.bucket.name}/{self.name}"
-    
-    def __str__(self) -> str:
-        return f"{self.bucket}.S3Object[name={'/'.join(self.full_path)},modified={self.modified.isoformat()},size={self.size}]"
-
-    def __lt__(self, other) -> bool:
-        if self.modified.__eq__(other.modified):
-            if self.fully_qualified_name.__eq__(other.fully_qualified_name):
-                return self.size.__lt__(other.size)
-            return self.fully_qualified_name.__lt__(other.fully_qualified_name)
-        return self.modified.__lt__(other.modified)
-
-    @staticmethod
-    def from_dict(dict_o: dict) -> "S3Object":
-        return S3Object(bucket=S3Bucket.from_dict(dict_o['bucket']), full_path=dict_o['full_path'], modified=datetime.fromisoformat(dict_o['modified']), size=dict_o['size'])
-
-class S3URL:
-    def __init__(self, s3_url_template: str | None = None):
-        self.s3_url_template = S3URL.default_template()
-        if s3_url_template is not None:
-            self.s3_url_template = s3_url_template
-
-    def to_url(self, s3_object: S3Object) -> str:
-        region = s3_object.bucket.region
-        bucket_name = s3_object.bucket.name
-        object_full_path = '/'.join(s3_object.full_path)
-        return self.s3_url_template.format(region=region, bucket_name=bucket_name, object_full_path = object_full_path)
-    
-    @staticmethod
-    def default_template() -> str:
-        return "http://s3.{region}.amazonaws.com/{bucket_name}/{object_full_path}"
-    
-    @staticmethod
-    def is_valid_url_template(s3_url_template: str) -> bool:
-        bucket_name = 'BUCKET_NAME'
-        region = 'REGION'
-        object_full_path = 'OBJECT/FULL/PATH'
-        try:
-            urllib.parse(s3_url_template.format(region=region, bucket_name=bucket_name, object_full_path = object_full_path))
-            return True
-        except:
-            return False
-
-    @staticmethod
-    def template_help() -> str:
-        return """A string containing fields expressed within '{}': {region}, {bucket_name}, {object_full_path}
-ie. http://s3.{region}.amazonaws.com/{bucket_name}/{object_full_path}
-{region} - region in which bucket was found
-{bucket_name} - name of bucket for object
-{object_full_path} - full path of object in bucket ie. folder/subfolder/object_name, or, if no folder, object_name
-"""
+from util.metrics import get_metrics
 
 class S3Client:
-    def __init__(self, boto_session: BotoSessionAwsAccount, no_verify_ssl=False) -> None:
+    # bucket name -> S3Bucket found by get_bucket; a bucket's region is fixed, so it is shared for the life of the process
+    __buckets: dict = {}
+    __buckets_lock = threading.Lock()
+
+    def __init__(self, boto_session: BotoSessionAwsAccount, no_verify_ssl=False, max_pool_connections: int = 10, list_shards: int = 1, region: str|None = None, listing_cache: ListingCache|None = None) -> None:
         logger = get_default_logger()
         try:
-            self.__default_region = boto_session.aws_account.region
-            self.__client = boto_session.boto_session.client(
+            self.__default_region = region if region is not None else boto_session.aws_account.region
+            self.__account_id = boto_session.aws_account.id
+            self.__list_shards = list_shards
+            self.__listing_cache = listing_cache
+            self.__client = boto_session.client(
                     service_name='s3',
+                    region_name=self.__default_region,
                     config=Config(
                         retries={
                             'max_attempts': 10,
                             'mode': 'standard'
-                        }
+                        },
+                        max_pool_connections=max_pool_connections
                     ),
                     verify=not(no_verify_ssl)
                 )
+            get_metrics().instrument(self.__client)
+            get_rate_controller().instrument(self.__client)
         except Exception:
-            logger.exception(f"Unable to obtain S3 client no-verify-ssl={no_verify_ssl} from {boto_session.aws_account.name}")
+            logger.exception(f"Unable to obtain S3 client region={region} no-verify-ssl={no_verify_ssl} max-pool-connections={max_pool_connections} from {boto_session.aws_account.name}")
             raise
-        logger.debug(f"Obtained S3 client no-verify-ssl={no_verify_ssl} from {boto_session.aws_account.name}")
+        logger.debug(f"Obtained S3 client region={self.__default_region} no-verify-ssl={no_verify_ssl} max-pool-connections={max_pool_connections} from {boto_session.aws_account.name}")
+
+    @property
+    def region(self) -> str:
+        return self.__default_region
 
 
-    def list_buckets_like(self, like_name: str, date_range: DateRange=DateRange(start=None,end=None), exact_name_match=False) -> List[S3Bucket]:
+    def __iter_bucket_pages(self, kwargs: dict) -> Iterator[dict]:
+        list_pages = lambda: self.__client.get_paginator('list_buckets').paginate(**kwargs)
+        if self.__listing_cache is None:
+            return iter(list_pages())
+        cache_key = ListingCache.key(self.__account_id, self.__default_region, '', '', bucket_region=kwargs.get('BucketRegion'))
+        return self.__listing_cache.pages(cache_key, list_pages)
+
+    # ListBuckets is account-wide; bucket_regions, when given, keeps only buckets in those regions
+    def iter_buckets_like(self, like_name: str, date_range: DateRange=DateRange(start=None,end=None), exact_name_match=False, bucket_regions: List[str]|None = None) -> Iterator[S3Bucket]:
         logger = get_default_logger()
-        result: List[S3Bucket] = []
         regex = re.compile(like_name, re.IGNORECASE)
         is_match = lambda name: regex.match(name) is not None
         if exact_name_match:
             is_match = lambda name: name == like_name
-            
-        continuationToken: str | None = None
+        kwargs = {}
+        if bucket_regions is not None and 1 == len(bucket_regions):
+            kwargs['BucketRegion'] = bucket_regions[0]
+
         logger.debug(f"listing buckets named {'exactly' if exact_name_match else 'like'} {like_name} in {date_range}")
+        count = 0
         try:
-            while True:
+            for response in get_metrics().iter_phase('list', self.__iter_bucket_pages(kwargs)):
                 try:
-                    response = self.__client.list_buckets() if continuationToken is None else self.__client.list_buckets(ContinuationToken=continuationToken)
-                    continuationToken = response['ContinuationToken'] if 'ContinuationToken' in response else None
-                    buckets = response['Buckets'] if 'Buckets' in response else []
-                    for bucket in buckets:
+                    for bucket in response.get('Buckets', []):
                         if is_match(bucket['Name']):
                             created = bucket['CreationDate']
                             region = bucket['BucketRegion'] if 'BucketRegion' in bucket else self.__default_region
+                            if bucket_regions is not None and region not in bucket_regions:
+                                continue
                             if date_range.in_range(created):
-                                result.append(S3Bucket(name=bucket['Name'], region=region, created=created))                        
-                    if continuationToken is None:
-                        break
+                                count += 1
+                                yield S3Bucket(name=bucket['Name'], region=region, created=created)
                 except KeyError:
                     logger.error(f"KeyError: response={response}")
                     raise
         except Exception:
             logger.exception(f"AWS S3 list_buckets Failed for buckets named {'exactly' if exact_name_match else 'like'} {like_name} in {date_range}")
             raise
-        logger.debug(f"Obtained {len(result)} buckets named {'exactly' if exact_name_match else 'like'} {like_name} in {date_range}")
-        return result
+        logger.debug(f"Obtained {count} buckets named {'exactly' if exact_name_match else 'like'} {like_name} in {date_range}")
+
+    def list_buckets_like(self, like_name: str, date_range: DateRange=DateRange(start=None,end=None), exact_name_match=False, bucket_regions: List[str]|None = None) -> List[S3Bucket]:
+        return list(self.iter_buckets_like(like_name, date_range, exact_name_match, bucket_regions))
 
 
-    def list_objects_like(self, bucket: S3Bucket, like_name: str, date_range: DateRange=DateRange(start=None,end=None), exact_name_match=False) -> List[S3Object]:
+    def __iter_object_page_chain(self, bucket: S3Bucket, key_prefix: str, start_after: str|None = None, delimiter: str|None = None) -> Iterator[dict]:
+        kwargs = {'Bucket': bucket.name, 'Prefix': key_prefix}
+        if start_after is not None:
+            kwargs['StartAfter'] = start_after
+        if delimiter is not None:
+            kwargs['Delimiter'] = delimiter
+        list_pages = lambda: self.__client.get_paginator('list_objects_v2').paginate(**kwargs)
+        if self.__listing_cache is None:
+            yield from list_pages()
+            return
+        cache_key = ListingCache.key(self.__account_id, bucket.region, bucket.name, key_prefix, start_after=start_after, delimiter=delimiter)
+        yield from self.__listing_cache.pages(cache_key, list_pages)
+
+    def iter_object_pages(self, bucket: S3Bucket, key_prefix: str = '', split_points: List[str]|None = None, start_after: str|None = None) -> Iterator[dict]:
+        if 1 < self.__list_shards or (split_points is not None and 0 < len(split_points)):
+            page_chain = lambda prefix, chain_start_after, delimiter: self.__iter_object_page_chain(bucket, prefix, chain_start_after, delimiter)
+            yield from iter_object_pages_sharded(page_chain, key_prefix, self.__list_shards, split_points, start_after)
+        else:
+            yield from self.__iter_object_page_chain(bucket, key_prefix, start_after)
+
+    # with a checkpoint, listing resumes after the last checkpointed key and each page is
+    # reported to it once all of its objects have been consumed
+    def iter_objects_like(self, bucket: S3Bucket, like_name: str, date_range: DateRange=DateRange(start=None,end=None), exact_name_match=False, key_glob: str|None = None, case_sensitive=False, split_points: List[str]|None = None, checkpoint: ListingCheckpoint|None = None) -> Iterator[S3Object]:
         logger = get_default_logger()
-        result: List[S3Object] = []
-        regex = re.compile(like_name, re.IGNORECASE)
-        is_match = lambda name: regex.match(name) is not None
-        if exact_name_match:
-            is_match = lambda name: name == like_name
+        key_patterns = [KeyPattern.from_like_name(like_name, exact_name_match, case_sensitive)]
+        if key_glob is not None:
+            key_patterns.append(KeyPattern.from_glob(key_glob))
+        prefixes = key_patterns[0].prefixes
+        for key_pattern in key_patterns[1:]:
+            prefixes = intersect_prefixes(prefixes, key_pattern.prefixes)
+        description = ' and '.join([key_pattern.description for key_pattern in key_patterns])
+        metrics = get_metrics()
 
-        logger.debug(f"listing objects for bucket {bucket} where objects named {'exactly' if exact_name_match else 'like'} {like_name} in {date_range}")
-        continuationToken: str | None = None
+        logger.debug(f"listing objects for bucket {bucket} with prefixes {prefixes} where objects named {description} in {date_range}")
+        count = 0
         try:
-            while True:
-                try:
-                    response = self.__client.list_objects_v2(Bucket=bucket.name) if continuationToken is None else self.__client.list_objects_v2(Bucket=bucket, ContinuationToken=continuationToken)
-                    continuationToken = response['ContinuationToken'] if 'ContinuationToken' in response else None
-                    contents = response['Contents'] if 'Contents' in response else []
-                    for obj in contents:
-                        full_path = obj['Key'].split('/')
-                        if is_match(full_path[-1]) is not None:
-                            modified = obj['LastModified']
-                            if date_range.in_range(modified):
-                                size = obj['Size']
-                                result.append(S3Object(bucket=bucket, full_path=full_path, modified=modified, size=size))
-                    if continuationToken is None:
-                        break
-                except KeyError:
-                    logger.error(f"KeyError: response={response}")
-                    raise
+            for prefix in prefixes:
+                listing_key = ListingCheckpoint.key(bucket.name, prefix)
+                if checkpoint is not None and checkpoint.is_completed(listing_key):
+                    logger.debug(f"skipping checkpointed listing {listing_key}")
+                    continue
+                start_after = checkpoint.start_after(listing_key) if checkpoint is not None else None
+                for response in metrics.iter_phase('list', self.iter_object_pages(bucket, prefix, split_points, start_after)):
+                    contents = response.get('Contents', [])
+                    try:
+                        with metrics.phase('filter'):
+                            page_objects = [
+                                S3Object(bucket=bucket, full_path=obj['Key'], modified=obj['LastModified'], size=obj['Size'], etag=obj.get('ETag'))
+                                for obj in contents
+                                if all(key_pattern.matches(obj['Key']) for key_pattern in key_patterns) and date_range.in_range(obj['LastModified'])
+                            ]
+                    except KeyError:
+                        logger.error(f"KeyError: response={response}")
+                        raise
+                    count += len(page_objects)
+                    yield from page_objects
+                    if checkpoint is not None and 0 < len(contents):
+                        checkpoint.page_done(listing_key, contents[-1]['Key'], page_objects)
+                if checkpoint is not None:
+                    checkpoint.listing_done(listing_key)
         except Exception:
-            logger.exception(f"AWS S3 list_objects_v2 Failed for bucket {bucket} and objects named {'exactly' if exact_name_match else 'like'} {like_name} in {date_range}")
+            logger.exception(f"AWS S3 list_objects_v2 Failed for bucket {bucket} and objects named {description} in {date_range}")
             raise
-        logger.debug(f"Obtained {len(result)} objects for bucket {bucket} where objects named {'exactly' if exact_name_match else 'like'} {like_name} in {date_range}")
-        return result
+        logger.debug(f"Obtained {count} objects for bucket {bucket} where objects named {description} in {date_range}")
+
+    def list_objects_like(self, bucket: S3Bucket, like_name: str, date_range: DateRange=DateRange(start=None,end=None), exact_name_match=False, key_glob: str|None = None, case_sensitive=False, split_points: List[str]|None = None, checkpoint: ListingCheckpoint|None = None) -> List[S3Object]:
+        return list(self.iter_objects_like(bucket, like_name, date_range, exact_name_match, key_glob, case_sensitive, split_points, checkpoint))
 
 
-    def list_objects(self, bucket: S3Bucket, key_prefix: str) -> List[S3Object]:
+    def iter_objects(self, bucket: S3Bucket, key_prefix: str, split_points: List[str]|None = None) -> Iterator[S3Object]:
         logger = get_default_logger()
-       
-        result: List[S3Object] = []
         logger.debug(f"listing objects for bucket {bucket} where objects have prefix {key_prefix}")
+        count = 0
         try:
-            response = self.__client.list_objects_v2(Bucket=bucket.name, Prefix=key_prefix)
-            contents = response['Contents'] if 'Contents' in response else []
-            for content in contents:
-                result.append(S3Object(bucket=bucket, full_path=content['Key'].split('/'), modified=content['LastModified'], size=content['Size']))
+            for response in get_metrics().iter_phase('list', self.iter_object_pages(bucket, key_prefix, split_points)):
+                for content in response.get('Contents', []):
+                    count += 1
+                    yield S3Object(bucket=bucket, full_path=content['Key'], modified=content['LastModified'], size=content['Size'], etag=content.get('ETag'))
         except Exception:
             logger.exception(f"AWS S3 list_objects_v2 Failed for bucket {bucket} where objects have prefix {key_prefix}")
             raise
-        logger.debug(f"Obtained {len(result)} objects for bucket {bucket} where objects have prefix {key_prefix}")
-        return result
+        logger.debug(f"Obtained {count} objects for bucket {bucket} where objects have prefix {key_prefix}")
+
+    def list_objects(self, bucket: S3Bucket, key_prefix: str, split_points: List[str]|None = None) -> List[S3Object]:
+        return list(self.iter_objects(bucket, key_prefix, split_points))
+
+    def __lookup_bucket(self, bucket: str) -> S3Bucket|None:
+        logger = get_default_logger()
+        # buckets are listed in name order, so the exact name is the first one it prefixes
+        response = self.__client.list_buckets(Prefix=bucket, MaxBuckets=1)
+        buckets = [found for found in response.get('Buckets', []) if found['Name'] == bucket]
+        if 0 == len(buckets):
+            return None
+        region = buckets[0].get('BucketRegion')
+        if region is None:
+            response = self.__client.head_bucket(Bucket=bucket)
+            region = response.get('BucketRegion', response['ResponseMetadata']['HTTPHeaders'].get('x-amz-bucket-region', self.__default_region))
+        logger.debug(f"Looked up bucket {bucket} in {region}")
+        return S3Bucket(name=bucket, region=region, created=buckets[0]['CreationDate'])
 
     def get_bucket(self, bucket: str, date_range: DateRange=DateRange(start=None,end=None)) -> S3Bucket:
-        buckets = self.list_buckets_like(bucket, date_range, True)
-        return buckets[0]
+        s3_bucket = S3Client.__buckets.get(bucket)
+        if s3_bucket is None:
+            try:
+                s3_bucket = self.__lookup_bucket(bucket)
+            except Exception:
+                get_default_logger().exception(f"AWS S3 lookup Failed for bucket {bucket}")
+                raise
+            if s3_bucket is None:
+                raise IndexError(f"No bucket named {bucket}")
+            with S3Client.__buckets_lock:
+                s3_bucket = S3Client.__buckets.setdefault(bucket, s3_bucket)
+        if not(date_range.in_range(s3_bucket.created)):
+            raise IndexError(f"No bucket named {bucket} in {date_range}")
+        return s3_bucket
 
     def get_object(self, bucket: S3Bucket, key: str) -> S3Object:
         response = self.__client.get_object(Bucket=bucket.name, Key=key)
-        return S3Object(bucket=bucket, full_path=key.split('/'), modified=response['LastModified'], size=response['Size'])
+        return S3Object(bucket=bucket, full_path=key, modified=response['LastModified'], size=response['Size'], etag=response.get('ETag'))
 
-    def get_object_body(self, bucket: str, key: str) -> StreamingBody:
-        response = self.__client.get_object(Bucket=bucket.name, Key=key)
+    # GETs whose body is read go through the hedger, when enabled
+    def __get_object_hedged(self, **kwargs) -> dict:
+        hedger = get_hedger()
+        if not(hedger.enabled):
+            return self.__client.get_object(**kwargs)
+        return hedger.get(lambda: self.__client.get_object(**kwargs))
+
+    def get_object_body(self, bucket: S3Bucket, key: str) -> StreamingBody:
+        response = self.__get_object_hedged(Bucket=bucket.name, Key=key)
         return response.get("Body")
 
+    # bytes first_byte..last_byte inclusive; with etag, S3 refuses the range if the object has since changed
+    def get_object_range(self, bucket: str, key: str, first_byte: int, last_byte: int, etag: str|None = None) -> dict:
+        kwargs = {'Bucket': bucket, 'Key': key, 'Range': f"bytes={first_byte}-{last_byte}"}
+        if etag is not None:
+            kwargs['IfMatch'] = f'"{etag}"'
+        return self.__get_object_hedged(**kwargs)
+
     def get_object_to_file(self, bucket: str, key: str, output_filepath: str) -> None:
-        self.__client.download_file(Bucket=bucket,Key=key,Filename=output_filepath)
+        if not(get_hedger().enabled):
+            self.__client.download_file(Bucket=bucket,Key=key,Filename=output_filepath)
+            return
+        # one hedged GET in place of download_file's ranged parts, streamed to a file moved into place once whole
+        partial_filepath = f"{output_filepath}.part"
+        try:
+            with self.__get_object_hedged(Bucket=bucket, Key=key)['Body'] as body, open(partial_filepath, 'wb') as of:
+                shutil.copyfileobj(body, of, 1024 * 1024)
+        except Exception:
+            # the caller's retry starts over, so nothing is left behind of a GET cut short
+            if os.path.isfile(partial_filepath):
+                os.remove(partial_filepath)
+            raise
+        os.replace(partial_filepath, output_filepath)
 
     def create_bucket(self, bucket: str) -> S3Bucket:
         response = self.__client.create_bucket(Bucket=bucket)
@@ -264,12 +262,39 @@ class S3Client:
         response = self.__client.put_object(Bucket=bucket, Key=key, Body=data)
         return response.get("VersionId")
     
-    def put_object_from_file(self, bucket: str, key: str, input_filepath: str) -> None:
-        self.__client.upload_file(Bucket=bucket,Key=key,Filename=input_filepath)
+    def put_object_from_file(self, bucket: str, key: str, input_filepath: str, transfer_config: TransferConfig|None = None) -> None:
+        self.__client.upload_file(Bucket=bucket,Key=key,Filename=input_filepath,Config=transfer_config)
+
+    def create_multipart_upload(self, bucket: str, key: str) -> str:
+        response = self.__client.create_multipart_upload(Bucket=bucket, Key=key)
+        return response['UploadId']
+
+    def upload_part(self, bucket: str, key: str, upload_id: str, part_number: int, data) -> str:
+        response = self.__client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data)
+        return response['ETag']
+
+    def complete_multipart_upload(self, bucket: str, key: str, upload_id: str, part_etags: List[str]) -> str:
+        parts = [{'PartNumber': i + 1, 'ETag': etag} for i, etag in enumerate(part_etags)]
+        response = self.__client.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+        return response['ETag'].strip('"')
+
+    def abort_multipart_upload(self, bucket: str, key: str, upload_id: str) -> None:
+        self.__client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
 
     def delete_object(self, bucket: str, key: str) -> str:
         response = self.__client.delete_object(Bucket=bucket, Key=key)
         return response.get("VersionId")
 
+    # returns the keys that could not be deleted
+    def delete_objects(self, bucket: str, keys: List[str]) -> List[str]:
+        logger = get_default_logger()
+        failed_keys = []
+        for i in range(0, len(keys), 1000):
+            response = self.__client.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]], 'Quiet': True})
+            for error in response.get('Errors', []):
+                logger.error(f"AWS S3 delete_objects Failed for {bucket}/{error['Key']}: {error.get('Code')} {error.get('Message')}")
+                failed_keys.append(error['Key'])
+        return failed_keys
+
     def delete_bucket(self, bucket: str) -> None:
         self.__client.delete_bucket(Bucket=bucket)
\ No newline at end of file
@@ -0,0 +1,48 @@
+import threading
+from typing import Dict, List
+from s3.listing_cache import ListingCache
+from s3.s3_client import DateRange, S3Bucket, S3Client
+from util.aws_account_api import BotoSessionAwsAccount
+from util.logging import get_default_logger
+
+
+# one S3Client per region, all built from a single session (one sts identity call), so buckets
+# and objects are each served by their own region's endpoint without redirects. safe to share
+# across threads: every thread talking to a region reuses that client's connection pool
+class S3ClientRouter:
+    def __init__(self, boto_session: BotoSessionAwsAccount, no_verify_ssl=False, max_pool_connections: int = 10, list_shards: int = 1, listing_cache: ListingCache|None = None) -> None:
+        self.__boto_session = boto_session
+        self.__listing_cache = listing_cache
+        self.__no_verify_ssl = no_verify_ssl
+        self.__max_pool_connections = max_pool_connections
+        self.__list_shards = list_shards
+        self.__clients: Dict[str, S3Client] = {}
+        # boto3 sessions are not thread-safe, so clients are created under the lock
+        self.__lock = threading.Lock()
+
+    @property
+    def default_region(self) -> str:
+        return self.__boto_session.aws_account.region
+
+    def client(self, region: str|None = None) -> S3Client:
+        region = region if region is not None else self.default_region
+        s3_client = self.__clients.get(region)
+        if s3_client is None:
+            with self.__lock:
+                s3_client = self.__clients.get(region)
+                if s3_client is None:
+                    s3_client = S3Client(self.__boto_session, self.__no_verify_ssl, self.__max_pool_connections, self.__list_shards, region, self.__listing_cache)
+                    self.__clients[region] = s3_client
+        return s3_client
+
+    def for_bucket(self, s3_bucket: S3Bucket) -> S3Client:
+        return self.client(s3_bucket.region)
+
+    def buckets_like_by_region(self, like_name: str, date_range: DateRange=DateRange(start=None,end=None), bucket_regions: List[str]|None = None) -> Dict[str, List[S3Bucket]]:
+        logger = get_default_logger()
+        buckets_by_region: Dict[str, List[S3Bucket]] = {}
+        for s3_bucket in self.client().iter_buckets_like(like_name, date_range, bucket_regions=bucket_regions):
+            buckets_by_region.setdefault(s3_bucket.region, []).append(s3_bucket)
+        for region, s3_buckets in buckets_by_region.items():
+            logger.debug(f"{len(s3_buckets)} buckets like {like_name} in {region}")
+        return buckets_by_region
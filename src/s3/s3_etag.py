@@ -0,0 +1,72 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import os
+from boto3.s3.transfer import TransferConfig
+from s3transfer.utils import ChunksizeAdjuster
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+from s3.s3_client import S3Object
+from util.logging import get_default_logger
+
+_READ_SIZE = 1024 * 1024
+
+
+def _md5_range(fp, byte_count: int):
+    md5 = hashlib.md5()
+    while 0 < byte_count:
+        data = fp.read(min(_READ_SIZE, byte_count))
+        if 0 == len(data):
+            break
+        md5.update(data)
+        byte_count -= len(data)
+    return md5
+
+
+# the ETag S3 assigns a file uploaded with transfer_config: the md5 of the content, or, once the
+# file reaches multipart_threshold, the md5 of the part md5s suffixed with the part count.
+# objects encrypted with SSE-KMS/SSE-C have other ETags and always compare as changed
+def compute_etag(filepath: str, transfer_config: TransferConfig) -> str:
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as fp:
+        if size < transfer_config.multipart_threshold:
+            return _md5_range(fp, size).hexdigest()
+        chunksize = ChunksizeAdjuster().adjust_chunksize(transfer_config.multipart_chunksize, size)
+        part_digests = []
+        for _ in range(0, size, chunksize):
+            part_digests.append(_md5_range(fp, chunksize).digest())
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def iter_changed_files(
+    uploads: Iterable[Tuple[str, str]],
+    remote_objects: Dict[str, S3Object],
+    transfer_config: TransferConfig,
+    max_workers: int,
+    on_unchanged: Callable[[str, str], None] | None = None
+) -> Iterator[Tuple[str, str]]:
+    # only files whose size matches their remote object are hashed; hashing runs on max_workers
+    # threads (hashlib releases the GIL) a bounded window ahead of the uploads consuming this
+    logger = get_default_logger()
+    window: deque = deque()
+
+    def is_changed(input_filepath: str, key: str) -> bool:
+        s3_object = remote_objects.get(key)
+        if s3_object is None or s3_object.size != os.path.getsize(input_filepath):
+            return True
+        return s3_object.etag != compute_etag(input_filepath, transfer_config)
+
+    def drain(upload: Tuple[str, str], changed: Future) -> Iterator[Tuple[str, str]]:
+        if changed.result():
+            yield upload
+        else:
+            logger.debug(f"Unchanged {upload[0]} as {upload[1]}")
+            if on_unchanged is not None:
+                on_unchanged(*upload)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='aws-tools-hash') as executor:
+        for upload in uploads:
+            window.append((upload, executor.submit(is_changed, *upload)))
+            if max(1, max_workers) * 2 <= len(window):
+                yield from drain(*window.popleft())
+        while 0 < len(window):
+            yield from drain(*window.popleft())
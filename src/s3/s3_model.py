@@ -0,0 +1,188 @@
+from datetime import datetime, timezone
+import threading
+from typing import List
+import urllib
+
+class DateRange:
+    def __init__(self, start: datetime|None = None, end: datetime|None = None):
+        self.start = start
+        self.end = end
+
+    @property
+    def start(self) -> datetime|None:
+        return self._start
+
+    @start.setter
+    def start(self, value: datetime|None) -> None:
+        self._start = value.replace(tzinfo=timezone.utc) if value is not None else None
+
+    @property
+    def end(self) -> datetime|None:
+        return self._end
+
+    @end.setter
+    def end(self, value: datetime|None) -> None:
+        self._end = value.replace(tzinfo=timezone.utc) if value is not None else None
+
+
+    def __str__(self) -> str:
+        if self.start is None and self.end is None:
+            return f"DateRange[any-date]"
+        elif self.start is None:
+            return f"DateRange[before({self.end.isoformat()})]"
+        elif self.end is None:
+            return f"DateRange[after({self.start.isoformat()})]"
+        return f"DateRange[between({self.start.isoformat()},{self.end.isoformat()})]"
+
+    def to_dict(self) -> dict:
+        return {'start': self.start, 'end': self.end}
+
+    @staticmethod
+    def from_dict(dict_o: dict) -> "DateRange":
+        return DateRange(
+            start=datetime.fromisoformat(dict_o['start']) if dict_o.get('start') is not None else None,
+            end=datetime.fromisoformat(dict_o['end']) if dict_o.get('end') is not None else None
+        )
+    
+    def in_range(self, dt: datetime) -> bool:
+        if self.start is None and self.end is None:
+            return True
+        utc_dt = dt
+        if dt.tzinfo is None:
+            utc_dt = dt.replace(tzinfo=timezone.utc)
+        if self.start is None:
+            return utc_dt <= self.end
+        if self.end is None:
+            return self.start <= utc_dt
+        return self.start <= utc_dt and utc_dt <= self.end
+
+class S3Bucket:
+    __slots__ = ('name', 'region', 'created')
+    __interned: dict = {}
+    __interned_lock = threading.Lock()
+
+    def __init__(self, name:str, region: str, created: datetime):
+        self.name = name
+        self.region = region
+        self.created = created
+
+    def __str__(self) -> str:
+        return f"S3Bucket[name={self.name},region={self.region},created={self.created.isoformat()}]"
+    
+    def __lt__(self, other) -> bool:
+        if self.created.__eq__(other.created):
+            return self.name.__lt__(other.name)
+        return self.created.__lt__(other.created)
+    
+    def to_url(self, bucket_url_template: str) -> str:
+        return bucket_url_template.replace('{region}', self.region).replace('{name}', self.name)
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'region': self.region, 'created': self.created}
+
+    # one shared instance per bucket, so objects read back from a listing don't each carry their own
+    @staticmethod
+    def intern(name: str, region: str, created: datetime) -> "S3Bucket":
+        key = (name, region)
+        s3_bucket = S3Bucket.__interned.get(key)
+        if s3_bucket is None:
+            with S3Bucket.__interned_lock:
+                s3_bucket = S3Bucket.__interned.setdefault(key, S3Bucket(name=name, region=region, created=created))
+        return s3_bucket
+   
+    @staticmethod
+    def from_dict(dict_o: dict) -> "S3Bucket":
+        s3_bucket = S3Bucket.__interned.get((dict_o['name'], dict_o['region']))
+        if s3_bucket is not None:
+            return s3_bucket
+        return S3Bucket.intern(name=dict_o['name'], region=dict_o['region'], created=datetime.fromisoformat(dict_o['created']))
+
+
+def to_epoch(dt: datetime) -> int:
+    return int((dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)).timestamp())
+
+
+class S3Object:
+    __slots__ = ('bucket', 'key', 'modified_epoch', 'size', 'etag', '__sort_key')
+
+    def __init__(self, bucket: S3Bucket, full_path: str|List[str], modified: datetime|int, size: int, etag: str|None = None):
+        self.bucket = bucket
+        self.key = full_path if isinstance(full_path, str) else '/'.join(full_path)
+        self.modified_epoch = modified if isinstance(modified, int) else to_epoch(modified)
+        self.size = size
+        self.etag = etag.strip('"') if etag is not None else None
+        self.__sort_key = None
+    @property
+    def full_path(self) -> List[str]:
+        return self.key.split('/')
+    @property
+    def modified(self) -> datetime:
+        return datetime.fromtimestamp(self.modified_epoch, timezone.utc)
+    @property
+    def name(self) -> str:
+        return self.key
+    @property
+    def fully_qualified_name(self) -> str:
+        return f"{self.bucket.name}/{self.key}"
+    
+    def __str__(self) -> str:
+        return f"{self.bucket}.S3Object[name={self.key},modified={self.modified.isoformat()},size={self.size}]"
+
+    @property
+    def sort_key(self) -> tuple:
+        if self.__sort_key is None:
+            self.__sort_key = (self.modified_epoch, self.fully_qualified_name, self.size)
+        return self.__sort_key
+
+    def __lt__(self, other) -> bool:
+        return self.sort_key < other.sort_key
+
+    def to_dict(self) -> dict:
+        dict_o = {'bucket': self.bucket, 'full_path': self.full_path, 'modified': self.modified, 'size': self.size}
+        if self.etag is not None:
+            dict_o['etag'] = self.etag
+        return dict_o
+
+    @staticmethod
+    def from_dict(dict_o: dict) -> "S3Object":
+        return S3Object(bucket=S3Bucket.from_dict(dict_o['bucket']), full_path=dict_o['full_path'], modified=to_epoch(datetime.fromisoformat(dict_o['modified'])), size=dict_o['size'], etag=dict_o.get('etag'))
+
+    @staticmethod
+    def sort_key_from_dict(dict_o: dict) -> tuple:
+        return (to_epoch(datetime.fromisoformat(dict_o['modified'])), f"{dict_o['bucket']['name']}/{'/'.join(dict_o['full_path'])}", dict_o['size'])
+
+class S3URL:
+    def __init__(self, s3_url_template: str | None = None):
+        self.s3_url_template = S3URL.default_template()
+        if s3_url_template is not None:
+            self.s3_url_template = s3_url_template
+
+    def to_url(self, s3_object: S3Object) -> str:
+        region = s3_object.bucket.region
+        bucket_name = s3_object.bucket.name
+        object_full_path = s3_object.key
+        return self.s3_url_template.format(region=region, bucket_name=bucket_name, object_full_path = object_full_path)
+    
+    @staticmethod
+    def default_template() -> str:
+        return "http://s3.{region}.amazonaws.com/{bucket_name}/{object_full_path}"
+    
+    @staticmethod
+    def is_valid_url_template(s3_url_template: str) -> bool:
+        bucket_name = 'BUCKET_NAME'
+        region = 'REGION'
+        object_full_path = 'OBJECT/FULL/PATH'
+        try:
+            urllib.parse(s3_url_template.format(region=region, bucket_name=bucket_name, object_full_path = object_full_path))
+            return True
+        except:
+            return False
+
+    @staticmethod
+    def template_help() -> str:
+        return """A string containing fields expressed within '{}': {region}, {bucket_name}, {object_full_path}
+ie. http://s3.{region}.amazonaws.com/{bucket_name}/{object_full_path}
+{region} - region in which bucket was found
+{bucket_name} - name of bucket for object
+{object_full_path} - full path of object in bucket ie. folder/subfolder/object_name, or, if no folder, object_name
+"""
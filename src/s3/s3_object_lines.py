@@ -0,0 +1,215 @@
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+import bz2
+from functools import lru_cache
+import gzip
+import lzma
+import multiprocessing
+import re
+import threading
+from typing import BinaryIO, Iterable, List, Tuple
+from s3.s3_client import S3Object
+from s3.s3_client_router import S3ClientRouter
+from s3.s3_transfer import TransferStats, run_transfers
+from util.logging import get_default_logger
+
+# leading bytes of each compressed format read on the fly by decompress='auto'
+_MAGIC_OPENERS = [
+    (b'\x1f\x8b', lambda fp: gzip.GzipFile(fileobj=fp, mode='rb')),
+    (b'BZh', bz2.BZ2File),
+    (b'\xfd7zXZ\x00', lzma.LZMAFile),
+]
+_MAGIC_SIZE = max([len(magic) for magic, _ in _MAGIC_OPENERS])
+# batches a single line may grow to before it is written in pieces
+MAX_LINE_BATCHES = 64
+
+
+class _PrefixedReader:
+    # puts the bytes read to sniff the format back in front of the rest of the body
+    def __init__(self, prefix: bytes, fp) -> None:
+        self.__prefix = prefix
+        self.__fp = fp
+
+    def read(self, size: int = -1) -> bytes:
+        if 0 == len(self.__prefix):
+            return self.__fp.read(size) if size is not None and 0 <= size else self.__fp.read()
+        if size is None or size < 0:
+            data, self.__prefix = self.__prefix + self.__fp.read(), b''
+        elif size <= len(self.__prefix):
+            data, self.__prefix = self.__prefix[:size], self.__prefix[size:]
+        else:
+            data, self.__prefix = self.__prefix + self.__fp.read(size - len(self.__prefix)), b''
+        return data
+
+
+def open_decompressed(body, decompress: str = 'auto'):
+    if decompress == 'none':
+        return body
+    prefix = body.read(_MAGIC_SIZE)
+    reader = _PrefixedReader(prefix, body)
+    for magic, opener in _MAGIC_OPENERS:
+        if prefix.startswith(magic):
+            return opener(reader)
+    return reader
+
+
+@lru_cache(maxsize=16)
+def _compile(pattern: bytes, flags: int) -> re.Pattern:
+    return re.compile(pattern, flags)
+
+
+class LineFilter:
+    # picklable description of a line match, compiled once per worker process
+    def __init__(self, pattern: str, fixed_strings: bool = False, ignore_case: bool = False, invert_match: bool = False) -> None:
+        pattern = re.escape(pattern) if fixed_strings else pattern
+        self.pattern = pattern.encode('utf-8')
+        self.flags = re.IGNORECASE if ignore_case else 0
+        self.invert_match = invert_match
+        # fail on a bad pattern here rather than in every worker
+        _compile(self.pattern, self.flags)
+
+    def __str__(self) -> str:
+        return f"LineFilter[pattern={self.pattern!r},ignore-case={0 != self.flags},invert={self.invert_match}]"
+
+
+# the lines of batch (whole lines, numbered from first_line_number) that pass line_filter, each
+# preceded by prefix and its line number. runs in a worker process when filtering is distributed
+def filter_batch(line_filter: LineFilter|None, prefix: bytes|None, first_line_number: int, batch: bytes) -> Tuple[bytes, int]:
+    regex = _compile(line_filter.pattern, line_filter.flags) if line_filter is not None else None
+    output = []
+    # split on newlines alone, as line numbers are counted, so a bare \r stays part of its line
+    lines = batch.split(b'\n')
+    if batch.endswith(b'\n'):
+        lines.pop()
+    for line_number, line in enumerate(lines, start=first_line_number):
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        if regex is not None and (regex.search(line) is None) != line_filter.invert_match:
+            continue
+        if prefix is not None:
+            output.append(b'%s:%d:%s' % (prefix, line_number, line))
+        else:
+            output.append(line)
+    if 0 == len(output):
+        return b'', 0
+    return b'\n'.join(output) + b'\n', len(output)
+
+
+def iter_line_batches(fp, batch_size: int, max_line_size: int|None = None) -> Iterable[bytes]:
+    # batch_size reads cut back to the last newline; the partial line opens the next batch. a line
+    # longer than max_line_size (MAX_LINE_BATCHES batches by default) is yielded in pieces as it is
+    # read, so a body without newlines is held no more than that at a time
+    max_line_size = max_line_size if max_line_size is not None else MAX_LINE_BATCHES * batch_size
+    partial: List[bytes] = []
+    partial_size = 0
+    splitting = False
+    while True:
+        data = fp.read(batch_size)
+        if not(data):
+            break
+        cut = data.rfind(b'\n') + 1
+        if 0 == cut:
+            partial.append(data)
+            partial_size += len(data)
+            if max_line_size <= partial_size:
+                if not(splitting):
+                    get_default_logger().warning(f"Line longer than {max_line_size} bytes, written in pieces of that size")
+                    splitting = True
+                yield b''.join(partial)
+                partial, partial_size = [], 0
+            continue
+        partial.append(data[:cut])
+        yield b''.join(partial)
+        partial = [data[cut:]] if cut < len(data) else []
+        partial_size = len(data) - cut
+        splitting = False
+    if 0 < partial_size:
+        yield b''.join(partial)
+
+
+class ObjectLineWriter:
+    # batches from concurrent objects are written whole, so lines never interleave mid-line.
+    # once the reader goes away (| head) the streams are told to stop rather than failing
+    def __init__(self, output: BinaryIO) -> None:
+        self.__output = output
+        self.__lock = threading.Lock()
+        self.line_count = 0
+        self.broken = False
+
+    def write(self, data: bytes, line_count: int) -> None:
+        if 0 == len(data):
+            return
+        with self.__lock:
+            if self.broken:
+                return
+            try:
+                self.__output.write(data)
+                self.__output.flush()
+                self.line_count += line_count
+            except BrokenPipeError:
+                self.broken = True
+
+
+class ObjectLineStreamer:
+    # streams max_workers object bodies at a time, decompressing them on the fly and cutting them
+    # into batches of whole lines. with filter_workers, batches are filtered in that many processes
+    # while their stream reads ahead at most window batches, bounding memory to roughly
+    # max_workers * (window + 1) * batch_size whatever the size of the objects; a batch only grows past
+    # batch_size to hold a longer line, and never past MAX_LINE_BATCHES batches
+    def __init__(self, router: S3ClientRouter, max_workers: int = 10, filter_workers: int = 0, batch_size: int = 1024 * 1024, window: int = 2, decompress: str = 'auto') -> None:
+        self.__router = router
+        self.__max_workers = max(1, max_workers)
+        self.__filter_workers = max(0, filter_workers)
+        self.__batch_size = max(1, batch_size)
+        self.__window = max(1, window)
+        self.__decompress = decompress
+
+    def stream(self, s3_objects: Iterable[S3Object], writer: ObjectLineWriter, line_filter: LineFilter|None = None, provenance: bool = True) -> TransferStats:
+        logger = get_default_logger()
+        # spawned rather than forked: the pool starts from threads already holding the logging and connection locks
+        executor = ProcessPoolExecutor(max_workers=self.__filter_workers, mp_context=multiprocessing.get_context('spawn')) if line_filter is not None and 0 < self.__filter_workers else None
+        try:
+            # objects are streamed once: a retry after lines were written would repeat them
+            stats = run_transfers(
+                s3_objects,
+                self.__max_workers,
+                1,
+                0,
+                lambda s3_object: f"stream {s3_object.fully_qualified_name}",
+                lambda s3_object: self.__stream_object(s3_object, writer, line_filter, provenance, executor)
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        logger.info(f"Streamed {stats}, {writer.line_count} lines written")
+        return stats
+
+    def __stream_object(self, s3_object: S3Object, writer: ObjectLineWriter, line_filter: LineFilter|None, provenance: bool, executor: Executor|None) -> int:
+        if writer.broken:
+            return 0
+        prefix = s3_object.fully_qualified_name.encode('utf-8') if provenance else None
+        body = self.__router.for_bucket(s3_object.bucket).get_object_body(s3_object.bucket, s3_object.key)
+        pending: deque = deque()
+        byte_count = 0
+        line_number = 1
+        try:
+            fp = open_decompressed(body, self.__decompress)
+            for batch in iter_line_batches(fp, self.__batch_size):
+                if writer.broken:
+                    break
+                byte_count += len(batch)
+                if executor is None:
+                    writer.write(*filter_batch(line_filter, prefix, line_number, batch))
+                else:
+                    pending.append(executor.submit(filter_batch, line_filter, prefix, line_number, batch))
+                    while self.__window <= len(pending):
+                        writer.write(*pending.popleft().result())
+                line_number += batch.count(b'\n')
+            while 0 < len(pending):
+                writer.write(*pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+            body.close()
+        get_default_logger().debug(f"Streamed {byte_count} bytes ({line_number - 1} lines) of {s3_object.fully_qualified_name}")
+        return byte_count
@@ -0,0 +1,16 @@
+from typing import List, Tuple
+from s3.s3_model import S3Object
+from util.json_helpers import JsonResultReader
+from util.metrics import get_metrics
+from util.top_k import TopK
+
+
+# streams the s3_objects of a listing file (json document or jsonl) keeping only the newest top_count,
+# so only those are ever built into S3Objects. returns (newest first, input count, listing metadata)
+def read_newest_s3_objects(readableFp, top_count: int | None) -> Tuple[List[S3Object], int, dict]:
+    with get_metrics().phase('read'):
+        reader = JsonResultReader(readableFp, 's3_objects')
+        top = TopK(top_count)
+        for dict_o in reader:
+            top.add(S3Object.sort_key_from_dict(dict_o), dict_o)
+        return [S3Object.from_dict(dict_o) for dict_o in top.result()], top.input_count, reader.metadata
@@ -0,0 +1,341 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+import json
+import os
+import threading
+import time
+from boto3.s3.transfer import TransferConfig
+from typing import Callable, Dict, Iterable, Iterator, Tuple, TypeVar
+from s3.s3_client import S3Bucket, S3Client, S3Object
+from s3.s3_client_router import S3ClientRouter
+from util.logging import get_default_logger
+from util.metrics import get_metrics
+from util.work_scheduler import WorkScheduler
+
+T = TypeVar('T')
+
+
+def format_byte_rate(bytes_per_second: float) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if bytes_per_second < 1024:
+            return f"{bytes_per_second:.1f} {unit}/s"
+        bytes_per_second /= 1024
+    return f"{bytes_per_second:.1f} TB/s"
+
+
+class TransferStats:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__started = time.monotonic()
+        self.__finished: float | None = None
+        self.file_count = 0
+        self.failed_count = 0
+        self.skipped_count = 0
+        self.byte_count = 0
+
+    def add_success(self, byte_count: int) -> None:
+        with self.__lock:
+            self.file_count += 1
+            self.byte_count += byte_count
+
+    def add_failure(self) -> None:
+        with self.__lock:
+            self.failed_count += 1
+
+    def add_skipped(self) -> None:
+        with self.__lock:
+            self.skipped_count += 1
+
+    def finish(self) -> None:
+        self.__finished = time.monotonic()
+
+    @property
+    def elapsed_s(self) -> float:
+        return (self.__finished if self.__finished is not None else time.monotonic()) - self.__started
+
+    @property
+    def bytes_per_second(self) -> float:
+        elapsed_s = self.elapsed_s
+        return self.byte_count / elapsed_s if 0 < elapsed_s else 0.0
+
+    def __str__(self) -> str:
+        return f"TransferStats[files={self.file_count},failed={self.failed_count},skipped={self.skipped_count},bytes={self.byte_count},elapsed={self.elapsed_s:.1f}s,rate={format_byte_rate(self.bytes_per_second)}]"
+
+
+def run_transfers(
+    items: Iterable[T],
+    max_workers: int,
+    max_attempts: int,
+    retry_delay_s: float,
+    describe: Callable[[T], str],
+    transfer: Callable[[T], int],
+    on_transferred: Callable[[T], None] | None = None,
+    skip: Callable[[T], bool] | None = None
+) -> TransferStats:
+    logger = get_default_logger()
+    stats = TransferStats()
+    callback_lock = threading.Lock()
+    # bound the items waiting on a worker so a lazily produced listing/walk stays lazy
+    in_flight = threading.BoundedSemaphore(max_workers * 2)
+
+    def transfer_with_retry(item: T) -> None:
+        try:
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    byte_count = transfer(item)
+                    break
+                except Exception:
+                    if attempt == max_attempts:
+                        logger.exception(f"Failed {describe(item)} after {attempt} attempts")
+                        stats.add_failure()
+                        return
+                    logger.warning(f"Failed {describe(item)} (attempt {attempt}/{max_attempts}), retrying")
+                    time.sleep(retry_delay_s * (2 ** (attempt - 1)))
+            if on_transferred is not None:
+                # an item whose bookkeeping (the sync manifest) was not recorded is not complete
+                try:
+                    with callback_lock:
+                        on_transferred(item)
+                except Exception:
+                    logger.exception(f"Failed recording {describe(item)}")
+                    stats.add_failure()
+                    return
+            stats.add_success(byte_count)
+            logger.debug(f"Completed {describe(item)}")
+        finally:
+            in_flight.release()
+
+    with get_metrics().phase('transfer'), WorkScheduler(max_workers) as scheduler:
+        for item in items:
+            if skip is not None and skip(item):
+                stats.add_skipped()
+                logger.debug(f"Skipped unchanged {describe(item)}")
+                continue
+            in_flight.acquire()
+            scheduler.submit(describe(item), lambda item=item: transfer_with_retry(item))
+        scheduler.wait()
+    stats.finish()
+    return stats
+
+
+# sidecar jsonl in a download directory: one {path, etag, size, modified} line per downloaded file,
+# later lines superseding earlier ones, so an interrupted sync keeps what it already transferred
+class SyncManifest:
+    FILENAME = '.s3-sync-manifest.jsonl'
+
+    def __init__(self, dirpath: str) -> None:
+        self.dirpath = dirpath if 0 < len(dirpath) else '.'
+        self.filepath = os.path.join(dirpath, SyncManifest.FILENAME)
+        self.__lock = threading.Lock()
+        self.__entries: Dict[str, dict] = {}
+        if os.path.isfile(self.filepath):
+            with open(self.filepath, 'r') as inF:
+                for line in inF:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.__entries[entry['path']] = entry
+        os.makedirs(self.dirpath, exist_ok=True)
+        # compact superseded lines away before appending this run's
+        with open(self.filepath, 'w') as of:
+            for entry in self.__entries.values():
+                of.write(json.dumps(entry) + '\n')
+        self.__fp = open(self.filepath, 'a')
+        get_default_logger().debug(f"Loaded {len(self.__entries)} entries from {self.filepath}")
+
+    def __relative_path(self, filepath: str) -> str:
+        return os.path.relpath(filepath, self.dirpath).replace(os.sep, '/')
+
+    def is_unchanged(self, s3_object: S3Object, filepath: str) -> bool:
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return False
+        if stat.st_size != s3_object.size or int(stat.st_mtime) != s3_object.modified_epoch:
+            return False
+        entry = self.__entries.get(self.__relative_path(filepath))
+        if entry is None or s3_object.etag is None:
+            return True
+        return entry['etag'] == s3_object.etag
+
+    def record(self, s3_object: S3Object, filepath: str) -> None:
+        entry = {'path': self.__relative_path(filepath), 'etag': s3_object.etag, 'size': s3_object.size, 'modified': s3_object.modified_epoch}
+        with self.__lock:
+            self.__entries[entry['path']] = entry
+            self.__fp.write(json.dumps(entry) + '\n')
+            self.__fp.flush()
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__fp.close()
+
+
+class RangedDownloader:
+    # fetches one object as concurrent byte-range GETs written in place into a preallocated file.
+    # the part pool is shared by every object being downloaded, bounding connections overall
+    def __init__(self, part_size: int, max_workers: int = 10, max_attempts: int = 3, retry_delay_s: float = 0.5, read_size: int = 1024 * 1024) -> None:
+        self.part_size = max(1, part_size)
+        self.__max_attempts = max(1, max_attempts)
+        self.__retry_delay_s = retry_delay_s
+        self.__read_size = read_size
+        self.__executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='aws-tools-part')
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True)
+
+    def __write_part(self, s3_client: S3Client, s3_object: S3Object, part_filepath: str, fd: int|None, offset: int, byte_count: int) -> str:
+        response = s3_client.get_object_range(s3_object.bucket.name, s3_object.key, offset, offset + byte_count - 1, s3_object.etag)
+        if response['ContentLength'] != byte_count:
+            raise IOError(f"expected {byte_count} bytes at {offset} of {s3_object.fully_qualified_name}, got {response['ContentLength']}")
+        body = response['Body']
+        fp = open(part_filepath, 'r+b') if fd is None else None
+        try:
+            if fp is not None:
+                fp.seek(offset)
+            position = offset
+            for chunk in body.iter_chunks(self.__read_size):
+                if fd is not None:
+                    os.pwrite(fd, chunk, position)
+                else:
+                    fp.write(chunk)
+                position += len(chunk)
+        finally:
+            body.close()
+            if fp is not None:
+                fp.close()
+        if position != offset + byte_count:
+            raise IOError(f"received {position - offset}/{byte_count} bytes at {offset} of {s3_object.fully_qualified_name}")
+        return response['ETag'].strip('"')
+
+    def __download_part(self, s3_client: S3Client, s3_object: S3Object, part_filepath: str, fd: int|None, offset: int, byte_count: int) -> str:
+        logger = get_default_logger()
+        for attempt in range(1, self.__max_attempts + 1):
+            try:
+                return self.__write_part(s3_client, s3_object, part_filepath, fd, offset, byte_count)
+            except Exception:
+                if attempt == self.__max_attempts:
+                    raise
+                logger.warning(f"Failed bytes {offset}-{offset + byte_count - 1} of {s3_object.fully_qualified_name} (attempt {attempt}/{self.__max_attempts}), retrying")
+                time.sleep(self.__retry_delay_s * (2 ** (attempt - 1)))
+
+    def download(self, s3_client: S3Client, s3_object: S3Object, output_filepath: str) -> int:
+        part_filepath = f"{output_filepath}.part"
+        with open(part_filepath, 'wb') as fp:
+            fp.truncate(s3_object.size)
+        # os.pwrite lets every part share one descriptor; without it each part seeks its own handle
+        fd = os.open(part_filepath, os.O_RDWR | getattr(os, 'O_BINARY', 0)) if hasattr(os, 'pwrite') else None
+        try:
+            try:
+                if fd is not None and hasattr(os, 'posix_fallocate') and 0 < s3_object.size:
+                    os.posix_fallocate(fd, 0, s3_object.size)
+                futures = [
+                    self.__executor.submit(self.__download_part, s3_client, s3_object, part_filepath, fd, offset, min(self.part_size, s3_object.size - offset))
+                    for offset in range(0, s3_object.size, self.part_size)
+                ]
+                done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in not_done:
+                    future.cancel()
+                wait(not_done)
+                for future in done:
+                    if future.exception() is not None:
+                        raise future.exception()
+                etags = set([future.result() for future in futures])
+            finally:
+                if fd is not None:
+                    os.close(fd)
+            if os.path.getsize(part_filepath) != s3_object.size or 1 < len(etags) or (s3_object.etag is not None and etags != set([s3_object.etag])):
+                raise IOError(f"ranged download of {s3_object.fully_qualified_name} does not match size {s3_object.size} and ETag {s3_object.etag} (got {etags})")
+        except Exception:
+            os.remove(part_filepath)
+            raise
+        os.replace(part_filepath, output_filepath)
+        get_default_logger().debug(f"Downloaded {s3_object.fully_qualified_name} as {len(futures)} ranges of {self.part_size} bytes")
+        return s3_object.size
+
+
+class S3Downloader:
+    # given a router, each object is fetched by the client for its bucket's region. given a sync
+    # manifest, objects whose local file matches on size, LastModified and ETag are skipped
+    # objects of at least ranged_threshold bytes are fetched by the ranged downloader, when given
+    def __init__(self, s3_client: S3Client|S3ClientRouter, max_workers: int = 10, max_attempts: int = 3, retry_delay_s: float = 0.5, sync_manifest: SyncManifest|None = None, ranged_downloader: RangedDownloader|None = None, ranged_threshold: int|None = None) -> None:
+        self.__client_for: Callable[[S3Bucket], S3Client] = s3_client.for_bucket if isinstance(s3_client, S3ClientRouter) else (lambda s3_bucket: s3_client)
+        self.__max_workers = max(1, max_workers)
+        self.__max_attempts = max(1, max_attempts)
+        self.__retry_delay_s = retry_delay_s
+        self.__sync_manifest = sync_manifest
+        self.__ranged_downloader = ranged_downloader
+        self.__ranged_threshold = ranged_threshold if ranged_threshold is not None else (ranged_downloader.part_size * 2 if ranged_downloader is not None else None)
+
+    def download(self, downloads: Iterable[Tuple[S3Object, str]], on_downloaded: Callable[[S3Object, str], None] | None = None, on_skipped: Callable[[S3Object, str], None] | None = None) -> TransferStats:
+        def skip(download: Tuple[S3Object, str]) -> bool:
+            if not(self.__sync_manifest.is_unchanged(*download)):
+                return False
+            if on_skipped is not None:
+                on_skipped(*download)
+            return True
+
+        stats = run_transfers(
+            downloads,
+            self.__max_workers,
+            self.__max_attempts,
+            self.__retry_delay_s,
+            lambda download: f"download {download[0].fully_qualified_name} to {download[1]}",
+            lambda download: self.__download(*download),
+            (lambda download: on_downloaded(*download)) if on_downloaded is not None else None,
+            skip if self.__sync_manifest is not None else None
+        )
+        get_default_logger().info(f"Download {stats}")
+        return stats
+
+    def __download(self, s3_object: S3Object, output_filepath: str) -> int:
+        output_dirpath = os.path.dirname(output_filepath)
+        if 0 < len(output_dirpath):
+            os.makedirs(output_dirpath, exist_ok=True)
+        s3_client = self.__client_for(s3_object.bucket)
+        # an empty object has no byte range to plan, so it always takes the single GET
+        if self.__ranged_downloader is not None and 0 < s3_object.size and self.__ranged_threshold <= s3_object.size:
+            self.__ranged_downloader.download(s3_client, s3_object, output_filepath)
+        else:
+            s3_client.get_object_to_file(s3_object.bucket.name, s3_object.name, output_filepath)
+        if self.__sync_manifest is not None:
+            # stamp the file with LastModified so the next sync can compare without a request
+            os.utime(output_filepath, (s3_object.modified_epoch, s3_object.modified_epoch))
+            self.__sync_manifest.record(s3_object, output_filepath)
+        return s3_object.size
+
+
+def iter_directory_files(input_directory: str, key_prefix: str = '') -> Iterator[Tuple[str, str]]:
+    for dirpath, dirnames, filenames in os.walk(input_directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            input_filepath = os.path.join(dirpath, filename)
+            if not(os.path.isfile(input_filepath)):
+                continue
+            relative_path = os.path.relpath(input_filepath, input_directory).replace(os.sep, '/')
+            yield (input_filepath, f"{key_prefix}{relative_path}")
+
+
+class S3Uploader:
+    def __init__(self, s3_client: S3Client, transfer_config: TransferConfig | None = None, max_workers: int = 10, max_attempts: int = 3, retry_delay_s: float = 0.5) -> None:
+        self.__s3_client = s3_client
+        self.__transfer_config = transfer_config
+        self.__max_workers = max(1, max_workers)
+        self.__max_attempts = max(1, max_attempts)
+        self.__retry_delay_s = retry_delay_s
+
+    def upload(self, bucket: str, uploads: Iterable[Tuple[str, str]], on_uploaded: Callable[[str, str], None] | None = None) -> TransferStats:
+        stats = run_transfers(
+            uploads,
+            self.__max_workers,
+            self.__max_attempts,
+            self.__retry_delay_s,
+            lambda upload: f"upload {upload[0]} to {bucket}/{upload[1]}",
+            lambda upload: self.__upload(bucket, *upload),
+            (lambda upload: on_uploaded(*upload)) if on_uploaded is not None else None
+        )
+        get_default_logger().info(f"Upload {stats}")
+        return stats
+
+    def __upload(self, bucket: str, input_filepath: str, key: str) -> int:
+        self.__s3_client.put_object_from_file(bucket, key, input_filepath, self.__transfer_config)
+        return os.path.getsize(input_filepath)
@@ -0,0 +1,171 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+from typing import Callable, Iterator, List, Tuple
+from util.logging import get_default_logger
+
+# (key_prefix, start_after, delimiter) -> list_objects_v2 response pages, in key order
+PageChain = Callable[[str, str | None, str | None], Iterator[dict]]
+Shard = Callable[[], Iterator[dict]]
+# about a page: a level with more loose keys than this is listed unsharded
+DISCOVERY_MAX_LOOSE_KEYS = 1000
+
+
+def _prefix_shard(page_chain: PageChain, key_prefix: str) -> Shard:
+    return lambda: page_chain(key_prefix, None, None)
+
+
+def _contents_shard(contents: List[dict]) -> Shard:
+    return lambda: iter([{'Contents': contents, 'KeyCount': len(contents)}])
+
+
+def _range_shard(page_chain: PageChain, key_prefix: str, start_after: str | None, end_at: str | None) -> Shard:
+    def iter_range() -> Iterator[dict]:
+        for page in page_chain(key_prefix, start_after, None):
+            contents = page.get('Contents', [])
+            if end_at is not None and 0 < len(contents) and end_at < contents[-1]['Key']:
+                contents = [content for content in contents if content['Key'] <= end_at]
+                yield {**page, 'Contents': contents, 'KeyCount': len(contents)}
+                return
+            yield page
+    return iter_range
+
+
+def _discover(page_chain: PageChain, key_prefix: str, delimiter: str, max_loose_keys: int) -> List[Tuple[str, Shard | None, dict | None]] | None:
+    # returns (sort-key, prefix shard, loose content) in key order; a loose key sorts before/after
+    # a whole common-prefix block exactly as it sorts against the common prefix itself. a level
+    # holding more than max_loose_keys loose keys is not partitioned (None): it is paged as it is
+    # rather than held in memory, so discovery never reads more than a page of its loose keys
+    entries: List[Tuple[str, Shard | None, dict | None]] = []
+    loose_count = 0
+    for page in page_chain(key_prefix, None, delimiter):
+        contents = page.get('Contents', [])
+        loose_count += len(contents)
+        if max_loose_keys < loose_count:
+            return None
+        for content in contents:
+            entries.append((content['Key'], None, content))
+        for common_prefix in page.get('CommonPrefixes', []):
+            entries.append((common_prefix['Prefix'], _prefix_shard(page_chain, common_prefix['Prefix']), None))
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def _resume_entry(page_chain: PageChain, entry: Tuple[str, Shard | None, dict | None], start_after: str) -> Tuple[str, Shard | None, dict | None] | None:
+    sort_key, _, content = entry
+    if start_after < sort_key:
+        return entry
+    if content is None and start_after.startswith(sort_key):
+        # the listing stopped inside this common prefix
+        return (sort_key, _range_shard(page_chain, sort_key, start_after, None), None)
+    return None
+
+
+def discover_shards(page_chain: PageChain, key_prefix: str, target_shard_count: int, delimiter: str = '/', max_depth: int = 3, start_after: str | None = None, max_loose_keys: int = DISCOVERY_MAX_LOOSE_KEYS) -> List[Shard]:
+    entries = _discover(page_chain, key_prefix, delimiter, max_loose_keys)
+    if entries is None:
+        get_default_logger().debug(f"prefix '{key_prefix}' holds more than {max_loose_keys} loose keys, listing it unsharded")
+        return [_range_shard(page_chain, key_prefix, start_after, None)]
+    # common prefixes made mostly of loose keys, left to page unsharded
+    unsharded = set()
+    depth = 1
+    # descend into common prefixes until there are enough partitions to keep every worker busy
+    while depth < max_depth and len(entries) < target_shard_count and any(entry[1] is not None and entry[0] not in unsharded for entry in entries):
+        expanded: List[Tuple[str, Shard | None, dict | None]] = []
+        for entry in entries:
+            if entry[1] is None or entry[0] in unsharded:
+                expanded.append(entry)
+                continue
+            discovered = _discover(page_chain, entry[0], delimiter, max_loose_keys)
+            if discovered is None:
+                unsharded.add(entry[0])
+                expanded.append(entry)
+            else:
+                expanded.extend(discovered)
+        entries = expanded
+        depth += 1
+    if start_after is not None:
+        entries = [entry for entry in [_resume_entry(page_chain, entry, start_after) for entry in entries] if entry is not None]
+
+    shards: List[Shard] = []
+    loose_contents: List[dict] = []
+    for _, prefix_shard, content in entries:
+        if content is not None:
+            loose_contents.append(content)
+            continue
+        if 0 < len(loose_contents):
+            shards.append(_contents_shard(loose_contents))
+            loose_contents = []
+        shards.append(prefix_shard)
+    if 0 < len(loose_contents):
+        shards.append(_contents_shard(loose_contents))
+    return shards
+
+
+def split_point_shards(page_chain: PageChain, key_prefix: str, split_points: List[str], start_after: str | None = None) -> List[Shard]:
+    # partition i holds keys k where split_points[i-1] < k <= split_points[i]
+    bounds = [start_after] + sorted(set([split_point for split_point in split_points if start_after is None or start_after < split_point])) + [None]
+    return [_range_shard(page_chain, key_prefix, bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+
+def iter_sharded_pages(shards: List[Shard], max_workers: int, max_buffered_pages: int = 4) -> Iterator[dict]:
+    # shards are contiguous, ordered key ranges: up to max_workers are paginated at once while
+    # their pages are yielded in shard order, so the merged stream stays lexicographically ordered
+    stop = threading.Event()
+    pending: deque = deque()
+    shard_iter = iter(shards)
+
+    def put(page_queue: queue.Queue, item: Tuple[str, object]) -> bool:
+        while not(stop.is_set()):
+            try:
+                page_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(shard: Shard, page_queue: queue.Queue) -> None:
+        try:
+            for page in shard():
+                if not(put(page_queue, ('page', page))):
+                    return
+            put(page_queue, ('done', None))
+        except Exception as e:
+            put(page_queue, ('error', e))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='aws-tools-shard') as executor:
+        def start_next() -> None:
+            shard = next(shard_iter, None)
+            if shard is not None:
+                page_queue = queue.Queue(maxsize=max_buffered_pages)
+                executor.submit(produce, shard, page_queue)
+                pending.append(page_queue)
+
+        try:
+            for _ in range(max(1, max_workers)):
+                start_next()
+            while 0 < len(pending):
+                page_queue = pending[0]
+                while True:
+                    kind, value = page_queue.get()
+                    if kind == 'page':
+                        yield value
+                    elif kind == 'done':
+                        break
+                    else:
+                        raise value
+                pending.popleft()
+                start_next()
+        finally:
+            stop.set()
+
+
+def iter_object_pages_sharded(page_chain: PageChain, key_prefix: str, max_workers: int, split_points: List[str] | None = None, start_after: str | None = None) -> Iterator[dict]:
+    logger = get_default_logger()
+    if split_points is not None and 0 < len(split_points):
+        shards = split_point_shards(page_chain, key_prefix, split_points, start_after)
+    else:
+        shards = discover_shards(page_chain, key_prefix, max_workers, start_after=start_after)
+    logger.debug(f"listing prefix '{key_prefix}' as {len(shards)} shards across {max_workers} workers")
+    yield from iter_sharded_pages(shards, max_workers)
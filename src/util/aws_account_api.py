@@ -1,7 +1,15 @@
 import boto3
-from attrs import define
-from typing import Callable, List
+from botocore.credentials import RefreshableCredentials
+from attrs import define, field
+from datetime import datetime, timedelta, timezone
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Tuple
 from util.logging import get_default_logger
+from util.metrics import get_metrics
+from util.work_scheduler import WorkFailure, WorkScheduler
 
 @define(auto_attribs=True)
 class AwsAccount:
@@ -13,52 +21,154 @@ class AwsAccount:
 class BotoSessionAwsAccount:
     aws_account: AwsAccount
     boto_session: boto3.session.Session
+    # every region of a profile shares one boto3 session, which is not thread-safe
+    client_lock: threading.RLock = field(factory=threading.RLock, eq=False, repr=False)
+
+    def client(self, service_name: str, **kwargs):
+        with self.client_lock:
+            return self.boto_session.client(service_name, **kwargs)
+
+
+# assumed-role credentials kept on disk, one file per profile and role, so later runs skip AssumeRole
+# until the credentials are within REFRESH_MARGIN of expiring. the margin is wider than botocore's
+# 15 minute advisory refresh, so a refresh is never handed back credentials already due for one
+class AssumedRoleCache:
+    REFRESH_MARGIN = timedelta(minutes=20)
+    FIELDS = ('AccessKeyId', 'SecretAccessKey', 'SessionToken', 'Expiration', 'AssumedRoleArn')
+
+    def __init__(self, dirpath: str) -> None:
+        self.__dirpath = dirpath
+        os.makedirs(dirpath, mode=0o700, exist_ok=True)
+
+    def __filepath(self, profile: str, roleArn: str) -> str:
+        return os.path.join(self.__dirpath, f"{hashlib.sha1(f'{profile}|{roleArn}'.encode()).hexdigest()}.json")
+
+    # any entry that can't be read as credentials is a miss, answered by AssumeRole and overwritten
+    def load(self, profile: str, roleArn: str) -> dict|None:
+        filepath = self.__filepath(profile, roleArn)
+        try:
+            with open(filepath, 'r') as inF:
+                cached = json.load(inF)
+            if not(all(isinstance(cached.get(name), str) for name in self.FIELDS)):
+                raise ValueError(f"missing one of {self.FIELDS}")
+            expiring = datetime.fromisoformat(cached['Expiration']) - self.REFRESH_MARGIN <= datetime.now(timezone.utc)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            get_default_logger().debug(f"Ignoring unreadable assumed role cache {filepath}: {e}")
+            return None
+        return None if expiring else cached
+
+    def save(self, profile: str, roleArn: str, assumed_role: dict) -> dict:
+        cached = {
+            'AccessKeyId': assumed_role['Credentials']['AccessKeyId'],
+            'SecretAccessKey': assumed_role['Credentials']['SecretAccessKey'],
+            'SessionToken': assumed_role['Credentials']['SessionToken'],
+            'Expiration': assumed_role['Credentials']['Expiration'].isoformat(),
+            'AssumedRoleArn': assumed_role['AssumedRoleUser']['Arn'],
+        }
+        filepath = self.__filepath(profile, roleArn)
+        # written whole under another name then moved into place; readable by the owner alone
+        fd = os.open(f"{filepath}.tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as of:
+            json.dump(cached, of)
+        os.replace(f"{filepath}.tmp", filepath)
+        return cached
+
+
+# one session and identity per profile and role for the life of the process, shared by every region.
+# the lock also guards creating clients from the shared sessions
+_profile_sessions: Dict[str, boto3.session.Session] = {}
+_sessions: Dict[Tuple[str, str|None], BotoSessionAwsAccount] = {}
+_sessions_lock = threading.RLock()
+_assumed_role_cache: AssumedRoleCache|None = None
+
+
+def enable_assumed_role_cache(dirpath: str) -> AssumedRoleCache:
+    global _assumed_role_cache
+    _assumed_role_cache = AssumedRoleCache(dirpath)
+    return _assumed_role_cache
+
+
+def _get_profile_session(profile: str) -> boto3.session.Session:
+    with _sessions_lock:
+        boto_session = _profile_sessions.get(profile)
+        if boto_session is None:
+            boto_session = _profile_sessions.setdefault(profile, boto3.session.Session(profile_name=profile))
+        return boto_session
 
 
 def get_profile_region(profile: str) -> str:
-    return boto3.session.Session(profile_name=profile).region_name
+    return _get_profile_session(profile).region_name
 
 
 def get_boto_session_aws_account(profile: str, region: str|None = None, roleArn: str|None = None) -> BotoSessionAwsAccount:
+    with get_metrics().phase('auth'):
+        return _get_boto_session_aws_account(profile, region, roleArn)
+
+
+def _assume_role(profile: str, roleArn: str, name: str) -> dict:
+    if _assumed_role_cache is not None:
+        cached = _assumed_role_cache.load(profile, roleArn)
+        if cached is not None:
+            get_default_logger().debug(f"Using cached credentials of {roleArn}")
+            return cached
+    sts_client = _get_profile_session(profile).client('sts')
+    get_metrics().instrument(sts_client)
+    assumed_role = sts_client.assume_role(RoleArn=roleArn,RoleSessionName=name)
+    if _assumed_role_cache is not None:
+        return _assumed_role_cache.save(profile, roleArn, assumed_role)
+    return {**assumed_role['Credentials'], 'Expiration': assumed_role['Credentials']['Expiration'].isoformat(), 'AssumedRoleArn': assumed_role['AssumedRoleUser']['Arn']}
+
+
+def _credential_metadata(credentials: dict) -> dict:
+    return {
+        'access_key': credentials['AccessKeyId'],
+        'secret_key': credentials['SecretAccessKey'],
+        'token': credentials['SessionToken'],
+        'expiry_time': credentials['Expiration'],
+    }
+
+
+def _get_shared_session(profile: str, roleArn: str|None) -> BotoSessionAwsAccount:
     logger = get_default_logger()
+    name = f"{profile}" if roleArn is None else f"{profile}.{roleArn.split(':')[-1]}"
     try:
-        if region is None and roleArn is None:
-            name = f"{profile}"
-            boto_session = boto3.session.Session(profile_name=profile)
-        elif roleArn is None:
-            name = f"{profile}.{region}"
-            boto_session = boto3.session.Session(profile_name=profile, region_name=region)
-        elif region is None:
-            name = f"{profile}.{roleArn.split(':')[-1]}"
-            assumed_role = boto3.client('sts').assume_role(RoleArn=roleArn,RoleSessionName=name)
-            boto_session = boto3.session.Session(
-                profile_name=profile,
-                aws_access_key_id=assumed_role['Credentials']["AccessKeyId"],
-                aws_secret_access_key=assumed_role['Credentials'],
-                aws_session_token=assumed_role['Credentials'],
-            )
+        if roleArn is None:
+            boto_session = _get_profile_session(profile)
+            sts_client = boto_session.client('sts')
+            get_metrics().instrument(sts_client)
+            account_id = sts_client.get_caller_identity()['Account']
         else:
-            name = f"{profile}.{region}.{roleArn.split(':')[-1]}"
-            assumed_role = boto3.client('sts').assume_role(RoleArn=roleArn,RoleSessionName=name)
-            boto_session = boto3.session.Session(
-                profile_name=profile,
-                region_name=region,
-                aws_access_key_id=assumed_role['Credentials']["AccessKeyId"],
-                aws_secret_access_key=assumed_role['Credentials'],
-                aws_session_token=assumed_role['Credentials'],
+            # the assumed role's arn names its account, so no caller identity lookup is needed
+            credentials = _assume_role(profile, roleArn, name.replace('/', '.'))
+            boto_session = boto3.session.Session(profile_name=profile)
+            # the session outlives the role's credentials: botocore assumes the role again (through the
+            # cache) ahead of their expiry, for every client made from the session
+            boto_session._session._credentials = RefreshableCredentials.create_from_metadata(
+                metadata=_credential_metadata(credentials),
+                refresh_using=lambda: _credential_metadata(_assume_role(profile, roleArn, name.replace('/', '.'))),
+                method='assume-role',
             )
+            account_id = credentials['AssumedRoleArn'].split(':')[4]
     except Exception:
         logger.exception(f"Unable to obtain boto session account. {name}")
         raise
-
-    try:
-        sts_account_dict = boto_session.client('sts').get_caller_identity()
-        aws_account = AwsAccount(name=name, region=boto_session.region_name, id=sts_account_dict['Account'])
-    except Exception:
-        logger.exception(f"Unable to obtain sts caller identity. {name}")
-        raise
     logger.debug(f"Obtained boto AWS session {name}")
-    return BotoSessionAwsAccount(aws_account=aws_account, boto_session=boto_session)
+    return BotoSessionAwsAccount(aws_account=AwsAccount(name=name, region=boto_session.region_name, id=account_id), boto_session=boto_session, client_lock=_sessions_lock)
+
+
+def _get_boto_session_aws_account(profile: str, region: str|None = None, roleArn: str|None = None) -> BotoSessionAwsAccount:
+    key = (profile, roleArn)
+    with _sessions_lock:
+        shared = _sessions.get(key)
+        if shared is None:
+            shared = _sessions.setdefault(key, _get_shared_session(profile, roleArn))
+    if region is None:
+        return shared
+    role_name = f".{roleArn.split(':')[-1]}" if roleArn is not None else ''
+    aws_account = AwsAccount(name=f"{profile}.{region}{role_name}", region=region, id=shared.aws_account.id)
+    return BotoSessionAwsAccount(aws_account=aws_account, boto_session=shared.boto_session, client_lock=shared.client_lock)
 
 
 def call_for_each_region(callback: Callable[[BotoSessionAwsAccount], None], regions: List[str], profile: str, roleArn: str|None = None):
@@ -73,3 +183,13 @@ def call_for_each_region(callback: Callable[[BotoSessionAwsAccount], None], regi
         except Exception:
             logger.exception(f"Failed calling callback. {profile}, {region}, {roleArn}")
             return
+
+
+def call_for_each_region_concurrently(callback: Callable[[BotoSessionAwsAccount], None], regions: List[str], profile: str, scheduler: WorkScheduler, roleArn: str|None = None) -> List[WorkFailure]:
+    def call_for_region(region: str) -> None:
+        boto_session_account = get_boto_session_aws_account(profile, region, roleArn)
+        callback(boto_session_account)
+
+    for region in regions:
+        scheduler.submit(f"region {region} ({profile}, {roleArn})", lambda region=region: call_for_region(region))
+    return scheduler.wait()
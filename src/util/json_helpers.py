@@ -1,9 +1,14 @@
 from datetime import datetime
 import json
+import threading
+import time
+from util.metrics import get_metrics
 
 def to_dict_value(o):
     if isinstance(o, datetime):
         return o.isoformat()
+    if hasattr(o, 'to_dict'):
+        return o.to_dict()
     return o.__dict__
 
 def json_dumps(o):
@@ -17,4 +22,192 @@ def json_loads(s):
     return json.loads(s)
 
 def json_load(readableFp):
-    return json.load(readableFp)
\ No newline at end of file
+    return json.load(readableFp)
+
+def json_dumps_line(o):
+    return json.dumps(o, default=to_dict_value, separators=(',', ':'))
+
+
+# json: one indented {'datetime','args','result'} document written by finish(), results sorted newest first.
+# jsonl: a {'header'} record, then one compact record per result as it is added, then a {'footer'} record.
+class JsonResultWriter:
+    def __init__(self, filepath: str, output_format: str, result_name: str, args: dict, sort_reverse: bool = True):
+        self.filepath = filepath
+        self.output_format = output_format
+        self.output_count = 0
+        self.__result_name = result_name
+        self.__args = args
+        self.__sort_reverse = sort_reverse
+        self.__datetime = datetime.now().isoformat()
+        self.__lock = threading.Lock()
+        self.__results = []
+        self.__fp = None
+        self.__metrics = get_metrics()
+
+    def __enter__(self) -> "JsonResultWriter":
+        if self.output_format == 'jsonl':
+            self.__fp = open(self.filepath, 'w')
+            self.__fp.write(json_dumps_line({'header': {'datetime': self.__datetime, 'args': self.__args}}) + '\n')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.__fp is not None:
+            self.__fp.close()
+            self.__fp = None
+
+    def add(self, o) -> None:
+        with self.__lock:
+            self.output_count += 1
+            if self.__fp is not None:
+                started = time.perf_counter()
+                self.__fp.write(json_dumps_line(o) + '\n')
+                if self.__metrics.enabled:
+                    self.__metrics.add_phase('serialize', time.perf_counter() - started)
+            else:
+                self.__results.append(o)
+
+    def finish(self, result_extras: dict | None = None) -> None:
+        result_extras = result_extras if result_extras is not None else {}
+        with self.__lock:
+            if self.__fp is not None:
+                self.__fp.write(json_dumps_line({'footer': {'output_count': self.output_count, **result_extras}}) + '\n')
+                self.__fp.close()
+                self.__fp = None
+                return
+            with self.__metrics.phase('sort'):
+                self.__results.sort(reverse=self.__sort_reverse)
+            with self.__metrics.phase('serialize'), open(self.filepath, 'w') as of:
+                json_dump({
+                    'datetime': self.__datetime,
+                    'args': self.__args,
+                    'result': {
+                        'output_count': self.output_count,
+                        **result_extras,
+                        self.__result_name: self.__results
+                    }
+                }, of)
+
+
+# incrementally reads the result list out of a JsonResultWriter json document (or a bare json list,
+# or jsonl records) without loading the whole file. top-level/result scalars land in metadata.
+class JsonResultReader:
+    def __init__(self, readableFp, result_name: str, chunk_size: int = 1024 * 1024):
+        self.metadata = {}
+        self.__fp = readableFp
+        self.__result_name = result_name
+        self.__chunk_size = chunk_size
+        self.__decoder = json.JSONDecoder()
+        self.__buffer = ''
+        self.__pos = 0
+        self.__eof = False
+        self.__found = False
+
+    def __iter__(self):
+        first_line = self.__fp.readline()
+        try:
+            record = json.loads(first_line)
+        except json.JSONDecodeError:
+            record = None
+        if isinstance(record, dict) and 'header' in record:
+            self.metadata.update(record['header'])
+            yield from self.__iter_records()
+            return
+        if isinstance(record, dict) and 'bucket' in record:
+            yield record
+            yield from self.__iter_records()
+            return
+        self.__buffer = first_line
+        c = self.__peek()
+        if c == '[':
+            yield from self.__iter_array()
+        elif c == '{':
+            yield from self.__iter_object()
+        if not(self.__found):
+            raise TypeError(f"No {self.__result_name} list found")
+
+    def __iter_records(self):
+        self.__found = True
+        for line in self.__fp:
+            line = line.strip()
+            if 0 == len(line):
+                continue
+            record = json.loads(line)
+            if 'header' in record:
+                self.metadata.update(record['header'])
+            elif 'footer' in record:
+                self.metadata.update(record['footer'])
+            else:
+                yield record
+
+    def __fill(self) -> bool:
+        chunk = self.__fp.read(self.__chunk_size)
+        if 0 == len(chunk):
+            self.__eof = True
+            return False
+        self.__buffer = self.__buffer[self.__pos:] + chunk
+        self.__pos = 0
+        return True
+
+    def __peek(self) -> str:
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos].isspace():
+                self.__pos += 1
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not(self.__fill()):
+                return ''
+
+    def __expect(self, c: str) -> None:
+        if self.__peek() != c:
+            raise json.JSONDecodeError(f"Expecting '{c}'", self.__buffer, self.__pos)
+        self.__pos += 1
+
+    def __decode_value(self):
+        self.__peek()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__buffer, self.__pos)
+                # a number ending the buffer may continue in the next chunk
+                if end < len(self.__buffer) or self.__eof or not(self.__fill()):
+                    self.__pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.__eof or not(self.__fill()):
+                    raise
+
+    def __iter_array(self):
+        self.__found = True
+        self.__expect('[')
+        if self.__peek() == ']':
+            self.__pos += 1
+            return
+        while True:
+            yield self.__decode_value()
+            c = self.__peek()
+            self.__pos += 1
+            if c == ']':
+                return
+            if c != ',':
+                raise json.JSONDecodeError("Expecting ',' or ']'", self.__buffer, self.__pos - 1)
+
+    def __iter_object(self):
+        self.__expect('{')
+        if self.__peek() == '}':
+            self.__pos += 1
+            return
+        while True:
+            key = self.__decode_value()
+            self.__expect(':')
+            c = self.__peek()
+            if key == self.__result_name and c == '[':
+                yield from self.__iter_array()
+            elif key == 'result' and c == '{':
+                yield from self.__iter_object()
+            else:
+                self.metadata[key] = self.__decode_value()
+            c = self.__peek()
+            self.__pos += 1
+            if c == '}':
+                return
+            if c != ',':
+                raise json.JSONDecodeError("Expecting ',' or '}'", self.__buffer, self.__pos - 1)
@@ -0,0 +1,243 @@
+import atexit
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import math
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple, TypeVar
+from util.logging import get_default_logger
+
+# error codes S3 and STS answer with when a caller is being rate limited
+THROTTLE_ERROR_CODES = set(['Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled', 'RequestThrottledException', 'TooManyRequestsException', 'SlowDown', 'RequestLimitExceeded', 'ProvisionedThroughputExceededException'])
+_PERCENTILES = [50, 95, 99]
+
+T = TypeVar('T')
+
+
+class LatencyHistogram:
+    # log-scale buckets each 10% wider than the last, from 0.1ms: percentiles are exact to
+    # within that 10% whatever the number of samples, in constant memory
+    GROWTH = 1.1
+    MIN_MS = 0.1
+
+    def __init__(self) -> None:
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, latency_ms: float) -> None:
+        index = 0 if latency_ms <= self.MIN_MS else int(math.log(latency_ms / self.MIN_MS, self.GROWTH)) + 1
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def percentile(self, percent: float) -> float|None:
+        if 0 == self.count:
+            return None
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for index in sorted(self.counts.keys()):
+            seen += self.counts[index]
+            if rank <= seen:
+                # the upper bound of the bucket, never beyond the largest sample
+                return round(min(self.max_ms, self.MIN_MS * (self.GROWTH ** index)), 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3) if 0 < self.count else None,
+            **{f"p{percent}_ms": self.percentile(percent) for percent in _PERCENTILES},
+            'max_ms': round(self.max_ms, 3)
+        }
+
+
+class OperationMetrics:
+    def __init__(self) -> None:
+        self.request_count = 0
+        self.error_count = 0
+        self.retry_count = 0
+        self.throttle_count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = LatencyHistogram()
+
+    def to_dict(self) -> dict:
+        return {
+            'requests': self.request_count,
+            'errors': self.error_count,
+            'retries': self.retry_count,
+            'throttles': self.throttle_count,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'latency': self.latency.to_dict()
+        }
+
+
+class PhaseMetrics:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_s = 0.0
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'total_s': round(self.total_s, 3)}
+
+
+# process-wide record of every botocore call made by an instrumented client, by service, operation
+# and region, and of time spent in named phases. phases may nest and run on several threads at
+# once, so their totals can add up to more than the elapsed time. disabled, it records nothing
+class Metrics:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.__lock = threading.Lock()
+        self.__started = time.monotonic()
+        self.__operations: Dict[Tuple[str, str, str], OperationMetrics] = {}
+        self.__phases: Dict[str, PhaseMetrics] = {}
+        self.__counters: Dict[str, int] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def __operation(self, service: str, operation: str, region: str) -> OperationMetrics:
+        key = (service, operation, region)
+        operation_metrics = self.__operations.get(key)
+        if operation_metrics is None:
+            operation_metrics = self.__operations.setdefault(key, OperationMetrics())
+        return operation_metrics
+
+    def instrument(self, client) -> None:
+        if not(self.enabled):
+            return
+        # botocore names its events after the hyphenized service id and ends them with the operation
+        service = client.meta.service_model.service_id.hyphenize()
+        region = client.meta.region_name
+        events = client.meta.events
+        events.register(f"before-call.{service}", self.__before_call)
+        events.register(f"before-send.{service}", lambda **kwargs: self.__before_send(service, region, **kwargs))
+        # needs-retry stops at the first handler with an answer, so this one must come first and never answer
+        events.register_first(f"needs-retry.{service}", lambda **kwargs: self.__needs_retry(service, region, **kwargs))
+        events.register(f"after-call.{service}", lambda **kwargs: self.__after_call(service, region, **kwargs))
+        events.register(f"after-call-error.{service}", lambda **kwargs: self.__after_call_error(service, region, **kwargs))
+
+    @staticmethod
+    def __before_call(context: dict, **kwargs) -> None:
+        context['metrics_started'] = time.perf_counter()
+
+    def __before_send(self, service: str, region: str, request, event_name: str, **kwargs) -> None:
+        # once per attempt, so resent bodies count as bytes out again
+        byte_count = request.headers.get('Content-Length')
+        if byte_count is None:
+            return
+        with self.__lock:
+            self.__operation(service, event_name.rsplit('.', 1)[-1], region).bytes_out += int(byte_count)
+
+    def __needs_retry(self, service: str, region: str, response=None, operation=None, **kwargs) -> None:
+        if response is None or operation is None:
+            return None
+        http_response, parsed = response
+        code = parsed.get('Error', {}).get('Code') if isinstance(parsed, dict) else None
+        if code in THROTTLE_ERROR_CODES or http_response.status_code == 429:
+            with self.__lock:
+                self.__operation(service, operation.name, region).throttle_count += 1
+        return None
+
+    # error responses come through here too, before botocore raises them as ClientErrors;
+    # after-call-error is only for calls that got no response at all
+    def __after_call(self, service: str, region: str, http_response, parsed: dict, model, context: dict, **kwargs) -> None:
+        self.__record(service, model.name, region, context, parsed.get('ResponseMetadata', {}), http_response.headers.get('Content-Length'), 300 <= http_response.status_code)
+
+    def __after_call_error(self, service: str, region: str, exception, context: dict, event_name: str, **kwargs) -> None:
+        response = getattr(exception, 'response', None) or {}
+        self.__record(service, event_name.rsplit('.', 1)[-1], region, context, response.get('ResponseMetadata', {}), None, True)
+
+    def __record(self, service: str, operation: str, region: str, context: dict, response_metadata: dict, content_length: str|None, failed: bool) -> None:
+        started = context.get('metrics_started')
+        with self.__lock:
+            operation_metrics = self.__operation(service, operation, region)
+            operation_metrics.request_count += 1
+            operation_metrics.retry_count += response_metadata.get('RetryAttempts', 0)
+            if failed:
+                operation_metrics.error_count += 1
+            if content_length is not None:
+                operation_metrics.bytes_in += int(content_length)
+            if started is not None:
+                operation_metrics.latency.add((time.perf_counter() - started) * 1000)
+
+    def count(self, name: str, count: int = 1) -> None:
+        if not(self.enabled):
+            return
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + count
+
+    def add_phase(self, name: str, elapsed_s: float) -> None:
+        with self.__lock:
+            phase = self.__phases.get(name)
+            if phase is None:
+                phase = self.__phases.setdefault(name, PhaseMetrics())
+            phase.count += 1
+            phase.total_s += elapsed_s
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not(self.enabled):
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+
+    # times each step of iterable alone, leaving out whatever the consumer does with the items
+    def iter_phase(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        if not(self.enabled):
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_phase(name, time.perf_counter() - started)
+                return
+            self.add_phase(name, time.perf_counter() - started)
+            yield item
+
+    def to_dict(self) -> dict:
+        with self.__lock:
+            operations: List[dict] = [
+                {'service': service, 'operation': operation, 'region': region, **operation_metrics.to_dict()}
+                for (service, operation, region), operation_metrics in sorted(self.__operations.items())
+            ]
+            phases = {name: phase.to_dict() for name, phase in self.__phases.items()}
+            counters = dict(sorted(self.__counters.items()))
+        return {
+            'datetime': datetime.now().isoformat(),
+            'elapsed_s': round(time.monotonic() - self.__started, 3),
+            'phases': phases,
+            'counters': counters,
+            'operations': operations
+        }
+
+    def write(self, filepath: str) -> None:
+        with open(filepath, 'w') as of:
+            json.dump(self.to_dict(), of, indent=4)
+        get_default_logger().info(f"metrics written to {filepath}")
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+# records from here on, writing everything recorded to filepath as the process exits
+def enable_metrics(filepath: str) -> Metrics:
+    _metrics.enable()
+    atexit.register(_metrics.write, filepath)
+    return _metrics
@@ -0,0 +1,26 @@
+import heapq
+from typing import Any, Generic, List, TypeVar
+
+T = TypeVar('T')
+
+
+# keeps the count largest items by a precomputed sort key in a bounded min-heap;
+# count None keeps everything
+class TopK(Generic[T]):
+    def __init__(self, count: int | None):
+        self.count = count
+        self.input_count = 0
+        self.__heap: List[tuple] = []
+
+    def add(self, key: Any, item: T) -> None:
+        self.input_count += 1
+        if self.count is not None and self.count <= 0:
+            return
+        entry = (key, -self.input_count, item)
+        if self.count is None or len(self.__heap) < self.count:
+            heapq.heappush(self.__heap, entry)
+        elif self.__heap[0][0] < key:
+            heapq.heapreplace(self.__heap, entry)
+
+    def result(self) -> List[T]:
+        return [entry[2] for entry in sorted(self.__heap, key=lambda entry: entry[:2], reverse=True)]
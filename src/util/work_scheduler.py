@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import Callable, List
+from util.logging import get_default_logger
+
+
+class WorkFailure:
+    def __init__(self, name: str, exception: Exception):
+        self.name = name
+        self.exception = exception
+
+    def __str__(self) -> str:
+        return f"WorkFailure[name={self.name},exception={self.exception!r}]"
+
+
+# bounded thread pool where running work may submit more work (region -> bucket).
+# everything shares the one max_workers budget; wait() returns once all submitted work,
+# including work submitted by other work, has completed.
+class WorkScheduler:
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max(1, max_workers)
+        self.__executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='aws-tools')
+        self.__condition = threading.Condition()
+        self.__pending = 0
+        self.__failures: List[WorkFailure] = []
+
+    def __enter__(self) -> "WorkScheduler":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.shutdown()
+
+    def submit(self, name: str, work: Callable[[], None]) -> None:
+        with self.__condition:
+            self.__pending += 1
+        try:
+            self.__executor.submit(self.__run, name, work)
+        except Exception:
+            self.__complete()
+            raise
+
+    def wait(self) -> List[WorkFailure]:
+        with self.__condition:
+            while 0 < self.__pending:
+                self.__condition.wait()
+            return list(self.__failures)
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown(wait=True)
+
+    def __run(self, name: str, work: Callable[[], None]) -> None:
+        try:
+            work()
+        except Exception as e:
+            get_default_logger().exception(f"Failed {name}")
+            with self.__condition:
+                self.__failures.append(WorkFailure(name, e))
+        finally:
+            self.__complete()
+
+    def __complete(self) -> None:
+        with self.__condition:
+            self.__pending -= 1
+            if self.__pending == 0:
+                self.__condition.notify_all()